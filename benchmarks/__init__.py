@@ -0,0 +1 @@
+"""Performance benchmarks for spectrum_io, not part of the unit tests."""
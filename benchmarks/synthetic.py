@@ -0,0 +1,69 @@
+"""Generation of synthetic prediction batches in the layout accepted by the spectral library writers."""
+
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+AMINO_ACIDS = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+ION_TYPES = ["y", "b"]
+
+
+def fragment_annotations(n_fragments: int = 174) -> np.ndarray:
+    """
+    Create fragment annotations in Prosit order, i.e. y1+1, y1+2, y1+3, b1+1, ..., b29+3 for 174 fragments.
+
+    :param n_fragments: number of fragments, a multiple of 6
+    :return: array of annotations as bytes
+    """
+    annotations = [
+        f"{ion}{number}+{charge}".encode()
+        for number in range(1, n_fragments // 6 + 1)
+        for ion in ION_TYPES
+        for charge in range(1, 4)
+    ]
+    return np.array(annotations)
+
+
+def generate_batch(
+    n_peptides: int, n_fragments: int = 174, seed: int = 42
+) -> Tuple[Dict[str, np.ndarray], pd.DataFrame]:
+    """
+    Create a synthetic batch of predictions and the corresponding metadata.
+
+    About a third of the fragments are marked as impossible (m/z of -1) or have an intensity below the
+    default filter threshold, similar to real predictions. Every peptide is repeated for charges 2 and 3.
+
+    :param n_peptides: number of precursors in the batch
+    :param n_fragments: number of fragments per precursor
+    :param seed: seed of the random number generator
+    :return: data and metadata as accepted by SpectralLibrary.write
+    """
+    rng = np.random.default_rng(seed)
+    n_unique = max(n_peptides // 2, 1)
+    lengths = rng.integers(7, 30, n_unique)
+    sequences = np.array(["".join(rng.choice(AMINO_ACIDS, length)) for length in lengths])
+    sequences = np.repeat(sequences, 2)[:n_peptides]
+    charges = np.tile([2, 3], n_unique)[:n_peptides]
+
+    metadata = pd.DataFrame(
+        {
+            "SEQUENCE": sequences,
+            "MODIFIED_SEQUENCE": np.char.replace(sequences.astype(str), "C", "C[UNIMOD:4]"),
+            "PRECURSOR_CHARGE": charges,
+            "MASS": rng.uniform(600, 4000, n_peptides),
+            "COLLISION_ENERGY": np.full(n_peptides, 30.0),
+            "PROTEINS": [f"sp|P{i % 5000:05d}|PROT_HUMAN" for i in range(n_peptides)],
+        }
+    )
+
+    mz = rng.uniform(100, 2000, (n_peptides, n_fragments))
+    mz[rng.random((n_peptides, n_fragments)) < 0.3] = -1
+    intensities = rng.random((n_peptides, n_fragments)) ** 4
+    data = {
+        "intensities": intensities,
+        "mz": mz,
+        "annotation": np.tile(fragment_annotations(n_fragments), (n_peptides, 1)),
+        "irt": rng.uniform(-20, 150, (n_peptides, 1)),
+    }
+    return data, metadata
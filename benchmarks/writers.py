@@ -0,0 +1,161 @@
+"""
+Throughput benchmark for the spectral library writers.
+
+Every format and write method is run in a fresh process, so the peak RSS of one run does not hide the next one.
+Run from the repository root using e.g.
+
+    python -m benchmarks.writers --peptides 100000 --fragments 174 --output results.json
+
+To benchmark DLib inserts only, use e.g. '--formats dlib --methods write --chunksize 1000'.
+
+The results are printed as json, one object per run, and optionally written to --output to track regressions
+between releases.
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import queue
+import resource
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from spectrum_io.registry import get_spectral_library
+
+from .synthetic import generate_batch
+
+FORMATS = {"msp": "benchmark.msp", "spectronaut": "benchmark.csv", "dlib": "benchmark.dlib"}
+METHODS = ("write", "async_write")
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux, but in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+def _write(library: Any, batches: List[Tuple[Dict[str, np.ndarray], pd.DataFrame]]):
+    for i, (data, metadata) in enumerate(batches):
+        library.mode = "w" if i == 0 else "a"
+        library.write(data=data, metadata=metadata)
+
+
+def _async_write(library: Any, batches: List[Tuple[Dict[str, np.ndarray], pd.DataFrame]]):
+    # batches are put into the queue by a producer thread, as predictions arrive while the library is written
+    batch_queue: queue.Queue = queue.Queue(maxsize=4)
+
+    def produce():
+        for batch in batches:
+            batch_queue.put(batch)
+        batch_queue.put(None)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    library.async_write(batch_queue, SimpleNamespace(value=0))
+    producer.join()
+
+
+def run(
+    library_format: str,
+    method: str,
+    n_peptides: int,
+    n_fragments: int,
+    batch_size: int,
+    chunksize: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Write synthetic batches with one format and write method and measure the throughput.
+
+    The batches are generated before the measurement, so the reported rss_increase_mb is the additional peak
+    memory used for writing.
+
+    :param library_format: the name of the library format, see FORMATS
+    :param method: the write method, see METHODS
+    :param n_peptides: number of precursors to write
+    :param n_fragments: number of fragments per precursor
+    :param batch_size: number of precursors per batch
+    :param chunksize: optional number of rows per insert statement for dlib, see SpectralLibrary
+    :return: the measurements
+    """
+    batches = [
+        generate_batch(min(batch_size, n_peptides - start), n_fragments=n_fragments, seed=start)
+        for start in range(0, n_peptides, batch_size)
+    ]
+    rss_before = _peak_rss_mb()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        out_path = Path(temp_dir) / FORMATS[library_format]
+        library = get_spectral_library(library_format)(out_path, chunksize=chunksize)
+        start = time.perf_counter()
+        if method == "write":
+            _write(library, batches)
+        else:
+            _async_write(library, batches)
+        duration = time.perf_counter() - start
+        size = out_path.stat().st_size
+    peak_rss = _peak_rss_mb()
+
+    return {
+        "format": library_format,
+        "method": method,
+        "precursors": n_peptides,
+        "fragments": n_fragments,
+        "batch_size": batch_size,
+        "chunksize": chunksize,
+        "seconds": round(duration, 3),
+        "bytes": size,
+        "precursors_per_second": round(n_peptides / duration, 1),
+        "bytes_per_second": round(size / duration, 1),
+        "peak_rss_mb": round(peak_rss, 1),
+        "rss_increase_mb": round(peak_rss - rss_before, 1),
+    }
+
+
+def _run_in_child(args: Tuple[str, str, int, int, int, Optional[int]]) -> Dict[str, Any]:
+    return run(*args)
+
+
+def main():
+    """Run the benchmark for all selected formats and methods and print the results as json."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peptides", type=int, default=100000, help="number of precursors to write")
+    parser.add_argument("--fragments", type=int, default=174, help="number of fragments per precursor")
+    parser.add_argument("--batch-size", type=int, default=10000, help="number of precursors per batch")
+    parser.add_argument("--chunksize", type=int, default=None, help="number of rows per insert statement for dlib")
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=list(METHODS))
+    parser.add_argument("--output", type=Path, default=None, help="optional json file to write the results to")
+    args = parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for library_format in args.formats:
+        for method in args.methods:
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                result = pool.apply(
+                    _run_in_child,
+                    ((library_format, method, args.peptides, args.fragments, args.batch_size, args.chunksize),),
+                )
+            print(json.dumps(result), flush=True)
+            results.append(result)
+
+    if args.output is not None:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "results": results,
+        }
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
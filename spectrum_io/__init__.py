@@ -10,8 +10,17 @@ __version__ = "0.6.5"
 import logging
 import logging.handlers
 import sys
+from typing import TYPE_CHECKING
 
-from spectrum_io import d, file, raw
+from spectrum_io._lazy import attach
+
+if TYPE_CHECKING:
+    from spectrum_io import d, file, raw, registry, search_result, spectral_library
+
+# submodules are imported on first access to keep the import of spectrum_io free of heavy dependencies
+__getattr__, __dir__ = attach(
+    __name__, submodules=["d", "file", "raw", "registry", "search_result", "spectral_library"]
+)
 
 # from .search_result import MaxQuant
 # from .spectral_library import DLib, Spectronaut
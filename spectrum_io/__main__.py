@@ -1,15 +1,36 @@
 #!/usr/bin/env python
 """Command-line interface."""
+from typing import Optional
+
 import click
 from rich import traceback
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.version_option(version="0.6.5", message=click.style("spectrum_io Version: 0.6.5"))
 def main() -> None:
     """spectrum_io."""
 
 
+@main.command()
+@click.argument("src", type=click.Path(exists=True, dir_okay=False))
+@click.argument("dst", type=click.Path(dir_okay=False))
+@click.option("--batch-size", default=10000, show_default=True, help="Number of precursors per batch.")
+@click.option("--src-format", default=None, help="Format of SRC, derived from its suffix if not given.")
+@click.option("--dst-format", default=None, help="Format of DST, derived from its suffix if not given.")
+@click.option("--workers", type=int, default=None, help="Number of processes formatting text libraries.")
+def convert(
+    src: str, dst: str, batch_size: int, src_format: Optional[str], dst_format: Optional[str], workers: Optional[int]
+) -> None:
+    """Convert the spectral library SRC to DST, e.g. an MSP library to DLib."""
+    from spectrum_io.spectral_library import convert_library
+
+    n_precursors = convert_library(
+        src, dst, batch_size=batch_size, src_format=src_format, dst_format=dst_format, n_workers=workers
+    )
+    click.echo(f"Converted {n_precursors} precursors.")
+
+
 if __name__ == "__main__":
     traceback.install()
     main(prog_name="spectrum_io")  # pragma: no cover
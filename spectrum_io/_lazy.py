@@ -0,0 +1,35 @@
+import importlib
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+def attach(
+    package_name: str, submodules: Iterable[str] = (), attributes: Optional[Dict[str, str]] = None
+) -> Tuple[Callable[[str], Any], Callable[[], List[str]]]:
+    """
+    Create module level __getattr__ and __dir__ functions that import submodules and attributes on first access.
+
+    This keeps 'import spectrum_io' cheap, since the heavy dependencies of a format (e.g. alphatims, h5py or
+    pyopenms) are only imported once the format is actually used.
+
+    :param package_name: the __name__ of the package to attach to
+    :param submodules: names of submodules that are imported on first access, e.g. 'hdf5'
+    :param attributes: mapping of attribute names to the submodule they are defined in, e.g. {'MSP': 'msp'}
+    :return: the __getattr__ and __dir__ functions for the package
+    """
+    submodules = set(submodules)
+    attributes = attributes or {}
+
+    def __getattr__(name: str) -> Any:  # noqa: N807
+        if name in submodules:
+            return importlib.import_module(f"{package_name}.{name}")
+        if name in attributes:
+            module = importlib.import_module(f"{package_name}.{attributes[name]}")
+            return getattr(module, name)
+        raise AttributeError(f"module {package_name!r} has no attribute {name!r}")
+
+    def __dir__() -> List[str]:  # noqa: N807
+        # include the attributes defined eagerly in the package, as a module level __dir__ replaces the default one
+        return sorted(set(vars(sys.modules[package_name])) | submodules | set(attributes))
+
+    return __getattr__, __dir__
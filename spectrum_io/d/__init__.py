@@ -1,7 +1,13 @@
 """Init raw."""
 
 import logging
+from typing import TYPE_CHECKING
 
-from .bruker import convert_d_hdf, read_and_aggregate_timstof
+from spectrum_io._lazy import attach
+
+if TYPE_CHECKING:
+    from .bruker import convert_d_hdf, read_and_aggregate_timstof
+
+__getattr__, __dir__ = attach(__name__, attributes={"convert_d_hdf": "bruker", "read_and_aggregate_timstof": "bruker"})
 
 logger = logging.getLogger(__name__)
@@ -1,7 +1,13 @@
 """Initialize logger."""
 
 import logging
+from typing import TYPE_CHECKING
 
-from . import csv, hdf5, parquet
+from spectrum_io._lazy import attach
+
+if TYPE_CHECKING:
+    from . import arrow, compression, csv, hdf5, parquet
+
+__getattr__, __dir__ = attach(__name__, submodules=["arrow", "compression", "csv", "hdf5", "parquet"])
 
 logger = logging.getLogger(__name__)
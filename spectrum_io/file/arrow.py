@@ -0,0 +1,109 @@
+import logging
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+Pathlike = Union[Path, str]
+
+logger = logging.getLogger(__name__)
+
+
+def _to_large_lists(table: pa.Table, value_type: Optional[pa.DataType] = None) -> pa.Table:
+    """
+    Cast all list columns of a table to large_list columns.
+
+    large_list uses 64 bit offsets, so a single column can hold more than 2^31 peaks, which is easily
+    exceeded by the intensities or m/z values of a few million spectra.
+
+    :param table: the table to cast
+    :param value_type: Optional, the type of the list elements after casting. If None, the element type is kept.
+    :return: the table with all list columns cast to large_list
+    """
+    fields = []
+    for field in table.schema:
+        if pa.types.is_list(field.type) or pa.types.is_large_list(field.type):
+            element_type = field.type.value_type
+            if value_type is not None and pa.types.is_floating(element_type):
+                element_type = value_type
+            field = field.with_type(pa.large_list(element_type))
+        fields.append(field)
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def write_file(
+    data: pd.DataFrame,
+    path: Pathlike,
+    value_type: Optional[pa.DataType] = None,
+    compression: Optional[str] = None,
+    chunksize: Optional[int] = None,
+) -> None:
+    """
+    Write a DataFrame containing spectra to an Arrow IPC (Feather v2) file.
+
+    List-valued columns, such as intensities or m/z values, are stored as large_list columns, i.e. one flat
+    buffer of values plus an offsets buffer, which can be memory-mapped and read without deserialization.
+
+    :param data: Data to store
+    :param path: Path to write the Arrow IPC file to
+    :param value_type: Optional, the type used for the elements of floating point list columns, e.g. pa.float32()
+        to halve the size of the stored spectra. If None, the element type is kept. Default: None
+    :param compression: Optional, the buffer compression ('lz4' or 'zstd'). Compressed buffers need to be
+        decompressed when read, so zero-copy reads are only possible without compression. Default: None
+    :param chunksize: Optional, the maximum number of rows per record batch. If None, the table is written as
+        is, which results in a single record batch for DataFrames. Default: None
+    """
+    table = _to_large_lists(pa.Table.from_pandas(data, preserve_index=False), value_type=value_type)
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.OSFile(str(path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=chunksize)
+
+
+def read_file(path: Pathlike, memory_map: bool = True, columns: Optional[List[str]] = None) -> pa.Table:
+    """
+    Read an Arrow IPC file and return an Arrow Table with its contents.
+
+    If memory_map is True and the file was written without compression, the buffers of the returned table
+    are views into the memory-mapped file, i.e. no data is copied or deserialized until it is accessed.
+    Use spectra_arrays to obtain numpy views of list columns or Table.to_pandas to convert the table.
+
+    The file is closed before returning in both cases. A memory mapping is kept alive by the buffers referencing
+    it, so it is released once the returned table and all arrays derived from it are garbage collected. On Windows,
+    the file can only be deleted or overwritten after that.
+
+    :param path: Path to the Arrow IPC file to read
+    :param memory_map: Whether to memory-map the file instead of reading it into memory. Default: True
+    :param columns: Optional, names of the columns to read. If None, all columns are read. Default: None
+    :return: an Arrow Table with the contents of the file
+    """
+    source = pa.memory_map(str(path), "r") if memory_map else pa.OSFile(str(path), "rb")
+    with source:
+        table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def spectra_arrays(table: pa.Table, column: str) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Return numpy views of the flat values and offsets of a list column.
+
+    One (values, offsets) pair is returned for each record batch of the table. The values of the i-th spectrum
+    of a batch are values[offsets[i]:offsets[i + 1]]. If the table was read from a memory-mapped file, the
+    arrays are zero-copy views into the file.
+
+    :param table: the table containing the list column
+    :param column: the name of the list column, e.g. 'INTENSITIES'
+    :raises TypeError: if the column is not a list column
+    :return: a list of (values, offsets) tuples, one for each record batch
+    """
+    chunked = table.column(column)
+    if not (pa.types.is_list(chunked.type) or pa.types.is_large_list(chunked.type)):
+        raise TypeError(f"Column {column} is of type {chunked.type}, but a list column is required.")
+    return [
+        (chunk.values.to_numpy(zero_copy_only=True), chunk.offsets.to_numpy(zero_copy_only=True))
+        for chunk in chunked.chunks
+    ]
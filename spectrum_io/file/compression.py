@@ -0,0 +1,137 @@
+import gzip
+import io
+import logging
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any, BinaryIO, Deque, Optional, Union
+
+Pathlike = Union[Path, str]
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+COMPRESSIONS = ("gzip", "zstd")
+
+# large enough to compress well, small enough to keep all threads busy for libraries of a few hundred MB
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def infer_compression(path: Pathlike) -> Optional[str]:
+    """
+    Derive the compression of a file from its suffix.
+
+    :param path: the path of the file, e.g. 'library.msp.gz'
+    :return: 'gzip' or 'zstd' if the suffix is in COMPRESSION_SUFFIXES, None otherwise
+    """
+    return COMPRESSION_SUFFIXES.get(Path(path).suffix.lower())
+
+
+class GzipBlockWriter(io.RawIOBase):
+    """
+    Writable binary stream compressing blocks of data in parallel into a multi-member gzip file.
+
+    Written data is collected into blocks of block_size bytes and each block is compressed into an independent
+    gzip member by a thread pool, since zlib releases the GIL while compressing. The members are written in order,
+    so the result is a valid gzip file that can be read by any gzip reader. At most twice the number of threads
+    blocks are compressed or waiting to be written at a time.
+    """
+
+    def __init__(self, raw: BinaryIO, level: int = 6, threads: Optional[int] = None, block_size: int = BLOCK_SIZE):
+        """
+        Initialize a GzipBlockWriter obj.
+
+        :param raw: the binary file the compressed data is written to. It is closed when the writer is closed.
+        :param level: the gzip compression level
+        :param threads: the number of compression threads. If None, the number of CPUs is used.
+        :param block_size: the number of uncompressed bytes per gzip member
+        """
+        super().__init__()
+        threads = threads or os.cpu_count() or 1
+        self._raw = raw
+        self._level = level
+        self._block_size = block_size
+        self._max_pending = 2 * threads
+        self._buffer = bytearray()
+        self._pending: Deque[Future] = deque()
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="gzip_writer")
+
+    def writable(self) -> bool:  # noqa: D102
+        return True
+
+    def write(self, b: Any) -> int:  # noqa: D102
+        self._buffer += b
+        if len(self._buffer) >= self._block_size:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        return len(b)
+
+    def _submit(self, block: bytes):
+        if len(self._pending) >= self._max_pending:
+            self._raw.write(self._pending.popleft().result())
+        self._pending.append(self._executor.submit(gzip.compress, block, self._level, mtime=0))
+
+    def close(self):
+        """Compress the remaining data, write all pending blocks and close the underlying file."""
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._raw.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._raw.close()
+            super().close()
+
+
+def open_file(
+    path: Pathlike,
+    mode: str = "r",
+    compression: Optional[str] = None,
+    threads: Optional[int] = None,
+    level: Optional[int] = None,
+) -> IO:
+    """
+    Open a text file that is transparently compressed or decompressed.
+
+    Files can also be read in binary mode ('rb'), which returns the decompressed bytes, e.g. to track byte offsets.
+
+    When writing, gzip members and zstd frames are compressed using multiple threads. Appending adds a new gzip
+    member or zstd frame, so appended files stay readable.
+
+    :param path: the path of the file
+    :param mode: 'r' to read, 'rb' to read bytes, 'w' to overwrite or 'a' to append
+    :param compression: 'gzip', 'zstd' or None. If None, the compression is derived from the suffix of the path
+        and the file is opened without compression if the suffix is not in COMPRESSION_SUFFIXES.
+    :param threads: the number of compression threads. If None, the number of CPUs is used.
+    :param level: the compression level. If None, the default of the compression is used.
+    :raises ValueError: if the compression is not supported
+    :raises ImportError: if zstd compression is requested, but the zstandard package is not installed
+    :return: a text file handle, or a binary file handle for mode 'rb'
+    """
+    compression = compression or infer_compression(path)
+    if compression is None:
+        return open(path, mode)
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Compression {compression} not understood. Supported compressions are {COMPRESSIONS}.")
+
+    if compression == "gzip":
+        if mode in ("r", "rb"):
+            return gzip.open(path, "rb" if mode == "rb" else "rt")
+        return io.TextIOWrapper(
+            GzipBlockWriter(open(path, f"{mode}b"), level=6 if level is None else level, threads=threads)
+        )
+
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd compression requires the zstandard package (pip install zstandard).") from e
+    if mode in ("r", "rb"):
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True)
+        return io.BufferedReader(reader) if mode == "rb" else io.TextIOWrapper(reader)
+    compressor = zstandard.ZstdCompressor(level=3 if level is None else level, threads=threads or -1)
+    return io.TextIOWrapper(compressor.stream_writer(open(path, f"{mode}b")))
@@ -1,25 +1,69 @@
+import logging
 from pathlib import Path
-from typing import Union
+from typing import Dict, Optional, Union
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
+logger = logging.getLogger(__name__)
 
-def read_file(path: Union[str, Path]) -> pd.DataFrame:
+ENGINES = ("pyarrow", "pandas")
+
+
+def read_file(
+    path: Union[str, Path], column_types: Optional[Dict[str, pa.DataType]] = None, engine: str = "pyarrow"
+) -> pd.DataFrame:
     """
     Read csv file and return df with contents.
 
+    The pyarrow engine parses the file using multiple threads. If it fails, e.g. due to quoted line breaks,
+    the file is read using pandas instead.
+
     :param path: path to file to read
+    :param column_types: optional mapping of column names to arrow types. Columns that are not listed are inferred.
+        Providing types avoids type inference and ensures that e.g. integral float columns stay floats.
+    :param engine: the parser to use, either 'pyarrow' or 'pandas'
+    :raises ValueError: if the engine is not supported
     :return: df with contents as pd.DataFrame
     """
-    df = pd.read_csv(path, sep=",")
+    if engine not in ENGINES:
+        raise ValueError(f"Engine {engine} not understood. Supported engines are {ENGINES}.")
+    if engine == "pyarrow":
+        try:
+            table = pacsv.read_csv(
+                path,
+                read_options=pacsv.ReadOptions(use_threads=True),
+                convert_options=pacsv.ConvertOptions(column_types=column_types or {}, strings_can_be_null=True),
+            )
+            return table.to_pandas()
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            logger.warning(f"Failed to read {path} using pyarrow, falling back to pandas: {e}")
+    dtype = {name: pa_type.to_pandas_dtype() for name, pa_type in (column_types or {}).items()}
+    df = pd.read_csv(path, sep=",", dtype=dtype or None)
     return df
 
 
-def write_file(df: pd.DataFrame, path: Union[str, Path]):
+def write_file(df: pd.DataFrame, path: Union[str, Path], engine: str = "pyarrow"):
     """
     Write dataframe to csv file.
 
+    The pyarrow engine writes booleans as 'true' / 'false' and floats without trailing zeros. If the
+    dataframe cannot be converted to an arrow table, e.g. due to mixed types in a column, it is written
+    using pandas instead.
+
     :param df: df with contents as pd.DataFrame
     :param path: path to file to write
+    :param engine: the writer to use, either 'pyarrow' or 'pandas'
+    :raises ValueError: if the engine is not supported
     """
+    if engine not in ENGINES:
+        raise ValueError(f"Engine {engine} not understood. Supported engines are {ENGINES}.")
+    if engine == "pyarrow":
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            pacsv.write_csv(table, path, write_options=pacsv.WriteOptions(quoting_style="needed"))
+            return
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+            logger.warning(f"Failed to write {path} using pyarrow, falling back to pandas: {e}")
     df.to_csv(path, index=False)
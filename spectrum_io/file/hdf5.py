@@ -1,12 +1,15 @@
 import logging
 import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Set, Union
 
 import h5py
+import numpy as np
 import pandas as pd
 import scipy
-from scipy.sparse import coo_matrix
+from scipy.sparse import coo_matrix, csr_matrix
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +18,39 @@ INTENSITY_RAW_KEY = "raw_intensity"
 INTENSITY_PRED_KEY = "pred_intensity"
 MZ_RAW_KEY = "raw_mz"
 
+SPARSE_FORMATS = ("coo", "csr")
+
+
+def _read_sparse_group(group: h5py.Group) -> scipy.sparse.spmatrix:
+    """
+    Read a sparse matrix stored in a group of an hdf5 file.
+
+    The storage layout is taken from the 'format' attribute of the group. Groups without this attribute
+    were written before CSR support was added and are always read as COO triplets.
+
+    :param group: the hdf5 group containing the sparse matrix
+    :return: a scipy coo_matrix for the COO layout or a scipy csr_matrix for the CSR layout
+    """
+    shape = tuple(group["shape"][()])
+    if group.attrs.get("format", "coo") == "csr":
+        return csr_matrix((group["data"][()], group["indices"][()], group["indptr"][()]), shape=shape)
+    return coo_matrix((group["values"][()], (group["i"][()], group["j"][()])), shape)
+
+
+def read_sparse_matrix(path: Union[str, Path], key: str) -> csr_matrix:
+    """
+    Read a sparse matrix from an hdf5 file without converting it to a pandas DataFrame.
+
+    Matrices written using the CSR layout are returned without any conversion. Matrices written using
+    the COO layout are converted to CSR.
+
+    :param path: The path to the hdf5 file to read
+    :param key: The key of the group containing the sparse matrix, i.e. 'sparse_<dataset_name>'
+    :return: the sparse matrix as scipy csr_matrix
+    """
+    with h5py.File(path, "r") as f:
+        return csr_matrix(_read_sparse_group(f[key]))
+
 
 def read_file(path: Union[str, Path], key: str) -> pd.DataFrame:
     """
@@ -29,11 +65,7 @@ def read_file(path: Union[str, Path], key: str) -> pd.DataFrame:
         if key.startswith("sparse"):
             with h5py.File(path, "r") as f:
                 logger.info(f"Reading sparse matrix from hdf5 file. Available keys: {f.keys()}")
-                values = f[f"{key}/values"]
-                i = f[f"{key}/i"]
-                j = f[f"{key}/j"]
-                shape = f[f"{key}/shape"]
-                sparse_data = coo_matrix((values, (i, j)), shape)
+                sparse_data = _read_sparse_group(f[key])
                 df = pd.DataFrame.sparse.from_spmatrix(sparse_data)
                 if f"{key}/column_names" in f.keys():
                     df.columns = f[f"{key}/column_names"].asstr()
@@ -46,46 +78,229 @@ def read_file(path: Union[str, Path], key: str) -> pd.DataFrame:
         logger.exception(e)
 
 
-def thread_this(fn):
-    """Function for threading."""
+class _WriteFuture(Future):
+    """Future of a background write, remembering whether its outcome was retrieved by a caller."""
+
+    def __init__(self):
+        super().__init__()
+        self.retrieved = False
+
+    def result(self, timeout: Optional[float] = None) -> Any:  # noqa: D102
+        self.retrieved = True
+        return super().result(timeout)
+
+    def exception(self, timeout: Optional[float] = None) -> Optional[BaseException]:  # noqa: D102
+        self.retrieved = True
+        return super().exception(timeout)
+
+
+class WriterPool:
+    """
+    Bounded pool of background threads writing hdf5 files.
+
+    Writes are submitted as tasks and a future is returned for each of them, so callers can overlap computation
+    with I/O and still wait for completion or retrieve errors. Writes to the same file are serialized, since
+    HDF5 does not support concurrent writers on a single file, while writes to different files run in parallel.
+    Once max_pending writes are queued or running, submitting blocks until one of them is finished, which
+    bounds the memory held by pending datasets.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8):
+        """
+        Initialize a WriterPool obj.
+
+        :param max_workers: number of threads writing in parallel
+        :param max_pending: maximum number of queued or running writes before submit blocks
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hdf5_writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # lock and number of pending writes per file, removed once no write to the file is pending
+        self._path_locks: Dict[str, threading.Lock] = {}
+        self._path_pending: Dict[str, int] = {}
+        self._pending: Set[Future] = set()
+        self._failed: List[_WriteFuture] = []
+        self._guard = threading.Lock()
+
+    def submit(self, path: Union[str, Path], fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        """
+        Schedule a write to the given file.
+
+        :param path: the file written by fn, used to serialize writes to the same file
+        :param fn: the function performing the write
+        :param args: positional arguments passed to fn
+        :param kwargs: keyword arguments passed to fn
+        :return: a future holding the result of fn or the exception raised by it
+        """
+        key = str(Path(path).resolve())
+        self._slots.acquire()
+        with self._guard:
+            lock = self._path_locks.setdefault(key, threading.Lock())
+            self._path_pending[key] = self._path_pending.get(key, 0) + 1
+        future = _WriteFuture()
+        # the write cannot be cancelled through the returned future, since it may already be running
+        future.set_running_or_notify_cancel()
+        try:
+            task = self._executor.submit(self._run_serialized, lock, fn, *args, **kwargs)
+        except Exception:
+            self._release(key)
+            raise
+        with self._guard:
+            self._pending.add(future)
+        task.add_done_callback(lambda task: self._on_done(key, task, future))
+        return future
+
+    @staticmethod
+    def _run_serialized(lock: threading.Lock, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        with lock:
+            return fn(*args, **kwargs)
+
+    def _release(self, key: str):
+        with self._guard:
+            self._path_pending[key] -= 1
+            if self._path_pending[key] == 0:
+                del self._path_pending[key]
+                del self._path_locks[key]
+        self._slots.release()
+
+    def _on_done(self, key: str, task: Future, future: _WriteFuture):
+        error = task.exception()
+        with self._guard:
+            self._pending.discard(future)
+            if error is not None:
+                # recorded before the future resolves, so flush never misses an error of a write it waited for
+                logger.error(f"Background hdf5 write failed: {error}")
+                self._failed.append(future)
+        self._release(key)
+        if error is None:
+            future.set_result(task.result())
+        else:
+            future.set_exception(error)
+
+    def flush(self):
+        """
+        Block until all writes submitted so far are finished.
+
+        :raises Exception: the first exception of a write that failed since the last flush and whose error was
+            not already retrieved from its future
+        """
+        with self._guard:
+            pending = list(self._pending)
+        wait_futures(pending)
+        with self._guard:
+            failed, self._failed = self._failed, []
+        unretrieved = [future for future in failed if not future.retrieved]
+        if unretrieved:
+            raise unretrieved[0].exception()
+
+    def close(self):
+        """Wait for all submitted writes and shut down the writer threads."""
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
 
-    def run(*args, **kwargs):
-        t = threading.Thread(target=fn, args=args, kwargs=kwargs)
-        t.start()
-        return t
+    def __enter__(self):
+        return self
 
-    return run
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+_default_pool: Optional[WriterPool] = None
+_default_pool_guard = threading.Lock()
+
+
+def get_writer_pool() -> WriterPool:
+    """
+    Return the writer pool used by write_file if no pool is given.
+
+    :return: the module-wide WriterPool, created on first use
+    """
+    global _default_pool
+    with _default_pool_guard:
+        if _default_pool is None:
+            _default_pool = WriterPool()
+        return _default_pool
+
+
+def flush():
+    """
+    Block until all writes submitted to the module-wide writer pool are finished.
+
+    :raises Exception: the first exception of a failed write whose error was not retrieved from its future
+    """
+    if _default_pool is not None:
+        _default_pool.flush()
 
 
-@thread_this
 def write_file(
     data_sets: List[Union[pd.DataFrame, scipy.sparse.spmatrix]],
     path: str,
     dataset_names: List[str],
     column_names: Optional[List[Optional[List[str]]]] = None,
-):
+    sparse_format: str = "coo",
+    pool: Optional[WriterPool] = None,
+) -> Future:
     """
-    Writes several datasets (spectra) to hdf5 file.
+    Writes several datasets (spectra) to hdf5 file in the background.
+
+    The write is scheduled on a WriterPool and this function returns immediately. Use the returned future
+    to wait for completion and to retrieve errors, or call flush to wait for all pending writes.
 
     :param data_sets: list of datasets
     :param path: path to store the file to
     :param dataset_names: list of dataset names
     :param column_names: list of column_names
-    :raises TypeError: if data_set has an unexpected type
+    :param sparse_format: the layout used to store sparse matrices, either 'coo' or 'csr'. Check write_dataset docs.
+    :param pool: Optional, the writer pool to schedule the write on. If None, a module-wide pool is used.
+    :return: a future that is resolved once all datasets are written; it raises TypeError if a data_set has an
+        unexpected type as well as any error raised while writing
     """
+    pool = pool or get_writer_pool()
+    return pool.submit(path, _write_datasets, data_sets, path, dataset_names, column_names, sparse_format)
+
+
+def _write_datasets(
+    data_sets: List[Union[pd.DataFrame, scipy.sparse.spmatrix]],
+    path: str,
+    dataset_names: List[str],
+    column_names: Optional[List[Optional[List[str]]]],
+    sparse_format: str,
+):
     index = 0
     for data_set, dataset_name in zip(data_sets, dataset_names):
         if isinstance(data_set, pd.DataFrame):
-            write_dataset(data_set, path, dataset_name)
+            write_dataset(data_set, path, dataset_name, raise_errors=True)
         elif isinstance(data_set, scipy.sparse.spmatrix):
             if not isinstance(column_names, list):
                 raise TypeError(f"column_names is required if data_set is of type {type(data_set)}.")
-            write_dataset(data_set, path, dataset_name, mode="a", column_names=column_names[index])
+            write_dataset(
+                data_set,
+                path,
+                dataset_name,
+                mode="a",
+                column_names=column_names[index],
+                sparse_format=sparse_format,
+                raise_errors=True,
+            )
             index += 1
         else:
             raise TypeError(f"data_set type not understood: {type(data_set)}.")
 
 
+def _resolve_compression(
+    data: Union[pd.DataFrame, scipy.sparse.spmatrix], compression: Optional[Union[str, bool]]
+) -> Optional[str]:
+    """Translate the boolean compression flag of write_dataset to the default method for the given data type."""
+    if not isinstance(compression, bool):
+        return compression
+    if compression and isinstance(data, pd.DataFrame):
+        return "zlib"
+    if compression and isinstance(data, scipy.sparse.spmatrix):
+        return "gzip"
+    return None
+
+
 def write_dataset(
     data: Union[pd.DataFrame, scipy.sparse.spmatrix],
     path: str,
@@ -94,6 +309,11 @@ def write_dataset(
     compression: Optional[Union[str, bool]] = True,
     column_names: Optional[List[str]] = None,
     index: Optional[List[str]] = None,
+    sparse_format: str = "coo",
+    index_dtype: Optional[np.dtype] = None,
+    value_dtype: Optional[np.dtype] = None,
+    chunk_rows: int = 1024,
+    raise_errors: bool = False,
 ):
     """
     Writes or appends dataset to an hdf5 file.
@@ -109,27 +329,52 @@ def write_dataset(
             standard compression depending on the data type given. Default: True
     :param column_names: Optional, additional column column_names. Ignored if providing a pandas DataFrame. Default: None
     :param index: Optional, additional index. Ignored if providing a pandas DataFrame. Default: None
+    :param sparse_format: Optional, the layout used to store a sparse matrix. Use 'coo' to store (i, j, values)
+            triplets or 'csr' to store the compressed sparse row arrays (indptr, indices, data), which are smaller
+            and can be read back using read_sparse_matrix without any conversion. Ignored if providing a pandas
+            DataFrame. Default: 'coo'
+    :param index_dtype: Optional, the dtype used for storing row / column indices of a sparse matrix. If None, int64
+            is used for the 'coo' and int32 for the 'csr' layout. Ignored if providing a pandas DataFrame.
+            Default: None
+    :param value_dtype: Optional, the dtype used for storing the values of a sparse matrix. If None, float64 is used
+            for the 'coo' and float32 for the 'csr' layout. Ignored if providing a pandas DataFrame. Default: None
+    :param chunk_rows: Optional, the number of matrix rows per hdf5 chunk when using the 'csr' layout. Ignored
+            otherwise. Default: 1024
+    :param raise_errors: Optional, whether to reraise errors occurring while writing instead of only logging them.
+            Default: False
     :raises AssertionError: if data_set has an unexpected type
+    :raises ValueError: if sparse_format is not one of 'coo' or 'csr'
     """
-    if isinstance(compression, bool) and compression:
-        if isinstance(compression, pd.DataFrame):
-            compression = "zlib"
-        elif isinstance(compression, scipy.sparse.spmatrix):
-            compression = "gzip"
-        else:
-            compression = None
+    if sparse_format not in SPARSE_FORMATS:
+        raise ValueError(f"sparse_format {sparse_format} not understood. Supported formats are {SPARSE_FORMATS}.")
+    compression = _resolve_compression(data, compression)
     try:
         if isinstance(data, pd.DataFrame):
             data.to_hdf(path, key=dataset_name, mode=mode, complib=compression)
+        elif isinstance(data, scipy.sparse.spmatrix) and sparse_format == "csr":
+            _write_csr(
+                data,
+                path,
+                dataset_name,
+                mode=mode,
+                compression=compression,
+                column_names=column_names,
+                index=index,
+                index_dtype=np.dtype(np.int32 if index_dtype is None else index_dtype),
+                value_dtype=np.dtype(np.float32 if value_dtype is None else value_dtype),
+                chunk_rows=chunk_rows,
+            )
         elif isinstance(data, scipy.sparse.spmatrix):
+            index_dtype = int if index_dtype is None else index_dtype
+            value_dtype = float if value_dtype is None else value_dtype
             with h5py.File(path, mode) as f:
                 group_name = f"sparse_{dataset_name}"
                 f.create_group(group_name)
                 i, j, values = scipy.sparse.find(data)
                 shape = data.shape
-                f.create_dataset(f"{group_name}/i", data=i, compression=compression, dtype=int)
-                f.create_dataset(f"{group_name}/j", data=j, compression=compression, dtype=int)
-                f.create_dataset(f"{group_name}/values", data=values, compression=compression, dtype=float)
+                f.create_dataset(f"{group_name}/i", data=i, compression=compression, dtype=index_dtype)
+                f.create_dataset(f"{group_name}/j", data=j, compression=compression, dtype=index_dtype)
+                f.create_dataset(f"{group_name}/values", data=values, compression=compression, dtype=value_dtype)
                 f.create_dataset(f"{group_name}/shape", data=shape, shape=(2,), dtype=int)
                 if column_names:
                     f.create_dataset(f"{group_name}/column_names", data=column_names, compression=compression)
@@ -139,4 +384,70 @@ def write_dataset(
             raise AssertionError("Only pd.DataFrame and scipy.sparse.spmatrix are supported." + type(data))
         logger.info(f"Data {'appended' if mode=='a' else 'written'} to {path}")
     except Exception as e:
+        if raise_errors:
+            raise
         logger.exception(e)
+
+
+def _write_csr(
+    data: scipy.sparse.spmatrix,
+    path: str,
+    dataset_name: str,
+    mode: str,
+    compression: Optional[str],
+    column_names: Optional[List[str]],
+    index: Optional[List[str]],
+    index_dtype: np.dtype,
+    value_dtype: np.dtype,
+    chunk_rows: int,
+):
+    """
+    Write a sparse matrix to an hdf5 file using the CSR layout.
+
+    The indices and data arrays are chunked such that one chunk covers roughly chunk_rows matrix rows,
+    which keeps partial reads of consecutive rows to a minimum number of decompressed chunks. The shuffle
+    filter is applied whenever compression is used, since it considerably improves the compression ratio
+    of the sorted integer indices and the floating point values.
+
+    :param data: the sparse matrix to store
+    :param path: the path to store the file to
+    :param dataset_name: the dataset name, the matrix is stored in the group 'sparse_<dataset_name>'
+    :param mode: use 'a' to append to an existing file or 'w' to overwrite
+    :param compression: the h5py compression filter or None
+    :param column_names: optional column names
+    :param index: optional index
+    :param index_dtype: the dtype for the column indices; indptr falls back to int64 if nnz does not fit
+    :param value_dtype: the dtype for the values
+    :param chunk_rows: the number of matrix rows per chunk
+    """
+    data = csr_matrix(data)
+    data.sort_indices()
+    nnz = data.nnz
+    indptr_dtype = index_dtype if nnz <= np.iinfo(index_dtype).max else np.int64
+    if nnz == 0:
+        # empty datasets cannot be chunked, hence they are stored contiguously without filters
+        chunk_len, compression = None, None
+    else:
+        chunk_len = (max(1, min(nnz, int(np.ceil(nnz / max(data.shape[0], 1) * chunk_rows)))),)
+    shuffle = compression is not None
+
+    with h5py.File(path, mode) as f:
+        group = f.create_group(f"sparse_{dataset_name}")
+        group.attrs["format"] = "csr"
+        group.create_dataset("indptr", data=data.indptr, dtype=indptr_dtype, compression=compression, shuffle=shuffle)
+        group.create_dataset(
+            "indices",
+            data=data.indices,
+            dtype=index_dtype,
+            chunks=chunk_len,
+            compression=compression,
+            shuffle=shuffle,
+        )
+        group.create_dataset(
+            "data", data=data.data, dtype=value_dtype, chunks=chunk_len, compression=compression, shuffle=shuffle
+        )
+        group.create_dataset("shape", data=data.shape, shape=(2,), dtype=int)
+        if column_names:
+            group.create_dataset("column_names", data=column_names, compression=compression)
+        if index:
+            group.create_dataset("index", data=index, compression=compression)
@@ -1,51 +1,123 @@
 import logging
+import shutil
 from pathlib import Path
-from typing import List, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import quote
 
 import pandas as pd
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
-import scipy
 
 Pathlike = Union[Path, str]
+Filters = Union[pc.Expression, List[Tuple], List[List[Tuple]]]
 
 logger = logging.getLogger(__name__)
 
 
-def read_file(path: Pathlike) -> pd.DataFrame:
+def _to_expression(filters: Optional[Filters]) -> Optional[pc.Expression]:
+    """
+    Convert filters to a pyarrow expression.
+
+    :param filters: None, a pyarrow expression or filters in disjunctive normal form as accepted by
+        pandas.read_parquet, e.g. [("RAW_FILE", "=", "run1"), ("SCORE", ">", 50)]
+    :return: the corresponding pyarrow expression or None
+    """
+    if filters is None or isinstance(filters, pc.Expression):
+        return filters
+    return pq.filters_to_expression(filters)
+
+
+def _open_dataset(path: Pathlike) -> ds.Dataset:
+    return ds.dataset(path, format="parquet", partitioning="hive")
+
+
+def _partition_dir(path: Pathlike, dataset_name: str) -> Path:
+    return Path(path) / f"dataset={quote(str(dataset_name), safe='')}"
+
+
+def read_file(path: Pathlike, columns: Optional[List[str]] = None, filters: Optional[Filters] = None) -> pd.DataFrame:
     """
     Read a Parquet file and return a Pandas DataFrame with its contents.
 
+    Columns and filters are pushed down to the Parquet reader, i.e. only the requested columns are read and
+    row groups that cannot contain matching rows according to their statistics are skipped.
+
     :param path: Path to the Parquet file to read
+    :param columns: Optional, names of the columns to read. If None, all columns are read. Default: None
+    :param filters: Optional, row filters either as pyarrow expression or in disjunctive normal form,
+        e.g. [("RAW_FILE", "=", "run1"), ("REVERSE", "=", False), ("SCORE", ">=", 50)]. Default: None
     :return: a Pandas DataFrame with the contents of the file
     """
-    return pd.read_parquet(path)
+    return pd.read_parquet(path, columns=columns, filters=filters)
 
 
-def read_partition(path: Pathlike, dataset_name: str) -> pd.DataFrame:
+def iter_batches(
+    path: Pathlike,
+    batch_size: int = 65536,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Iterate over a Parquet file or a partitioned dataset in batches.
+
+    At most batch_size rows are materialized at once. Columns and filters are pushed down as in read_file.
+
+    :param path: Path to the Parquet file or root path of the partitioned dataset
+    :param batch_size: Maximum number of rows per batch. Default: 65536
+    :param columns: Optional, names of the columns to read. If None, all columns are read. Default: None
+    :param filters: Optional, row filters either as pyarrow expression or in disjunctive normal form. Default: None
+    :yield: Pandas DataFrames with at most batch_size rows each
+    """
+    dataset = _open_dataset(path)
+    for batch in dataset.to_batches(columns=columns, filter=_to_expression(filters), batch_size=batch_size):
+        if batch.num_rows > 0:
+            yield batch.to_pandas()
+
+
+def read_partition(
+    path: Pathlike,
+    dataset_name: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
     """
     Read a single table from a partitioned dataset.
 
+    Only the files of the requested partition are opened, so its own schema is used: columns and the index of
+    the dataset are read even if other partitions do not have them. Columns and filters are pushed down as in
+    read_file.
+
     :param path: Root path of the partitioned dataset
     :param dataset_name: Name of the dataset to extract
+    :param columns: Optional, names of the columns to read. If None, all columns except the partition column are
+        read. Default: None
+    :param filters: Optional, row filters either as pyarrow expression or in disjunctive normal form. Default: None
 
     :return: a Pandas DataFrame of the specified table from the partitioned dataset
     """
-    try:
-        dataset = pq.ParquetDataset(path, filters=[("dataset", "=", dataset_name)])
-        df = dataset.read().to_pandas().drop("dataset", axis=1)
-    except pa.lib.ArrowNotImplementedError as e1:
-        if dataset_name.isdigit():
-            try:
-                logger.warning("Failed to read from partition using string of integer as key, trying with int...")
-                dataset = pq.ParquetDataset(path, filters=[("dataset", "=", int(dataset_name))])
-                df = dataset.read().to_pandas().drop("dataset", axis=1)
-            except pa.lib.ArrowNotImplementedError as e2:
-                logger.exception(e2)
-        else:
-            logger.exception(e1)
-
-    return df
+    partition_dir = _partition_dir(path, dataset_name)
+    if partition_dir.is_dir():
+        dataset = ds.dataset(partition_dir, format="parquet")
+        if columns is not None:
+            # as in pandas.read_parquet, index columns stored by write_partition are read in addition
+            index_columns = (dataset.schema.pandas_metadata or {}).get("index_columns", [])
+            columns = list(columns) + [name for name in index_columns if isinstance(name, str) and name not in columns]
+        return dataset.to_table(columns=columns, filter=_to_expression(filters)).to_pandas()
+
+    # fall back to filtering the whole dataset, e.g. for partition directories named differently by other writers
+    dataset = _open_dataset(path)
+    # Parquet infers an integer partition column if all dataset names are strings of ints
+    partition_type = dataset.schema.field("dataset").type
+    key = int(dataset_name) if pa.types.is_integer(partition_type) and dataset_name.isdigit() else dataset_name
+    expression = ds.field("dataset") == key
+    filter_expression = _to_expression(filters)
+    if filter_expression is not None:
+        expression = expression & filter_expression
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name != "dataset"]
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
 
 
 def write_file(data: pd.DataFrame, path: Pathlike) -> None:
@@ -57,7 +129,9 @@ def write_file(data: pd.DataFrame, path: Pathlike) -> None:
     data.to_parquet(path)
 
 
-def write_partition(datasets: List[pd.DataFrame], path: Pathlike, dataset_names: List[str]) -> None:
+def write_partition(
+    datasets: List[pd.DataFrame], path: Pathlike, dataset_names: List[str], preserve_index: Optional[bool] = None
+) -> None:
     """
     Write several datasets to a Parquet dataset as a directory containing subdirectories partitioned by dataset name.
 
@@ -65,17 +139,95 @@ def write_partition(datasets: List[pd.DataFrame], path: Pathlike, dataset_names:
     :param path: Root path to write the partitioned dataset to
     :param dataset_names: Names to assign to the datasets for retrieval. Careful: If all of these are strings of ints,
         Parquet will convert them to raw integers!
+    :param preserve_index: Whether to store the index of the datasets, so read_partition restores it. If None, as
+        in pandas, a RangeIndex is only stored as metadata and any other index as column. Default: None
     """
-    df = pd.concat([dataset.assign(dataset=name) for dataset, name in zip(datasets, dataset_names)])
-    table = pa.Table.from_pandas(df)
-
-    if isinstance(path, str):
-        path = Path(path)
-    path.mkdir(exist_ok=True)
-
-    pq.write_to_dataset(
-        table,
-        root_path=path,
-        partition_cols=["dataset"],
-        existing_data_behavior="delete_matching",
-    )
+    with ParquetPartitionWriter(path) as writer:
+        for dataset, name in zip(datasets, dataset_names):
+            writer.write(dataset, name, preserve_index=preserve_index)
+
+
+class ParquetPartitionWriter:
+    """
+    Incrementally write datasets to a Parquet dataset partitioned by dataset name.
+
+    Each dataset name is written to its own partition directory using a pq.ParquetWriter, which is kept open
+    until the writer is closed, so data can be streamed in batches. Rows are buffered per dataset only until
+    row_group_size rows are available, which are then written as one row group. Partitions of dataset names
+    that are not written remain untouched, i.e. new datasets can be appended to an existing partitioned
+    dataset; a partition that is written is replaced as a whole.
+    The layout is compatible with read_partition and iter_batches.
+    """
+
+    def __init__(self, path: Pathlike, row_group_size: int = 65536, compression: str = "snappy"):
+        """
+        Initialize a ParquetPartitionWriter obj.
+
+        :param path: Root path of the partitioned dataset
+        :param row_group_size: Number of rows per row group. Default: 65536
+        :param compression: Compression codec used for all partitions. Default: 'snappy'
+        """
+        if isinstance(path, str):
+            path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self._writers: Dict[str, pq.ParquetWriter] = {}
+        self._buffers: Dict[str, List[pa.RecordBatch]] = {}
+        self._buffered_rows: Dict[str, int] = {}
+
+    def write(
+        self,
+        data: Union[pd.DataFrame, pa.Table, pa.RecordBatch],
+        dataset_name: str,
+        preserve_index: Optional[bool] = False,
+    ):
+        """
+        Write a batch of rows to the partition of the given dataset.
+
+        :param data: Rows to write. All batches of a dataset must share the same schema.
+        :param dataset_name: Name of the dataset the rows belong to. Careful: If all dataset names of the
+            partitioned dataset are strings of ints, Parquet will convert them to raw integers when reading!
+        :param preserve_index: Whether to store the index of DataFrames, see pa.Table.from_pandas. Batches are
+            usually indexed independently, so the index is dropped by default. Default: False
+        """
+        dataset_name = str(dataset_name)
+        if isinstance(data, pd.DataFrame):
+            data = pa.Table.from_pandas(data, preserve_index=preserve_index)
+        batches = data.to_batches() if isinstance(data, pa.Table) else [data]
+        if dataset_name not in self._writers:
+            partition_dir = _partition_dir(self.path, dataset_name)
+            if partition_dir.exists():
+                shutil.rmtree(partition_dir)
+            partition_dir.mkdir()
+            self._writers[dataset_name] = pq.ParquetWriter(
+                partition_dir / "part-0.parquet", data.schema, compression=self.compression
+            )
+            self._buffers[dataset_name] = []
+            self._buffered_rows[dataset_name] = 0
+        self._buffers[dataset_name].extend(batches)
+        self._buffered_rows[dataset_name] += data.num_rows
+        if self._buffered_rows[dataset_name] >= self.row_group_size:
+            self._flush(dataset_name, final=False)
+
+    def _flush(self, dataset_name: str, final: bool):
+        table = pa.Table.from_batches(self._buffers[dataset_name], schema=self._writers[dataset_name].schema)
+        n_complete = table.num_rows if final else table.num_rows - table.num_rows % self.row_group_size
+        if n_complete > 0:
+            self._writers[dataset_name].write_table(table.slice(0, n_complete), row_group_size=self.row_group_size)
+        self._buffers[dataset_name] = table.slice(n_complete).to_batches()
+        self._buffered_rows[dataset_name] = table.num_rows - n_complete
+
+    def close(self):
+        """Write all buffered rows and close the files of all partitions."""
+        for dataset_name, writer in self._writers.items():
+            self._flush(dataset_name, final=True)
+            writer.close()
+        self._writers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
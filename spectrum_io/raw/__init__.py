@@ -1,7 +1,13 @@
 """Init raw."""
 
 import logging
+from typing import TYPE_CHECKING
 
-from .thermo_raw import ThermoRaw
+from spectrum_io._lazy import attach
+
+if TYPE_CHECKING:
+    from .thermo_raw import ThermoRaw
+
+__getattr__, __dir__ = attach(__name__, attributes={"ThermoRaw": "thermo_raw"})
 
 logger = logging.getLogger(__name__)
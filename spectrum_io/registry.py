@@ -0,0 +1,69 @@
+"""Registry of supported formats, mapping format names to the objects implementing them without importing them."""
+
+import importlib
+from typing import Any, Dict
+
+FILE_FORMATS = {
+    "arrow": "spectrum_io.file.arrow",
+    "csv": "spectrum_io.file.csv",
+    "hdf5": "spectrum_io.file.hdf5",
+    "parquet": "spectrum_io.file.parquet",
+}
+
+SEARCH_ENGINES = {
+    "mascot": "spectrum_io.search_result.mascot:Mascot",
+    "maxquant": "spectrum_io.search_result.maxquant:MaxQuant",
+    "msamanda": "spectrum_io.search_result.msamanda:MSAmanda",
+    "msfragger": "spectrum_io.search_result.msfragger:MSFragger",
+    "openms": "spectrum_io.search_result.openms:OpenMS",
+    "sage": "spectrum_io.search_result.sage:Sage",
+    "scout": "spectrum_io.search_result.scout:Scout",
+    "xisearch": "spectrum_io.search_result.xisearch:Xisearch",
+}
+
+SPECTRAL_LIBRARIES = {
+    "dlib": "spectrum_io.spectral_library.dlib:DLib",
+    "msp": "spectrum_io.spectral_library.msp:MSP",
+    "parquet": "spectrum_io.spectral_library.parquet:Parquet",
+    "spectronaut": "spectrum_io.spectral_library.spectronaut:Spectronaut",
+}
+
+
+def _load(registry: Dict[str, str], kind: str, name: str) -> Any:
+    try:
+        target = registry[name.lower()]
+    except KeyError:
+        raise ValueError(f"{kind} {name} not supported. Supported {kind}s are {sorted(registry)}.") from None
+    module_name, _, attribute = target.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute) if attribute else module
+
+
+def get_file_format(name: str) -> Any:
+    """
+    Import and return the module implementing a file format.
+
+    :param name: the name of the file format, e.g. 'parquet'
+    :return: the module providing read_file and write_file for the format
+    """
+    return _load(FILE_FORMATS, "file format", name)
+
+
+def get_search_engine(name: str) -> Any:
+    """
+    Import and return the SearchResults subclass for a search engine.
+
+    :param name: the name of the search engine, e.g. 'maxquant'
+    :return: the SearchResults subclass
+    """
+    return _load(SEARCH_ENGINES, "search engine", name)
+
+
+def get_spectral_library(name: str) -> Any:
+    """
+    Import and return the SpectralLibrary subclass for a library format.
+
+    :param name: the name of the library format, e.g. 'msp'
+    :return: the SpectralLibrary subclass
+    """
+    return _load(SPECTRAL_LIBRARIES, "spectral library format", name)
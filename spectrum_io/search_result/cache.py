@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from spectrum_io.file import csv, parquet
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(sources: list[Path], **params: Any) -> str:
+    """
+    Compute a fingerprint of search result files and the parameters used to convert them.
+
+    Each source file is identified by its resolved path, size and modification time, which avoids hashing the
+    content of large files. Parameters are serialized to json with sorted keys, so the order of e.g. custom
+    modifications does not matter.
+
+    :param sources: the search result files the cached results were converted from, see
+        SearchResults.source_files. Files inside a folder need to be listed, as modifying them does not change
+        the modification time of the folder.
+    :param params: the conversion parameters, e.g. tmt_label, custom_mods, ptm_unimod_id and ptm_sites
+    :return: the hex digest of the fingerprint
+    """
+    files = []
+    for source in sorted(source.resolve() for source in sources):
+        stat = source.stat()
+        files.append({"source": str(source), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+    content = {"files": files, "params": params}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResultCache(ABC):
+    """
+    Cache for search results converted to the internal format.
+
+    The converted results are stored at the given path using a format specific to the subclass. The fingerprint
+    of the conversion is stored next to it in '<path>.fingerprint', so stale caches can be detected.
+    """
+
+    suffixes: tuple[str, ...] = ()
+
+    def __init__(self, path: Path, column_types: dict[str, pa.DataType] | None = None):
+        """
+        Init ResultCache object.
+
+        :param path: path to the cached results
+        :param column_types: optional mapping of column names to arrow types of the cached results
+        """
+        self.path = path
+        self.column_types = column_types
+        self.fingerprint_path = path.with_name(path.name + ".fingerprint")
+
+    def is_valid(self, key: str) -> bool:
+        """
+        Check whether the cached results exist and were created with the given fingerprint.
+
+        :param key: the fingerprint of the requested conversion
+        :return: True if the cache can be used, False otherwise
+        """
+        if not self.path.is_file():
+            return False
+        if not self.fingerprint_path.is_file():
+            logger.info(
+                f"Search results in internal format at {self.path} have no fingerprint, e.g. because they were "
+                "converted by an older version, and are converted again"
+            )
+            return False
+        if self.fingerprint_path.read_text().strip() != key:
+            logger.info(f"Search results in internal format at {self.path} are stale")
+            return False
+        return True
+
+    def read(self) -> pd.DataFrame:
+        """
+        Read the cached results.
+
+        :return: the search results in internal format
+        """
+        return self._read()
+
+    def write(self, df: pd.DataFrame, key: str):
+        """
+        Write the results and the fingerprint to the cache.
+
+        :param df: the search results in internal format
+        :param key: the fingerprint of the conversion
+        """
+        self.fingerprint_path.unlink(missing_ok=True)
+        self._write(df)
+        self.fingerprint_path.write_text(key)
+
+    @abstractmethod
+    def _read(self) -> pd.DataFrame:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _write(self, df: pd.DataFrame):
+        raise NotImplementedError
+
+
+class CsvCache(ResultCache):
+    """Cache storing search results in csv format."""
+
+    suffixes = (".csv",)
+
+    def _read(self) -> pd.DataFrame:
+        return csv.read_file(self.path, column_types=self.column_types)
+
+    def _write(self, df: pd.DataFrame):
+        csv.write_file(df, self.path)
+
+
+class ParquetCache(ResultCache):
+    """Cache storing search results in Parquet format, which keeps dtypes and allows columnar reads."""
+
+    suffixes = (".parquet", ".pq")
+
+    def _read(self) -> pd.DataFrame:
+        return parquet.read_file(self.path)
+
+    def _write(self, df: pd.DataFrame):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        for name, pa_type in (self.column_types or {}).items():
+            if name in table.column_names:
+                table = table.set_column(table.column_names.index(name), name, table[name].cast(pa_type))
+        pq.write_table(table, self.path)
+
+
+CACHE_BACKENDS: dict[str, type[ResultCache]] = {"csv": CsvCache, "parquet": ParquetCache}
+
+
+def get_cache(
+    path: Path, cache_format: str | None = None, column_types: dict[str, pa.DataType] | None = None
+) -> ResultCache:
+    """
+    Create the cache for the given path.
+
+    :param path: path to the cached results
+    :param cache_format: one of the keys of CACHE_BACKENDS. If None, the format is derived from the suffix of the
+        path, i.e. '.parquet' and '.pq' use Parquet; csv is used for all other suffixes.
+    :param column_types: optional mapping of column names to arrow types of the cached results
+    :raises ValueError: if the cache format is not supported
+    :return: the cache
+    """
+    if cache_format is None:
+        cache_format = next(
+            (name for name, backend in CACHE_BACKENDS.items() if path.suffix.lower() in backend.suffixes), "csv"
+        )
+    if cache_format not in CACHE_BACKENDS:
+        raise ValueError(f"Cache format {cache_format} not understood. Supported formats are {list(CACHE_BACKENDS)}.")
+    return CACHE_BACKENDS[cache_format](path, column_types=column_types)
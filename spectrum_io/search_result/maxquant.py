@@ -68,6 +68,14 @@ class MaxQuant(SearchResults):
 
         return self.results
 
+    def source_files(self) -> list[Path]:
+        """
+        Get the files read by read_result, which are used to detect modified search results.
+
+        :return: the msms.txt in the MaxQuant output folder
+        """
+        return [self.path / "msms.txt"]
+
     def read_result(
         self,
         tmt_label: str = "",
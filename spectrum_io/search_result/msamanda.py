@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+from pathlib import Path
 from typing import Dict, Optional
 
 import pandas as pd
@@ -19,6 +20,17 @@ class MSAmanda(SearchResults):
         """Standard modifications that are always applied if not otherwise specified."""
         return {"m": 35, "c": 4}
 
+    def source_files(self, suffix: str = "output.csv") -> list[Path]:
+        """
+        Get the files read by read_result, which are used to detect modified search results.
+
+        :param suffix: suffix of the result files taken from a supplied folder, see read_result
+        :return: the supplied file or the files in the supplied folder ending with suffix
+        """
+        if self.path.is_dir():
+            return sorted(self.path.glob(f"*{suffix}"))
+        return [self.path]
+
     def read_result(
         self,
         tmt_label: str = "",
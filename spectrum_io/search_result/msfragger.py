@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+from pathlib import Path
 from typing import Dict, Optional
 
 import pandas as pd
@@ -36,6 +37,16 @@ class MSFragger(SearchResults):
 
         return self.results
 
+    def source_files(self) -> list[Path]:
+        """
+        Get the files read by read_result, which are used to detect modified search results.
+
+        :return: the supplied file or all .pepXML files in the supplied folder and its subfolders
+        """
+        if self.path.is_dir():
+            return sorted(self.path.rglob("*.pepXML"))
+        return [self.path]
+
     def read_result(
         self,
         tmt_label: str = "",
@@ -146,6 +146,16 @@ class OpenMS(SearchResults):
         """Standard modifications that are always applied if not otherwise specified."""
         return {"C(Carbamidomethyl)": 4, "M(Oxidation)": 35, "R(Deamidated)": 7, "Q(Deamidated)": 7, "N(Deamidated)": 7}
 
+    def source_files(self) -> list[Path]:
+        """
+        Get the files read by read_result, which are used to detect modified search results.
+
+        :return: the supplied file or all .idXML files in the supplied folder and its subfolders
+        """
+        if self.path.is_dir():
+            return sorted(self.path.rglob("*.idXML"))
+        return [self.path]
+
     def read_result(
         self,
         tmt_label: str = "",
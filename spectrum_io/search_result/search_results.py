@@ -7,9 +7,12 @@ from pathlib import Path
 from typing import Dict, Optional, Tuple, Union
 
 import pandas as pd
+import pyarrow as pa
 
 from spectrum_io.file import csv
 
+from .cache import fingerprint, get_cache
+
 logger = logging.getLogger(__name__)
 
 
@@ -26,6 +29,19 @@ COLUMNS = [
     "PROTEINS",
 ]
 
+COLUMN_TYPES = {
+    "RAW_FILE": pa.string(),
+    "SCAN_NUMBER": pa.int64(),
+    "MODIFIED_SEQUENCE": pa.string(),
+    "PRECURSOR_CHARGE": pa.int64(),
+    "MASS": pa.float64(),
+    "SCORE": pa.float64(),
+    "REVERSE": pa.bool_(),
+    "SEQUENCE": pa.string(),
+    "PEPTIDE_LENGTH": pa.int64(),
+    "PROTEINS": pa.string(),
+}
+
 
 def parse_mods(mods: dict[str, int]) -> dict[str, str]:
     """
@@ -89,6 +105,14 @@ class SearchResults:
             path = Path(path)
         self.path = path
 
+    def source_files(self) -> list[Path]:
+        """
+        Get the files read by read_result, which are used to detect modified search results.
+
+        :return: the search result files
+        """
+        return [self.path]
+
     @abstractmethod
     def filter_valid_prosit_sequences(self):
         """Filter valid Prosit sequences."""
@@ -119,16 +143,24 @@ class SearchResults:
         ptm_unimod_id: int | None = 0,
         ptm_sites: list[str] | None = None,
         xl: bool = False,
+        cache_format: str | None = None,
     ) -> pd.DataFrame:
         """
         Generate df and save to out_path if provided.
 
+        If out_path is provided and contains results converted from the same search results file using the same
+        parameters, these are read instead of converting again. Results converted from a different or modified
+        file or using other parameters are considered stale and are overwritten. If the search results file no
+        longer exists, the results at out_path are read without validation.
+
         :param out_path: path to output
         :param tmt_label: tmt label as str
         :param custom_mods: dict with static and variable custom modifications, their internal identifier and mass
         :param ptm_unimod_id: unimod id used for site localization
         :param ptm_sites: possible sites that the ptm can exist on
         :param xl: set to True for crosslinking data
+        :param cache_format: format used to store the results at out_path, either 'csv' or 'parquet'. If None,
+            parquet is used for paths ending with '.parquet' or '.pq' and csv otherwise.
         :return: path to output file
         """
         if out_path is None:
@@ -143,11 +175,28 @@ class SearchResults:
         if isinstance(out_path, str):
             out_path = Path(out_path)
 
-        if out_path.is_file():
+        cache = get_cache(out_path, cache_format=cache_format, column_types=None if xl else COLUMN_TYPES)
+        try:
+            key = fingerprint(
+                self.source_files(),
+                search_engine=type(self).__name__,
+                tmt_label=tmt_label,
+                custom_mods=custom_mods,
+                ptm_unimod_id=ptm_unimod_id,
+                ptm_sites=ptm_sites,
+                xl=xl,
+            )
+        except FileNotFoundError as e:
+            if not out_path.is_file():
+                raise
+            # the search results were moved or deleted, so the cached results cannot be validated but are still used
+            logger.warning(f"Using search results in internal format at {out_path} without validation: {e}")
+            return cache.read()
+        if cache.is_valid(key):
             # only read converted and return
             logger.info(f"Found search results in internal format at {out_path}, skipping conversion")
             # TODO: internal_to_unimod
-            return csv.read_file(out_path)
+            return cache.read()
 
         # convert, save and return
         if xl:
@@ -158,7 +207,7 @@ class SearchResults:
             df = self.read_result(tmt_label, custom_mods=custom_mods, ptm_unimod_id=ptm_unimod_id, ptm_sites=ptm_sites)[
                 COLUMNS
             ]
-        csv.write_file(df, out_path)
+        cache.write(df, key)
         return df
 
     def read_internal(self) -> pd.DataFrame:
@@ -167,7 +216,7 @@ class SearchResults:
 
         :return: dataframe after reading the file
         """
-        return csv.read_file(self.path)
+        return csv.read_file(self.path, column_types=COLUMN_TYPES)
 
     @abstractmethod
     def convert_to_internal(self, mods: dict[str, str], ptm_unimod_id: int | None, ptm_sites: list[str] | None):
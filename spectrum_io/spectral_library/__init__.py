@@ -1,11 +1,32 @@
 """Initialize spectral library."""
 
 import logging
+from typing import TYPE_CHECKING
 
-from . import digest
-from .dlib import DLib
-from .msp import MSP
-from .spectral_library import SpectralLibrary
-from .spectronaut import Spectronaut
+from spectrum_io._lazy import attach
+
+if TYPE_CHECKING:
+    from . import digest
+    from .convert import convert_library
+    from .dlib import DLib
+    from .msp import MSP
+    from .parquet import Parquet
+    from .sharded import ShardedLibrary
+    from .spectral_library import SpectralLibrary
+    from .spectronaut import Spectronaut
+
+__getattr__, __dir__ = attach(
+    __name__,
+    submodules=["digest"],
+    attributes={
+        "DLib": "dlib",
+        "MSP": "msp",
+        "Parquet": "parquet",
+        "ShardedLibrary": "sharded",
+        "SpectralLibrary": "spectral_library",
+        "Spectronaut": "spectronaut",
+        "convert_library": "convert",
+    },
+)
 
 logger = logging.getLogger(__name__)
@@ -0,0 +1,149 @@
+import logging
+import queue
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from spectrum_io.file.compression import COMPRESSION_SUFFIXES
+from spectrum_io.registry import get_spectral_library
+
+from .parquet import ARROW_SUFFIXES
+from .reading import Batch
+from .spectral_library import SpectralLibrary
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_SUFFIXES = {
+    ".msp": "msp",
+    ".csv": "spectronaut",
+    ".dlib": "dlib",
+    ".parquet": "parquet",
+    **{suffix: "parquet" for suffix in ARROW_SUFFIXES},
+}
+
+
+def infer_library_format(path: Union[str, Path]) -> str:
+    """
+    Derive the spectral library format from the suffix of a path, ignoring compression suffixes.
+
+    :param path: the path of the library, e.g. 'library.msp.gz'
+    :raises ValueError: if the suffix does not belong to a known library format
+    :return: the name of the format as used by get_spectral_library, e.g. 'msp'
+    """
+    path = Path(path)
+    if path.suffix.lower() in COMPRESSION_SUFFIXES:
+        path = path.with_suffix("")
+    try:
+        return LIBRARY_SUFFIXES[path.suffix.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Cannot infer the library format of {path.name}. Supported suffixes are {sorted(LIBRARY_SUFFIXES)}."
+        ) from None
+
+
+def convert_library(
+    src: Union[str, Path],
+    dst: Union[str, Path],
+    batch_size: int = 10000,
+    src_format: Optional[str] = None,
+    dst_format: Optional[str] = None,
+    src_custom_mods: Optional[Dict[str, int]] = None,
+    dst_custom_mods: Optional[Dict[str, int]] = None,
+    n_workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    **library_kwargs: Any,
+) -> int:
+    """
+    Convert a spectral library to another format, streaming it batch by batch.
+
+    The source library is parsed incrementally, so at most max_pending batches are held in memory at a time.
+    Text destinations are formatted in parallel by n_workers processes, see SpectralLibrary.parallel_write. Other
+    destinations are written by a single writer, while the source is parsed by a separate thread.
+
+    Note that fragments are filtered again by the destination, e.g. using min_intensity_threshold, and that
+    information missing in the source, e.g. collision energies of DLib libraries, is missing in the destination.
+    Sources without fragment annotations, i.e. DLib, can only be converted to formats that do not need them, i.e.
+    MSP and DLib. Converting them to Spectronaut or Parquet fails before anything is written.
+
+    :param src: the path of the source library
+    :param dst: the path of the destination library
+    :param batch_size: the number of precursors per batch
+    :param src_format: the format of the source library. If None, it is derived from the suffix of src.
+    :param dst_format: the format of the destination library. If None, it is derived from the suffix of dst.
+    :param src_custom_mods: optional dictionary mapping format-specific modification patterns of the source
+        (keys) to UNIMOD IDs (values)
+    :param dst_custom_mods: optional dictionary mapping format-specific modification patterns of the destination
+        (keys) to UNIMOD IDs (values)
+    :param n_workers: number of processes formatting text destinations. If None, the number of CPUs is used.
+    :param max_pending: the maximum number of batches parsed but not yet written. If None, twice the number of
+        workers is used for text destinations and 4 otherwise.
+    :param library_kwargs: keyword arguments passed to the destination library, e.g. min_intensity_threshold
+    :raises ValueError: if the source does not store fragment annotations, but the destination needs them
+    :raises Exception: the first exception raised while reading the source
+    :return: the number of converted precursors
+    """
+    reader_cls = get_spectral_library(src_format or infer_library_format(src))
+    writer_cls = get_spectral_library(dst_format or infer_library_format(dst))
+    if not reader_cls._stores_annotations and writer_cls._requires_annotations:
+        raise ValueError(
+            f"Cannot convert {src} to {dst}: {reader_cls.__name__} libraries do not store fragment annotations, "
+            f"which {writer_cls.__name__} libraries need to derive the fragment types and numbers."
+        )
+    reader = reader_cls(src)
+    writer = writer_cls(dst, **library_kwargs)
+    n_precursors = 0
+
+    def counted(batches: Iterable[Batch]) -> Iterable[Batch]:
+        nonlocal n_precursors
+        for data, metadata in batches:
+            n_precursors += len(metadata)
+            yield data, metadata
+
+    batches = counted(reader.read(batch_size=batch_size, custom_mods=src_custom_mods))
+    if writer._formats_text:
+        writer.parallel_write(batches, custom_mods=dst_custom_mods, n_workers=n_workers, max_pending=max_pending)
+    else:
+        _write_from_thread(writer, batches, dst_custom_mods, max_pending or 4)
+    logger.info(f"Converted {n_precursors} precursors from {src} to {dst}")
+    return n_precursors
+
+
+def _put(batch_queue: queue.Queue, content: Any, done: threading.Event) -> bool:
+    """Put content into the queue, giving up once the writer returned, e.g. because it failed."""
+    while not done.is_set():
+        try:
+            batch_queue.put(content, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(batches: Iterable[Batch], batch_queue: queue.Queue, done: threading.Event, errors: List[Exception]):
+    try:
+        for batch in batches:
+            if not _put(batch_queue, batch, done):
+                return
+    except Exception as e:
+        errors.append(e)
+    _put(batch_queue, None, done)
+
+
+def _write_from_thread(
+    writer: SpectralLibrary, batches: Iterable[Batch], custom_mods: Optional[Dict[str, int]], max_pending: int
+):
+    """Parse the batches in a separate thread, which feeds the async_write of the writer using a bounded queue."""
+    batch_queue: queue.Queue = queue.Queue(maxsize=max_pending)
+    errors: List[Exception] = []
+    done = threading.Event()
+
+    reader = threading.Thread(target=_produce, args=(batches, batch_queue, done, errors), name="library_reader")
+    reader.start()
+    try:
+        writer.async_write(batch_queue, SimpleNamespace(value=0), custom_mods)
+    finally:
+        done.set()
+        reader.join()
+    if errors:
+        raise errors[0]
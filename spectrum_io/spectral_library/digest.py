@@ -1,10 +1,11 @@
 import argparse
 import collections
 import csv
+import functools
 import itertools
 import logging
 import sys
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 import numpy as np
 
@@ -424,24 +425,48 @@ def semi_specific_digest(seq, min_len, max_len, pre, not_post, miscleavages, met
                     yield (seq[start : i + 1])
 
 
+@functools.lru_cache(maxsize=64)
+def _residue_table(residues: Tuple[str, ...]) -> np.ndarray:
+    """Create a lookup table over all byte values marking the given single residues, e.g. the pre list of an enzyme."""
+    table = np.zeros(256, dtype=bool)
+    table[[ord(residue) for residue in residues if len(residue) == 1 and ord(residue) < 128]] = True
+    return table
+
+
 def full_digest(seq, min_len, max_len, pre, not_post, miscleavages, methionine_cleavage):
-    """Generate full digestion."""
-    len_s, starts = len(seq), [0]
+    """
+    Generate full digestion.
+
+    Cleavage sites are found with array lookups and all (start, end) pairs up to the allowed number of
+    miscleavages are enumerated with array operations, yielding peptides ordered by end site and start.
+    """
+    len_s = len(seq)
     methionine_cleavage = methionine_cleavage and seq[0] == "M"
-    length_accepted = lambda x: x >= min_len and x <= max_len
 
-    cleavage_sites = [0] if methionine_cleavage else []
-    cleavage_sites.extend([i for i in range(len_s) if seq[i] in pre and seq[min([len_s - 1, i + 1])] not in not_post])
-    cleavage_sites.append(len_s)
-    for i in cleavage_sites:
-        for start in starts:
-            len_p = i - start + 1
-            if length_accepted(len_p):
-                yield (seq[start : i + 1])
-        starts.append(i + 1)
-        methionine_cleaved = int(starts[0] == 0 and methionine_cleavage)
-        if len(starts) > miscleavages + 1 + methionine_cleaved:
-            starts = starts[1 + methionine_cleaved :]
+    # non-ascii characters are replaced by '?', which keeps the positions and never matches a residue
+    residues = np.frombuffer(seq.encode("ascii", errors="replace"), dtype=np.uint8)
+    # the last residue is compared with itself instead of its (missing) successor
+    successors = np.concatenate([residues[1:], residues[-1:]])
+    is_site = _residue_table(tuple(pre))[residues] & ~_residue_table(tuple(not_post))[successors]
+    sites = np.concatenate([[0] if methionine_cleavage else [], np.flatnonzero(is_site), [len_s]]).astype(np.int64)
+    site_starts = np.concatenate([[0], sites[:-1] + 1])
+
+    # site k ends the peptides starting at the site_starts first_start[k], ..., k
+    site_idx = np.arange(len(sites))
+    first_start = np.maximum(site_idx - miscleavages, 0)
+    if methionine_cleavage:
+        first_start[: miscleavages + 2] = 0
+    n_starts = site_idx - first_start + 1
+    end_idx = np.repeat(site_idx, n_starts)
+    start_idx = np.repeat(first_start - np.cumsum(n_starts) + n_starts, n_starts) + np.arange(n_starts.sum())
+
+    starts = site_starts[start_idx]
+    ends = sites[end_idx] + 1
+    # the peptide length is derived from the site, which is one past the sequence for the final site
+    lengths = ends - starts
+    accepted = (lengths >= min_len) & (lengths <= max_len)
+    for start, end in zip(starts[accepted].tolist(), ends[accepted].tolist()):
+        yield seq[start:end]
 
 
 def get_peptide_to_protein_map(
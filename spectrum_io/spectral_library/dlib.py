@@ -1,12 +1,17 @@
+import os
 import sqlite3
 import zlib
-from typing import IO, Dict, Union
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import islice
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from spectrum_fundamentals.constants import PARTICLE_MASSES
 
-from .spectral_library import SpectralLibrary
+from .reading import LibraryEntry, SequenceConverter, entries_to_batch
+from .spectral_library import Fragments, SpectralLibrary, parse_mods, replace_mods
 
 DLIB_COL_NAMES = [
     "MassArray",
@@ -20,10 +25,94 @@ DLIB_COL_NAMES = [
     "PrecursorMz",
 ]
 
+SQL_INSERT_ENTRIES = (
+    f"INSERT INTO entries ({', '.join(DLIB_COL_NAMES)}) VALUES ({', '.join('?' * len(DLIB_COL_NAMES))})"
+)
+# mappings are written once per peptide and protein, the unique index lets sqlite skip the repeated ones
+SQL_INSERT_P2P = "INSERT OR IGNORE INTO peptidetoprotein (PeptideSeq, ProteinAccession) VALUES (?, ?)"
+P2P_UNIQUE_INDEX = "PeptideSeq_ProteinAccession_PeptideToProtein_index"
+SQL_CREATE_P2P_UNIQUE_INDEX = (
+    f"CREATE UNIQUE INDEX '{P2P_UNIQUE_INDEX}' ON 'peptidetoprotein' ('PeptideSeq' ASC, 'ProteinAccession' ASC)"
+)
+# libraries written before the unique index was introduced may contain repeated mappings
+SQL_DELETE_DUPLICATE_P2P = (
+    "DELETE FROM peptidetoprotein WHERE rowid NOT IN "
+    "(SELECT MIN(rowid) FROM peptidetoprotein GROUP BY PeptideSeq, ProteinAccession)"
+)
+
+# indices used by EncyclopeDIA, created only once all entries are written since maintaining them slows down inserts
+DLIB_INDICES = {
+    "Key_Metadata_index": "'metadata' ('Key' ASC)",
+    "PeptideModSeq_PrecursorCharge_SourceFile_Entries_index": "'entries' "
+    "('PeptideModSeq' ASC, 'PrecursorCharge' ASC, 'SourceFile' ASC)",
+    "PeptideSeq_Entries_index": "'entries' ('PeptideSeq' ASC)",
+    "PrecursorMz_Entries_index": "'entries' ('PrecursorMz' ASC)",
+    "ProteinAccession_PeptideToProtein_index": "'peptidetoprotein' ('ProteinAccession' ASC)",
+    "PeptideSeq_PeptideToProtein_index": "'peptidetoprotein' ('PeptideSeq' ASC)",
+}
+SQL_CREATE_INDICES = [f"CREATE INDEX IF NOT EXISTS '{name}' ON {columns}" for name, columns in DLIB_INDICES.items()]
+SQL_DROP_INDICES = [f"DROP INDEX IF EXISTS '{name}'" for name in DLIB_INDICES]
+
+# settings for bulk loading a new library: no rollback journal and no fsync, as an interrupted write leaves an
+# unusable library anyway. Existing libraries and resumable writes keep the journal, so the batches committed
+# before an interruption stay intact.
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+}
+CACHE_PRAGMAS = {
+    "cache_size": -262144,  # negative values are in KiB, i.e. 256 MiB
+    "temp_store": "MEMORY",
+}
+
+DEFAULT_INSERT_BATCH_SIZE = 10000
+
+SQL_SELECT_ENTRIES = (
+    "SELECT PeptideModSeq, PeptideSeq, PrecursorCharge, PrecursorMz, RTInSeconds, "
+    "(SELECT group_concat(ProteinAccession, ';') FROM peptidetoprotein p WHERE p.PeptideSeq = e.PeptideSeq), "
+    "MassArray, IntensityArray FROM entries e"
+)
+
+
+def _batched(rows: Iterable[Tuple], batch_size: int) -> Iterable[List[Tuple]]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+# below this number of blobs, compressing in a single thread is faster than distributing the work
+PARALLEL_COMPRESSION_MIN_BLOBS = 2048
+
+
+def _compress_chunk(blobs: List[bytes]) -> List[bytes]:
+    return [zlib.compress(blob) for blob in blobs]
+
+
+def _compress_all(blobs: List[bytes]) -> List[bytes]:
+    """
+    Compress blobs using zlib, in parallel for large batches.
+
+    :param blobs: the uncompressed blobs
+    :return: the compressed blobs in the same order
+    """
+    n_workers = min(os.cpu_count() or 1, 8)
+    if len(blobs) < PARALLEL_COMPRESSION_MIN_BLOBS or n_workers == 1:
+        return _compress_chunk(blobs)
+    chunk_size = -(-len(blobs) // n_workers)
+    chunks = [blobs[i : i + chunk_size] for i in range(0, len(blobs), chunk_size)]
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        return [blob for chunk in executor.map(_compress_chunk, chunks) for blob in chunk]
+
 
 class DLib(SpectralLibrary):
     """Main to init a DLib obj."""
 
+    _formats_text = False
+    _stores_annotations = False
+    _requires_annotations = False
+    # whether the indices are dropped while inserting, which async_write sets for all of its batches
+    _bulk_load = False
+
     @property
     def standard_mods(self) -> Dict[str, int]:
         """Standard modifications that are always applied if not otherwise specified."""
@@ -41,48 +130,198 @@ class DLib(SpectralLibrary):
             raise TypeError("Not supported. Use msp/spectronaut if you want to write a text file.")
         if self.mode == "w":
             DLib._create_database(out)
+        if not out.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (P2P_UNIQUE_INDEX,)).fetchone():
+            out.execute(SQL_DELETE_DUPLICATE_P2P)
+            out.execute(SQL_CREATE_P2P_UNIQUE_INDEX)
+        if self._bulk_load:
+            # indices of an existing library are recreated by _finalize once all batches are inserted
+            for sql_drop_index in SQL_DROP_INDICES:
+                out.execute(sql_drop_index)
+        out.commit()
+
+    def async_write(self, *args, **kwargs):
+        """
+        Asynchronously write content to the output file from a queue, see SpectralLibrary.async_write.
+
+        The indices of an existing library are dropped before the first batch and recreated once after the last
+        one. Single calls of write instead keep them, since rebuilding them for every batch appended to a growing
+        library takes quadratic time.
+
+        :param args: positional arguments passed to SpectralLibrary.async_write
+        :param kwargs: keyword arguments passed to SpectralLibrary.async_write
+        """
+        self._bulk_load = True
+        try:
+            super().async_write(*args, **kwargs)
+        finally:
+            self._bulk_load = False
 
     def _get_handle(self):
-        return sqlite3.connect(self.out_path)
+        if self.resume or self.out_path.exists():
+            pragmas = CACHE_PRAGMAS
+        else:
+            pragmas = BULK_LOAD_PRAGMAS | CACHE_PRAGMAS
+        conn = sqlite3.connect(self.out_path)
+        for pragma, value in pragmas.items():
+            conn.execute(f"PRAGMA {pragma}={value}")
+        return closing(conn)
+
+    def _finalize(self, out: Union[IO, sqlite3.Connection]):
+        for sql_create_index in SQL_CREATE_INDICES:
+            out.execute(sql_create_index)
+        out.commit()
+
+    def _checkpoint_state(self, out: Union[IO, sqlite3.Connection]) -> Dict[str, Any]:
+        # every batch is written in its own transaction, so the last rowids mark a consistent point
+        (entries_rowid,) = out.execute("SELECT COALESCE(MAX(rowid), 0) FROM entries").fetchone()
+        (p2p_rowid,) = out.execute("SELECT COALESCE(MAX(rowid), 0) FROM peptidetoprotein").fetchone()
+        return {"entries_rowid": entries_rowid, "p2p_rowid": p2p_rowid}
+
+    def _restore_checkpoint(self, state: Dict[str, Any]):
+        with closing(sqlite3.connect(self.out_path)) as conn:
+            conn.execute("DELETE FROM entries WHERE rowid > ?", (state["entries_rowid"],))
+            conn.execute("DELETE FROM peptidetoprotein WHERE rowid > ?", (state["p2p_rowid"],))
+            conn.commit()
+
+    def read(
+        self, batch_size: int = 10000, custom_mods: Optional[Dict[str, int]] = None
+    ) -> Iterator[Tuple[Dict[str, np.ndarray], pd.DataFrame]]:
+        """
+        Read the library at the output path in batches, see SpectralLibrary.read.
+
+        DLib libraries neither store fragment annotations nor collision energies, so the annotations are empty and
+        the collision energies are NaN.
+
+        :param batch_size: the number of precursors per batch
+        :param custom_mods: optional dictionary mapping libary format-specific modification patterns (keys)
+            to UNIMOD IDs (values), used to convert modified sequences back to the internal format
+        :yield: tuples of data and metadata
+        """
+        yield from self._select(f"{SQL_SELECT_ENTRIES} ORDER BY e.rowid", (), batch_size, custom_mods)
 
-    def _calculate_masked_values(self, fragmentmz: np.ndarray, intensities: np.ndarray):
+    def build_index(self, custom_mods: Optional[Dict[str, int]] = None):
         """
-        Internal function that masks, filters, byte encodes, swaps and compresses fragmentmz \
+        Create the indices of the entries table used by lookup_mz and lookup_sequence, see SQL_CREATE_INDICES.
+
+        :param custom_mods: unused, since the indices are created on the library itself
+        """
+        with closing(sqlite3.connect(self.out_path)) as conn:
+            for sql_create_index in SQL_CREATE_INDICES:
+                conn.execute(sql_create_index)
+            conn.commit()
+
+    def lookup_mz(
+        self, lower: float, upper: float, custom_mods: Optional[Dict[str, int]] = None
+    ) -> Tuple[Dict[str, np.ndarray], pd.DataFrame]:
+        """
+        Read the entries with a precursor m/z between lower and upper (inclusive), see SpectralLibrary.lookup_mz.
+
+        :param lower: the lower precursor m/z bound
+        :param upper: the upper precursor m/z bound
+        :param custom_mods: optional dictionary mapping libary format-specific modification patterns (keys)
+            to UNIMOD IDs (values)
+        :return: data and metadata of the entries in ascending precursor m/z order
+        """
+        sql = f"{SQL_SELECT_ENTRIES} WHERE e.PrecursorMz BETWEEN ? AND ? ORDER BY e.PrecursorMz"
+        return self._select_all(sql, (lower, upper), custom_mods)
+
+    def lookup_sequence(
+        self, modified_sequence: str, charge: Optional[int] = None, custom_mods: Optional[Dict[str, int]] = None
+    ) -> Tuple[Dict[str, np.ndarray], pd.DataFrame]:
+        """
+        Read the entries of a modified sequence, see SpectralLibrary.lookup_sequence.
+
+        :param modified_sequence: the modified sequence in internal format, e.g. 'AAAC[UNIMOD:4]K'
+        :param charge: optional precursor charge of the entries
+        :param custom_mods: optional dictionary mapping libary format-specific modification patterns (keys)
+            to UNIMOD IDs (values)
+        :return: data and metadata of the entries
+        """
+        mods = parse_mods(self.standard_mods | (custom_mods or {}))
+        dlib_sequence = replace_mods(pd.Series([modified_sequence]), mods)[0]
+        sql = f"{SQL_SELECT_ENTRIES} WHERE e.PeptideModSeq = ?"
+        params: Tuple[Any, ...] = (dlib_sequence,)
+        if charge is not None:
+            sql += " AND e.PrecursorCharge = ?"
+            params += (charge,)
+        return self._select_all(sql, params, custom_mods)
+
+    def _select_all(
+        self, sql: str, params: Tuple[Any, ...], custom_mods: Optional[Dict[str, int]]
+    ) -> Tuple[Dict[str, np.ndarray], pd.DataFrame]:
+        batches = list(self._select(sql, params, None, custom_mods))
+        return batches[0] if batches else entries_to_batch([])
+
+    def _select(
+        self, sql: str, params: Tuple[Any, ...], batch_size: Optional[int], custom_mods: Optional[Dict[str, int]]
+    ) -> Iterator[Tuple[Dict[str, np.ndarray], pd.DataFrame]]:
+        """
+        Internal function reading the entries selected by a query in batches.
+
+        :param sql: the query, selecting the columns of SQL_SELECT_ENTRIES
+        :param params: the parameters of the query
+        :param batch_size: the number of precursors per batch. If None, all entries are returned in one batch.
+        :param custom_mods: optional dictionary mapping libary format-specific modification patterns (keys)
+            to UNIMOD IDs (values)
+        :yield: tuples of data and metadata
+        """
+        to_internal = SequenceConverter(self._reading_mods(custom_mods))
+        with closing(sqlite3.connect(self.out_path)) as conn:
+            cursor = conn.execute(sql, params)
+            while rows := (cursor.fetchmany(batch_size) if batch_size else cursor.fetchall()):
+                yield entries_to_batch([DLib._to_entry(row, to_internal) for row in rows])
+                if not batch_size:
+                    return
+
+    @staticmethod
+    def _to_entry(row: Tuple[Any, ...], to_internal: SequenceConverter) -> LibraryEntry:
+        modseq, seq, p_charge, p_mz, irt, proteins, mass_blob, intensity_blob = row
+        mz = np.frombuffer(zlib.decompress(mass_blob), dtype=">f8")
+        intensities = np.frombuffer(zlib.decompress(intensity_blob), dtype=">f4") / 100
+        return LibraryEntry(
+            modified_sequence=to_internal(modseq),
+            sequence=seq,
+            charge=p_charge,
+            precursor_mz=p_mz,
+            irt=irt,
+            collision_energy=np.nan,
+            proteins=proteins or "",
+            mz=mz.tolist(),
+            intensities=intensities.tolist(),
+            annotations=[b""] * len(mz),
+        )
+
+    def _calculate_masked_values(self, fragments: Fragments):
+        """
+        Internal function that sorts, byte encodes, swaps and compresses the selected fragment m/z \
         and intensities.
 
+        Sorting by fragment m/z and conversion to big-endian are done for the flat arrays of the whole
+        batch at once. Only the compression is done per peptide, using a thread pool for large batches,
+        since zlib releases the GIL while compressing.
+
         This will produce the data for the following columns in this order:
             - 'MassArray'
             - 'IntensityArray',
             - 'MassEncodedLength',
             - 'IntensityEncodedLength'.
-        :param fragmentmz: fragmentmz provided in __init__
-        :param intensities: intensities provided in __init__
+        :param fragments: the fragments selected by _select_fragments
         :return: 4 lists as described above
         """
-        mz_bytes_list = []
-        i_bytes_list = []
-        mz_lengths = []
-        i_lengths = []
-
-        full_mask = self._fragment_filter_passed(fragmentmz, intensities)
-        for mz, i, mask in zip(fragmentmz, intensities, np.array(full_mask)):
-            # mask to only existing peaks
-            sort_index = np.argsort(mz[mask])
-            masked_mz_ordered = mz[mask][sort_index]
-            masked_i_ordered = i[mask][sort_index]
-
-            # convert arrays to big-endian byte blops
-            masked_mz_ordered = np.array(masked_mz_ordered, dtype=np.double)
-            masked_i_ordered = np.array(masked_i_ordered * 100, dtype=np.float32)
-            masked_mz_ordered.byteswap(inplace=True)
-            masked_i_ordered.byteswap(inplace=True)
-            bytes_mz = bytes(masked_mz_ordered)
-            bytes_i = bytes(masked_i_ordered)
-            mz_bytes_list.append(zlib.compress(bytes_mz))
-            i_bytes_list.append(zlib.compress(bytes_i))
-            mz_lengths.append(len(bytes_mz))
-            i_lengths.append(len(bytes_i))
-        return mz_bytes_list, i_bytes_list, mz_lengths, i_lengths
+        n_peaks = fragments.n_peaks
+        offsets = fragments.offsets.tolist()
+
+        # sort by peptide first and by m/z within each peptide
+        peptide_idx = np.repeat(np.arange(len(n_peaks)), n_peaks)
+        sort_index = np.lexsort((fragments.mz, peptide_idx))
+        mz_ordered = fragments.mz[sort_index].astype(">f8")
+        i_ordered = (fragments.intensities[sort_index] * 100).astype(">f4")
+
+        mz_blobs = [mz_ordered[start:end].tobytes() for start, end in zip(offsets[:-1], offsets[1:])]
+        i_blobs = [i_ordered[start:end].tobytes() for start, end in zip(offsets[:-1], offsets[1:])]
+        mz_lengths = (n_peaks * mz_ordered.itemsize).tolist()
+        i_lengths = (n_peaks * i_ordered.itemsize).tolist()
+        return _compress_all(mz_blobs), _compress_all(i_blobs), mz_lengths, i_lengths
 
     @staticmethod
     def _create_database(conn: sqlite3.Connection):
@@ -135,6 +374,26 @@ class DLib(SpectralLibrary):
         c.execute(sql_insert_meta, ["staleProteinMapping", "true"])
         conn.commit()
 
+    @staticmethod
+    def _peptide_to_protein(seqs: pd.Series, pr_ids: pd.Series) -> List[Tuple[str, str]]:
+        """
+        Internal function that returns the peptide to protein mappings of a batch.
+
+        Protein ids of a precursor are split at ';' into separate mappings. Precursors without protein ids are
+        skipped. Mappings repeated for several charges and collision energies of a peptide or already written in
+        a previous batch are ignored when inserting, see SQL_INSERT_P2P.
+
+        :param seqs: the stripped peptide sequences of the batch
+        :param pr_ids: the ';'-separated protein ids of the batch, which may be missing
+        :return: the list of (PeptideSeq, ProteinAccession) tuples to be written
+        """
+        return [
+            (seq, protein)
+            for seq, proteins in zip(seqs.tolist(), pr_ids.fillna("").tolist())
+            for protein in proteins.split(";")
+            if protein
+        ]
+
     def _write(
         self,
         out: Union[IO, sqlite3.Connection],
@@ -145,7 +404,7 @@ class DLib(SpectralLibrary):
         if isinstance(out, IO):
             raise TypeError("Not supported. Use msp/spectronaut if you want to write a text file.")
         seqs = metadata["SEQUENCE"]
-        modseqs = metadata["MODIFIED_SEQUENCE"].replace(mods, regex=True)
+        modseqs = self._convert_mods(metadata["MODIFIED_SEQUENCE"], mods, replace_mods)
         # mass_mod_sequences = internal_to_mod_mass(modseqs)#, custom_mods)
         # print(mass_mod_sequences, "masmodseq")
 
@@ -157,21 +416,20 @@ class DLib(SpectralLibrary):
 
         # prepare spectra
         irts = data["irt"][:, 0]  # should create a 1D view of the (n_peptides, 1) shaped array
-        f_mzss = data["mz"]
-        f_intss = data["intensities"]
         # f_annotss = data["annotation"].astype("S", copy=False)
 
-        masked_values = self._calculate_masked_values(f_mzss, f_intss)
+        masked_values = self._calculate_masked_values(self._select_fragments(data))
 
-        data_list = [*masked_values, p_charges, modseqs, seqs, irts, p_mzs]
-        entries = pd.DataFrame(dict(zip(DLIB_COL_NAMES, data_list)))
-        p2p = pd.DataFrame({"PeptideSeq": seqs, "ProteinAccession": pr_ids})
+        data_list = [*masked_values, p_charges.tolist(), modseqs, seqs.tolist(), irts.tolist(), p_mzs.tolist()]
+        entries = zip(*data_list)
+        p2p = DLib._peptide_to_protein(seqs, pr_ids)
+        batch_size = self.chunksize or DEFAULT_INSERT_BATCH_SIZE
 
         out.execute("BEGIN")
-
-        entries.to_sql(index=False, name="entries", con=out, if_exists="append", method="multi")
-        p2p.to_sql(index=False, name="peptidetoprotein", con=out, if_exists="append", method="multi")
-
+        for batch in _batched(entries, batch_size):
+            out.executemany(SQL_INSERT_ENTRIES, batch)
+        for batch in _batched(p2p, batch_size):
+            out.executemany(SQL_INSERT_P2P, batch)
         out.commit()
         # conn.close()
 
@@ -1,17 +1,27 @@
+import re
 from sqlite3 import Connection
-from typing import IO, Dict, Union
+from typing import IO, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from spectrum_fundamentals.constants import PARTICLE_MASSES
 from spectrum_fundamentals.mod_string import internal_to_msp
 
+from .reading import LibraryEntry
 from .spectral_library import SpectralLibrary
 
+COMMENT_PATTERN = re.compile(
+    r"Parent=(?P<p_mz>\S+) Collision_energy=(?P<ce>\S+) Protein_ids=(?P<proteins>.*) Mods=(?P<mods>\S+) "
+    r"ModString=.* iRT=(?P<irt>\S+)$"
+)
+
 
 class MSP(SpectralLibrary):
     """Main to initialze a MSP obj."""
 
+    # fragments without annotation are written with an empty peak annotation
+    _requires_annotations = False
+
     @property
     def standard_mods(self) -> Dict[str, int]:
         """Standard modifications that are always applied if not otherwise specified."""
@@ -25,9 +35,74 @@ class MSP(SpectralLibrary):
         }
 
     @staticmethod
-    def _assemble_fragment_string(f_mz: float, f_int: float, f_a: bytes):
+    def _fragment_suffix(f_a: bytes) -> str:
         annot = f_a[:-2].decode() if f_a.endswith(b"1") else f_a.replace(b"+", b"^").decode()
-        return f'{f_mz:.8f}\t{f_int:.4f}\t"{annot}/0.0ppm"\n'
+        return f'\t"{annot}/0.0ppm"\n'
+
+    @staticmethod
+    def _parse_fragment_suffix(f_annot: bytes) -> bytes:
+        """Inverse of _fragment_suffix, e.g. b'"y2^2/0.0ppm"' -> b'y2+2' and b'"b1/0.0ppm"' -> b'b1+1'."""
+        annot = f_annot.strip(b'"').split(b"/", 1)[0]
+        return annot.replace(b"^", b"+") if b"^" in annot else annot + b"+1"
+
+    def _reading_mods(self, custom_mods: Optional[Dict[str, int]]) -> Dict[str, str]:
+        # maps the replacement in the Mods field, e.g. 'C,Carbamidomethyl' or ',TMT_6', to the internal format
+        return {
+            k if k[0] != "^" else k[1:]: f"[UNIMOD:{v}]" for k, v in (self.standard_mods | (custom_mods or {})).items()
+        }
+
+    @staticmethod
+    def _to_internal(sequence: str, mods_field: str, mods: Dict[str, str]) -> str:
+        """
+        Internal function rebuilding the modified sequence in internal format from the Mods field of an entry.
+
+        :param sequence: the stripped peptide sequence
+        :param mods_field: the Mods field, e.g. '2/0,,TMT_6/3,C,Carbamidomethyl'
+        :param mods: the mapping returned by _reading_mods
+        :return: the modified sequence, e.g. '[UNIMOD:737]-AAC[UNIMOD:4]K'
+        """
+        residues = list(sequence)
+        n_term = ""
+        shift = 0
+        for mod in mods_field.split("/")[1:]:
+            pos, replacement = mod.split(",", 1)
+            if replacement[0] == ",":
+                # the n-terminal modification counts as an additional position before the first residue
+                n_term = f"{mods[replacement]}-"
+                shift = 1
+            else:
+                residues[int(pos) - shift] += mods[replacement]
+        return n_term + "".join(residues)
+
+    def _parse_entries(self, f: BinaryIO, mods: Dict[str, str]) -> Iterator[Tuple[int, LibraryEntry]]:
+        offset = f.tell()
+        lines = iter(f)
+        for line in lines:
+            start = offset
+            offset += len(line)
+            if not line.startswith(b"Name: "):
+                continue
+            sequence, charge = line[6:].decode().rstrip().rsplit("/", 1)
+            header: List[bytes] = [next(lines) for _ in range(3)]  # MW, Comment and Num peaks
+            peaks = [next(lines) for _ in range(int(header[2][len(b"Num peaks: ") :]))]
+            offset += sum(map(len, header)) + sum(map(len, peaks))
+
+            comment = COMMENT_PATTERN.search(header[1].decode().rstrip())
+            if comment is None:
+                raise ValueError(f"Malformed comment of {sequence}/{charge}: {header[1]!r}")
+            fragments = [peak.rstrip().split(b"\t") for peak in peaks]
+            yield start, LibraryEntry(
+                modified_sequence=MSP._to_internal(sequence, comment["mods"], mods),
+                sequence=sequence,
+                charge=int(charge),
+                precursor_mz=float(comment["p_mz"]),
+                irt=float(comment["irt"]),
+                collision_energy=float(comment["ce"]),
+                proteins=comment["proteins"],
+                mz=[float(f_mz) for f_mz, _, _ in fragments],
+                intensities=[float(f_int) for _, f_int, _ in fragments],
+                annotations=[MSP._parse_fragment_suffix(f_annot) for _, _, f_annot in fragments],
+            )
 
     def _write(
         self,
@@ -40,7 +115,7 @@ class MSP(SpectralLibrary):
         if isinstance(out, Connection):
             raise TypeError("Not supported. Use DLib if you want to write a database file.")
         stripped_peptides = metadata["SEQUENCE"]
-        mod_fieldss = internal_to_msp(metadata["MODIFIED_SEQUENCE"], mods)
+        mod_fieldss = self._convert_mods(metadata["MODIFIED_SEQUENCE"], mods, internal_to_msp)
         p_charges = metadata["PRECURSOR_CHARGE"]
         p_mzs = (metadata["MASS"] + (p_charges * PARTICLE_MASSES["PROTON"])) / p_charges
         ces = metadata["COLLISION_ENERGY"]
@@ -48,29 +123,32 @@ class MSP(SpectralLibrary):
 
         # prepare spectra
         irts = data["irt"][:, 0]  # should create a 1D view of the (n_peptides, 1) shaped array
-        f_mzss = data["mz"]
-        f_intss = data["intensities"]
-        f_annotss = data["annotation"]
+        fragments = self._select_fragments(data)
+        n_peaks = fragments.n_peaks
+        # the annotation vocabulary is tiny, so each distinct annotation is converted only once
+        annot_vocab, annot_idx = np.unique(fragments.annotation, return_inverse=True)
+        suffixes = np.array([MSP._fragment_suffix(annot) for annot in annot_vocab], dtype=object)
 
-        lines = []
-        vec_assemble = np.vectorize(MSP._assemble_fragment_string)
+        fragment_values = np.empty((len(annot_idx), 3), dtype=object)
+        fragment_values[:, 0] = fragments.mz
+        fragment_values[:, 1] = fragments.intensities
+        fragment_values[:, 2] = suffixes[annot_idx]
+        fragment_values = fragment_values.ravel().tolist()
+        ends = fragments.offsets[1:] * 3
 
-        for stripped_peptide, p_charge, p_mz, ce, pr_id, mod_fields, irt, f_mzs, f_ints, f_annots in zip(
-            stripped_peptides, p_charges, p_mzs, ces, pr_ids, mod_fieldss, irts, f_mzss, f_intss, f_annotss
+        lines = []
+        for stripped_peptide, p_charge, p_mz, ce, pr_id, mod_fields, irt, n, end in zip(
+            stripped_peptides, p_charges, p_mzs, ces, pr_ids, mod_fieldss, irts, n_peaks, ends
         ):
             lines.append(f"Name: {stripped_peptide}/{p_charge}\nMW: {p_mz}\n")
             lines.append(
                 f"Comment: Parent={p_mz:.8f} Collision_energy={ce} Protein_ids={pr_id} Mods={mod_fields[0]} "
                 f"ModString={stripped_peptide}//{mod_fields[1]}/{p_charge} iRT={irt:.2f}\n"
             )
-
-            cond = self._fragment_filter_passed(f_mzs, f_ints)
-            fragment_list = vec_assemble(f_mzs[cond], f_ints[cond], f_annots[cond])
-
-            lines.append(f"Num peaks: {len(fragment_list)}\n")
-
-            lines.extend(fragment_list)
-        out.writelines(lines)
+            lines.append(f"Num peaks: {n}\n")
+            # format all fragments of the peptide with a single call instead of one f-string per fragment
+            lines.append(("%.8f\t%.4f%s" * n) % tuple(fragment_values[end - 3 * n : end]))
+        out.write("".join(lines))
 
     def _initialize(self, out: Union[IO, Connection]):
         pass
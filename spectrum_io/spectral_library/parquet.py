@@ -0,0 +1,142 @@
+from sqlite3 import Connection
+from typing import IO, Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from spectrum_fundamentals.constants import PARTICLE_MASSES
+
+from .spectral_library import SpectralLibrary, parse_fragment_annotation, replace_mods
+
+SCHEMA = pa.schema(
+    [
+        ("ModifiedPeptide", pa.string()),
+        ("StrippedPeptide", pa.string()),
+        ("PrecursorCharge", pa.int8()),
+        ("PrecursorMz", pa.float64()),
+        ("iRT", pa.float32()),
+        ("CollisionEnergy", pa.float32()),
+        ("ProteinIds", pa.string()),
+        ("RelativeFragmentIntensity", pa.float32()),
+        ("FragmentMz", pa.float64()),
+        ("FragmentNumber", pa.int16()),
+        ("FragmentType", pa.dictionary(pa.int8(), pa.string())),
+        ("FragmentCharge", pa.int8()),
+        ("FragmentLossType", pa.dictionary(pa.int8(), pa.string())),
+    ]
+)
+
+ARROW_SUFFIXES = (".arrow", ".feather", ".ipc")
+
+LibraryWriter = Union[pq.ParquetWriter, pa.ipc.RecordBatchFileWriter]
+
+
+class Parquet(SpectralLibrary):
+    """
+    Main to initialze a Parquet obj.
+
+    The library is written in long format, i.e. one row per fragment with the columns of the Spectronaut csv
+    library, but using typed columns. Each written batch is stored as one row group. Libraries with one of the
+    suffixes in ARROW_SUFFIXES are written as Arrow IPC file with one record batch per written batch instead.
+    """
+
+    _formats_text = False
+    _resumable = False
+
+    @property
+    def standard_mods(self) -> Dict[str, int]:
+        """Standard modifications that are always applied if not otherwise specified."""
+        return {
+            "C[Carbamidomethyl (C)]": 4,
+            "M[Oxidation (O)]": 35,
+            "^[TMT_6]": 737,
+            "K[TMT_6]": 737,
+            "^[TMT_Pro]": 2016,
+            "K[TMT_Pro]": 2016,
+        }
+
+    def __init__(self, *args, compression: Optional[str] = "zstd", **kwargs):
+        """
+        Initialize a Parquet obj.
+
+        :param args: positional arguments passed to SpectralLibrary
+        :param compression: the compression codec used for Parquet files, or for the buffers of Arrow IPC files
+            ('lz4' or 'zstd'). Use None to disable compression.
+        :param kwargs: keyword arguments passed to SpectralLibrary
+        """
+        super().__init__(*args, compression=compression, **kwargs)
+        self._annotation_fields: Dict[bytes, Tuple[int, str, int, str]] = {}
+
+    def _get_handle(self) -> LibraryWriter:
+        if self.mode != "w":
+            raise ValueError(f"Mode {self.mode} not supported. Parquet and Arrow libraries can only be overwritten.")
+        if self.out_path.suffix.lower() in ARROW_SUFFIXES:
+            options = pa.ipc.IpcWriteOptions(compression=self.compression)
+            return pa.ipc.new_file(str(self.out_path), SCHEMA, options=options)
+        return pq.ParquetWriter(self.out_path, SCHEMA, compression=self.compression or "none")
+
+    def _initialize(self, out: Union[IO, Connection, LibraryWriter]):
+        pass
+
+    def _write(
+        self,
+        out: Union[IO, Connection, LibraryWriter],
+        data: Dict[str, np.ndarray],
+        metadata: pd.DataFrame,
+        mods: Dict[str, str],
+    ):
+        if not isinstance(out, (pq.ParquetWriter, pa.ipc.RecordBatchFileWriter)):
+            raise TypeError("Not supported. Use msp/spectronaut/dlib if you want to write a text or database file.")
+
+        # prepare metadata
+        modseqs = self._convert_mods(metadata["MODIFIED_SEQUENCE"], mods, replace_mods)
+        p_charges = metadata["PRECURSOR_CHARGE"]
+        p_mzs = (metadata["MASS"] + (p_charges * PARTICLE_MASSES["PROTON"])) / p_charges
+
+        # prepare spectra
+        fragments = self._select_fragments(data)
+        n_peaks = fragments.n_peaks
+        if not n_peaks.any():
+            return
+        annot_vocab, annot_idx = np.unique(fragments.annotation.astype("S", copy=False), return_inverse=True)
+        numbers, types, charges, losses = zip(*(self._fragment_annotation(annot) for annot in annot_vocab))
+
+        def repeat(values):
+            return np.repeat(np.asarray(values), n_peaks)
+
+        def categorical(values):
+            vocab, codes = np.unique(np.asarray(values)[annot_idx], return_inverse=True)
+            return pa.DictionaryArray.from_arrays(codes.astype(np.int8), vocab.tolist())
+
+        table = pa.table(
+            {
+                "ModifiedPeptide": repeat(modseqs),
+                "StrippedPeptide": repeat(metadata["SEQUENCE"]),
+                "PrecursorCharge": repeat(p_charges),
+                "PrecursorMz": repeat(p_mzs),
+                "iRT": repeat(data["irt"][:, 0]),
+                "CollisionEnergy": repeat(metadata["COLLISION_ENERGY"]),
+                "ProteinIds": repeat(metadata["PROTEINS"]),
+                "RelativeFragmentIntensity": fragments.intensities,
+                "FragmentMz": fragments.mz,
+                "FragmentNumber": np.asarray(numbers)[annot_idx],
+                "FragmentType": categorical(types),
+                "FragmentCharge": np.asarray(charges)[annot_idx],
+                "FragmentLossType": categorical(losses),
+            }
+        ).cast(SCHEMA)
+        out.write_table(table)
+
+    def _fragment_annotation(self, f_annot: bytes) -> Tuple[int, str, int, str]:
+        """
+        Return the fragment number, ion type, charge and neutral loss of an annotation, parsing it only once.
+
+        :param f_annot: the fragment annotation, e.g. b'y1+1' or b'b5+2-H2O'
+        :return: the parsed annotation, see parse_fragment_annotation
+        """
+        fields = self._annotation_fields.get(f_annot)
+        if fields is None:
+            fields = parse_fragment_annotation(f_annot)
+            self._annotation_fields[f_annot] = fields
+        return fields
@@ -0,0 +1,221 @@
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from spectrum_fundamentals.constants import PARTICLE_MASSES
+
+Batch = Tuple[Dict[str, np.ndarray], pd.DataFrame]
+
+
+class LibraryEntry(NamedTuple):
+    """A precursor read from a spectral library, with its fragments in the order they are stored."""
+
+    modified_sequence: str
+    sequence: str
+    charge: int
+    precursor_mz: float
+    irt: float
+    collision_energy: float
+    proteins: str
+    mz: List[float]
+    intensities: List[float]
+    annotations: List[bytes]
+
+
+def reverse_mods(mods: Dict[str, int]) -> Dict[str, str]:
+    """
+    Create the mapping from library format-specific modification patterns back to the internal format.
+
+    This is the inverse of parse_mods for formats that annotate modifications in brackets after the modified
+    residue, e.g. 'C[Carbamidomethyl (C)]' or 'C[+57.021464]', and at the start of the sequence for n-terminal
+    modifications, e.g. '[TMT_6]' for the pattern '^[TMT_6]'.
+
+    :param mods: Dictionary mapping library format-specific modification patterns (keys) to UNIMOD IDs (values)
+    :return: Dictionary mapping regular expressions of the library format to their internal replacement
+    """
+    regex_map = {}
+    for k, v in mods.items():
+        if k[0] == "^":
+            regex_map[f"^{re.escape(k[1:])}"] = f"[UNIMOD:{v}]-"
+        else:
+            regex_map[re.escape(k)] = f"{k[0]}[UNIMOD:{v}]"
+    return regex_map
+
+
+def entries_to_batch(entries: List[LibraryEntry]) -> Batch:
+    """
+    Convert library entries to a batch in the layout accepted by SpectralLibrary.write.
+
+    Spectra are padded to the highest number of fragments of the batch using an m/z of -1, which marks
+    fragments that are filtered out by the writers.
+
+    :param entries: the entries of the batch
+    :return: data and metadata of the batch
+    """
+    n_fragments = max((len(entry.mz) for entry in entries), default=0)
+    mz = np.full((len(entries), n_fragments), -1.0)
+    intensities = np.zeros((len(entries), n_fragments))
+    annotation = np.full((len(entries), n_fragments), b"", dtype=object)
+    for i, entry in enumerate(entries):
+        n = len(entry.mz)
+        mz[i, :n] = entry.mz
+        intensities[i, :n] = entry.intensities
+        annotation[i, :n] = entry.annotations
+
+    charges = np.array([entry.charge for entry in entries], dtype=int)
+    p_mzs = np.array([entry.precursor_mz for entry in entries], dtype=float)
+    metadata = pd.DataFrame(
+        {
+            "SEQUENCE": [entry.sequence for entry in entries],
+            "MODIFIED_SEQUENCE": [entry.modified_sequence for entry in entries],
+            "PRECURSOR_CHARGE": charges,
+            "MASS": p_mzs * charges - charges * PARTICLE_MASSES["PROTON"],
+            "COLLISION_ENERGY": [entry.collision_energy for entry in entries],
+            "PROTEINS": [entry.proteins for entry in entries],
+        }
+    )
+    data = {
+        "mz": mz,
+        "intensities": intensities,
+        "annotation": annotation.astype("S"),
+        "irt": np.array([[entry.irt] for entry in entries], dtype=float).reshape(-1, 1),
+    }
+    return data, metadata
+
+
+class TextIndex:
+    """
+    Index of the entries of a text library by precursor m/z and by modified sequence.
+
+    The byte offset of each entry is stored twice, sorted by precursor m/z and sorted by modified sequence, so both
+    kinds of lookups are binary searches. The index is saved as npz file next to the library.
+    """
+
+    def __init__(self, offsets: np.ndarray, precursor_mzs: np.ndarray, sequences: np.ndarray, charges: np.ndarray):
+        """
+        Initialize a TextIndex obj.
+
+        :param offsets: the byte offsets of the entries
+        :param precursor_mzs: the precursor m/z of the entries
+        :param sequences: the modified sequences of the entries in internal format
+        :param charges: the precursor charges of the entries
+        """
+        mz_order = np.argsort(precursor_mzs, kind="stable")
+        self.mz_offsets = offsets[mz_order]
+        self.mzs = precursor_mzs[mz_order]
+        seq_order = np.argsort(sequences, kind="stable")
+        self.seq_offsets = offsets[seq_order]
+        self.sequences = sequences[seq_order]
+        self.charges = charges[seq_order]
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Tuple[int, LibraryEntry]]) -> "TextIndex":
+        """
+        Build the index from the entries of a library.
+
+        :param entries: tuples of the byte offset and the entry
+        :return: the index
+        """
+        offsets, mzs, sequences, charges = [], [], [], []
+        for offset, entry in entries:
+            offsets.append(offset)
+            mzs.append(entry.precursor_mz)
+            sequences.append(entry.modified_sequence)
+            charges.append(entry.charge)
+        return cls(
+            np.array(offsets, dtype=np.int64),
+            np.array(mzs, dtype=float),
+            np.array(sequences, dtype=str),
+            np.array(charges, dtype=int),
+        )
+
+    def save(self, path: Union[str, Path]):
+        """
+        Save the index to a npz file.
+
+        :param path: the path of the npz file
+        """
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                mz_offsets=self.mz_offsets,
+                mzs=self.mzs,
+                seq_offsets=self.seq_offsets,
+                sequences=self.sequences,
+                charges=self.charges,
+            )
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "TextIndex":
+        """
+        Load an index saved with save.
+
+        :param path: the path of the npz file
+        :return: the index
+        """
+        index = cls.__new__(cls)
+        with np.load(path) as arrays:
+            for name in ["mz_offsets", "mzs", "seq_offsets", "sequences", "charges"]:
+                setattr(index, name, arrays[name])
+        return index
+
+    def find_mz(self, lower: float, upper: float) -> np.ndarray:
+        """
+        Find the entries with a precursor m/z in the closed interval [lower, upper].
+
+        :param lower: the lower precursor m/z bound
+        :param upper: the upper precursor m/z bound
+        :return: the byte offsets of the entries in ascending precursor m/z order
+        """
+        start = np.searchsorted(self.mzs, lower, side="left")
+        end = np.searchsorted(self.mzs, upper, side="right")
+        return self.mz_offsets[start:end]
+
+    def find_sequence(self, modified_sequence: str, charge: Optional[int] = None) -> np.ndarray:
+        """
+        Find the entries of a modified sequence.
+
+        :param modified_sequence: the modified sequence in internal format
+        :param charge: optional precursor charge of the entries
+        :return: the byte offsets of the entries
+        """
+        start = np.searchsorted(self.sequences, modified_sequence, side="left")
+        end = np.searchsorted(self.sequences, modified_sequence, side="right")
+        offsets = self.seq_offsets[start:end]
+        if charge is not None:
+            offsets = offsets[self.charges[start:end] == charge]
+        return offsets
+
+
+class SequenceConverter:
+    """Convert modified sequences using a mapping of regular expressions, caching the converted sequences."""
+
+    max_cache_size = 100000
+
+    def __init__(self, regex_map: Dict[str, str]):
+        """
+        Initialize a SequenceConverter obj.
+
+        :param regex_map: Dictionary mapping regular expressions to their replacement, e.g. created by reverse_mods
+        """
+        self._patterns = [(re.compile(pattern), replacement) for pattern, replacement in regex_map.items()]
+        self._cache: Dict[str, str] = {}
+
+    def __call__(self, sequence: str) -> str:
+        """
+        Convert a modified sequence.
+
+        :param sequence: the modified sequence
+        :return: the converted sequence
+        """
+        converted = self._cache.get(sequence)
+        if converted is None:
+            converted = sequence
+            for pattern, replacement in self._patterns:
+                converted = pattern.sub(replacement, converted)
+            if len(self._cache) >= self.max_cache_size:
+                self._cache.clear()
+            self._cache[sequence] = converted
+        return converted
@@ -0,0 +1,175 @@
+import json
+import logging
+import multiprocessing
+import queue
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type, Union
+
+import numpy as np
+import pandas as pd
+
+from .sorting import precursor_mz
+from .spectral_library import SpectralLibrary
+
+logger = logging.getLogger(__name__)
+
+SHARD_BY = ("mz", "hash")
+
+# typical precursor m/z range of DIA methods, used to derive equally wide m/z shards if no boundaries are given
+DEFAULT_MZ_RANGE = (300.0, 1800.0)
+
+
+class ShardedLibrary:
+    """
+    Write a spectral library split into several shards, each written by its own process.
+
+    Precursors are assigned to shards either by precursor m/z, so that downstream searches can load only the m/z
+    ranges they need, or by a hash of the modified sequence, which keeps all charge states of a peptide in the
+    same shard and balances the shards. A manifest describing the shards is written next to them.
+    """
+
+    def __init__(
+        self,
+        library_cls: Type[SpectralLibrary],
+        output_path: Union[str, Path],
+        n_shards: int,
+        shard_by: str = "mz",
+        boundaries: Optional[Sequence[float]] = None,
+        max_pending: int = 4,
+        **library_kwargs: Any,
+    ):
+        """
+        Initialize a ShardedLibrary obj.
+
+        :param library_cls: the SpectralLibrary subclass used to write the shards, e.g. MSP
+        :param output_path: path of the unsharded library, e.g. 'out/library.msp'. The shards are written to
+            'out/library.000.msp', 'out/library.001.msp', ... and the manifest to 'out/library.manifest.json'.
+        :param n_shards: the number of shards
+        :param shard_by: either 'mz' to shard by precursor m/z or 'hash' to shard by modified sequence
+        :param boundaries: the n_shards - 1 ascending precursor m/z values separating the shards if sharding by m/z.
+            If None, DEFAULT_MZ_RANGE is split into equally wide shards. Precursors outside of the range are written
+            to the first or last shard.
+        :param max_pending: the maximum number of batches waiting to be written per shard
+        :param library_kwargs: keyword arguments passed to library_cls, e.g. min_intensity_threshold
+        :raises ValueError: if shard_by is not supported or the boundaries do not match the number of shards
+        """
+        if shard_by not in SHARD_BY:
+            raise ValueError(f"Sharding by {shard_by} not understood. Supported are {SHARD_BY}.")
+        if boundaries is None:
+            boundaries = np.linspace(*DEFAULT_MZ_RANGE, n_shards + 1)[1:-1].tolist()
+        if len(boundaries) != n_shards - 1 or list(boundaries) != sorted(boundaries):
+            raise ValueError(f"{n_shards - 1} ascending boundaries are required for {n_shards} shards.")
+
+        output_path = Path(output_path)
+        stem, _, suffixes = output_path.name.partition(".")
+        self.library_cls = library_cls
+        self.n_shards = n_shards
+        self.shard_by = shard_by
+        self.boundaries = list(boundaries)
+        self.max_pending = max_pending
+        self.library_kwargs = library_kwargs
+        self.shard_paths = [output_path.with_name(f"{stem}.{i:03d}.{suffixes}") for i in range(n_shards)]
+        self.manifest_path = output_path.with_name(f"{stem}.manifest.json")
+
+    def assign_shards(self, metadata: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Assign the precursors of a batch to shards.
+
+        :param metadata: the metadata of the batch
+        :return: the shard index and precursor m/z of each precursor
+        """
+        p_mzs = precursor_mz(metadata)
+        if self.shard_by == "mz":
+            shards = np.searchsorted(self.boundaries, p_mzs, side="right")
+        else:
+            # crc32 is stable across processes and sessions, unlike hash()
+            shards = np.array([zlib.crc32(seq.encode()) % self.n_shards for seq in metadata["MODIFIED_SEQUENCE"]])
+        return shards, p_mzs
+
+    def write(
+        self,
+        batches: Iterable[Tuple[Dict[str, np.ndarray], pd.DataFrame]],
+        custom_mods: Optional[Dict[str, int]] = None,
+    ):
+        """
+        Split the batches into shards and write them in parallel, followed by the manifest.
+
+        :param batches: iterable of (data, metadata) tuples as accepted by SpectralLibrary.write. To consume
+            a queue as used by async_write, pass iter(queue.get, None).
+        :param custom_mods: optional dictionary mapping libary format-specific modification patterns (keys)
+            to UNIMOD IDs (values)
+        :raises RuntimeError: if the writer of a shard failed
+        """
+        queues = [multiprocessing.Queue(maxsize=self.max_pending) for _ in range(self.n_shards)]
+        progress = [multiprocessing.Value("i", 0) for _ in range(self.n_shards)]
+        writers = [
+            multiprocessing.Process(
+                target=self.library_cls(path, **self.library_kwargs).async_write,
+                args=(shard_queue, shard_progress, custom_mods),
+                name=f"shard_writer_{i}",
+            )
+            for i, (path, shard_queue, shard_progress) in enumerate(zip(self.shard_paths, queues, progress))
+        ]
+        stats = [{"n_precursors": 0, "min_precursor_mz": np.inf, "max_precursor_mz": -np.inf} for _ in writers]
+
+        for writer in writers:
+            writer.start()
+        try:
+            for data, metadata in batches:
+                shards, p_mzs = self.assign_shards(metadata)
+                for i in np.unique(shards):
+                    idx = np.flatnonzero(shards == i)
+                    shard_data = {key: value[idx] for key, value in data.items()}
+                    self._put(writers[i], queues[i], (shard_data, metadata.iloc[idx].reset_index(drop=True)))
+                    stats[i]["n_precursors"] += len(idx)
+                    stats[i]["min_precursor_mz"] = min(stats[i]["min_precursor_mz"], p_mzs[idx].min())
+                    stats[i]["max_precursor_mz"] = max(stats[i]["max_precursor_mz"], p_mzs[idx].max())
+        finally:
+            for writer, shard_queue in zip(writers, queues):
+                if writer.is_alive():
+                    shard_queue.put(None)
+            for writer in writers:
+                writer.join()
+
+        failed = [writer.name for writer in writers if writer.exitcode != 0]
+        if failed:
+            raise RuntimeError(f"Writing shards failed in {failed}.")
+        logger.info(f"Wrote {sum(p.value for p in progress)} batches to {self.n_shards} shards")
+        self._write_manifest(stats)
+
+    @staticmethod
+    def _put(writer: multiprocessing.Process, shard_queue: multiprocessing.Queue, content: Any):
+        """Put content into the queue of a shard without blocking forever if its writer died."""
+        while True:
+            try:
+                shard_queue.put(content, timeout=1)
+                return
+            except queue.Full:
+                if not writer.is_alive():
+                    raise RuntimeError(f"{writer.name} exited with code {writer.exitcode}.") from None
+
+    def _write_manifest(self, stats: List[Dict[str, Any]]):
+        lower_bounds = [None] + self.boundaries
+        upper_bounds = self.boundaries + [None]
+        shards = []
+        for i, (path, shard_stats) in enumerate(zip(self.shard_paths, stats)):
+            shard = {"path": path.name, **shard_stats}
+            if shard_stats["n_precursors"] == 0:
+                shard["min_precursor_mz"] = shard["max_precursor_mz"] = None
+            else:
+                shard["min_precursor_mz"] = float(shard["min_precursor_mz"])
+                shard["max_precursor_mz"] = float(shard["max_precursor_mz"])
+            if self.shard_by == "mz":
+                shard["mz_lower"] = lower_bounds[i]
+                shard["mz_upper"] = upper_bounds[i]
+            shards.append(shard)
+
+        manifest = {
+            "format": self.library_cls.__name__,
+            "shard_by": self.shard_by,
+            "n_shards": self.n_shards,
+            "shards": shards,
+        }
+        with open(self.manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
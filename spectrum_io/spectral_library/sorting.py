@@ -0,0 +1,182 @@
+import pickle
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from spectrum_fundamentals.constants import PARTICLE_MASSES
+
+Batch = Tuple[Dict[str, np.ndarray], pd.DataFrame]
+
+
+def precursor_mz(metadata: pd.DataFrame) -> np.ndarray:
+    """
+    Calculate the precursor m/z of each precursor of a batch.
+
+    :param metadata: the metadata of the batch, containing the columns MASS and PRECURSOR_CHARGE
+    :return: the precursor m/z values
+    """
+    p_charges = metadata["PRECURSOR_CHARGE"].to_numpy()
+    return (metadata["MASS"].to_numpy() + (p_charges * PARTICLE_MASSES["PROTON"])) / p_charges
+
+
+def _pad(value: np.ndarray, width: int) -> np.ndarray:
+    """Pad the fragment axis of an array to width, using -1 for m/z and intensities and b"" for annotations."""
+    if value.ndim < 2 or value.shape[1] == width:
+        return value
+    fill = -1 if value.dtype.kind in "iuf" else b""
+    padding = np.full((value.shape[0], width - value.shape[1]) + value.shape[2:], fill, dtype=value.dtype)
+    return np.concatenate([value, padding], axis=1)
+
+
+def _concat(batches: List[Batch]) -> Batch:
+    # batches are padded independently, e.g. by entries_to_batch, so their number of fragments may differ
+    data = {}
+    for key in batches[0][0]:
+        values = [batch_data[key] for batch_data, _ in batches]
+        width = max(value.shape[1] if value.ndim > 1 else 0 for value in values)
+        data[key] = np.concatenate([_pad(value, width) for value in values])
+    metadata = pd.concat([batch_metadata for _, batch_metadata in batches], ignore_index=True)
+    return data, metadata
+
+
+def _take(batch: Batch, idx: np.ndarray) -> Batch:
+    data, metadata = batch
+    return {key: value[idx] for key, value in data.items()}, metadata.iloc[idx].reset_index(drop=True)
+
+
+class _Run:
+    """Reader of a sorted run, yielding its chunks one after another."""
+
+    def __init__(self, path: Path):
+        self._file: BinaryIO = open(path, "rb")
+        self.chunk: Optional[Batch] = None
+        self.mzs = np.empty(0)
+        self.next_chunk()
+
+    def next_chunk(self):
+        try:
+            # runs are temporary files written by ExternalMzSorter itself
+            self.chunk = pickle.load(self._file)
+            self.mzs = precursor_mz(self.chunk[1])
+        except EOFError:
+            self.chunk = None
+            self._file.close()
+
+
+class ExternalMzSorter:
+    """
+    Sort batches of a spectral library by precursor m/z, using temporary files for libraries bigger than memory.
+
+    Added batches are buffered until run_size precursors are collected. The buffer is then sorted and spilled to a
+    temporary file as a sorted run of chunks with chunk_size precursors. sorted_batches merges all runs, so at most
+    one chunk per run is held in memory while merging.
+    """
+
+    def __init__(self, run_size: int = 100000, chunk_size: int = 10000, tmp_dir: Optional[Union[str, Path]] = None):
+        """
+        Initialize an ExternalMzSorter obj.
+
+        :param run_size: the number of precursors sorted in memory before they are spilled to disk
+        :param chunk_size: the number of precursors per chunk of a run and per merged batch
+        :param tmp_dir: optional directory for the temporary files. If None, the default temporary directory is used.
+        """
+        self.run_size = run_size
+        self.chunk_size = chunk_size
+        self._tmp_dir = tempfile.TemporaryDirectory(prefix="spectrum_io_sort_", dir=tmp_dir)
+        self._buffer: List[Batch] = []
+        self._n_buffered = 0
+        self._runs: List[Path] = []
+
+    def add(self, data: Dict[str, np.ndarray], metadata: pd.DataFrame):
+        """
+        Add a batch to the sorter.
+
+        :param data: the data of the batch as accepted by SpectralLibrary.write
+        :param metadata: the metadata of the batch
+        """
+        self._buffer.append((data, metadata))
+        self._n_buffered += len(metadata)
+        if self._n_buffered >= self.run_size:
+            self._spill()
+
+    def _sorted_buffer(self) -> Batch:
+        batch = _concat(self._buffer)
+        self._buffer, self._n_buffered = [], 0
+        return _take(batch, np.argsort(precursor_mz(batch[1]), kind="stable"))
+
+    def _spill(self):
+        batch = self._sorted_buffer()
+        path = Path(self._tmp_dir.name) / f"run_{len(self._runs):05d}.pkl"
+        with open(path, "wb") as f:
+            for start in range(0, len(batch[1]), self.chunk_size):
+                chunk = _take(batch, np.arange(start, min(start + self.chunk_size, len(batch[1]))))
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._runs.append(path)
+
+    def sorted_batches(self) -> Iterator[Batch]:
+        """
+        Return all added batches as batches sorted by precursor m/z.
+
+        If all batches fit into a single run, they are sorted in memory without writing temporary files.
+
+        :yield: batches of at most chunk_size precursors in ascending precursor m/z order
+        """
+        if not self._runs:
+            if self._buffer:
+                batch = self._sorted_buffer()
+                for start in range(0, len(batch[1]), self.chunk_size):
+                    yield _take(batch, np.arange(start, min(start + self.chunk_size, len(batch[1]))))
+            return
+        if self._buffer:
+            self._spill()
+        yield from self._merge([_Run(path) for path in self._runs])
+
+    def _merge(self, runs: List[_Run]) -> Iterator[Batch]:
+        """
+        Merge sorted runs chunk by chunk.
+
+        All precursors up to the smallest last m/z of the current chunks of all runs can be emitted, since every
+        later chunk of a run only contains precursors with equal or higher m/z.
+        """
+        while True:
+            runs = [run for run in runs if run.chunk is not None]
+            if not runs:
+                return
+            bound = min(run.mzs[-1] for run in runs)
+            parts, mzs = [], []
+            for run in runs:
+                n_take = np.searchsorted(run.mzs, bound, side="right")
+                parts.append(_take(run.chunk, np.arange(n_take)))
+                mzs.append(run.mzs[:n_take])
+                if n_take == len(run.mzs):
+                    run.next_chunk()
+                else:
+                    run.chunk = _take(run.chunk, np.arange(n_take, len(run.mzs)))
+                    run.mzs = run.mzs[n_take:]
+            yield _take(_concat(parts), np.argsort(np.concatenate(mzs), kind="stable"))
+
+    def cleanup(self):
+        """Remove the temporary files."""
+        self._tmp_dir.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+
+def sorted_by_mz(batches: Iterable[Batch], **kwargs) -> Iterator[Batch]:
+    """
+    Sort batches by precursor m/z using an ExternalMzSorter.
+
+    :param batches: iterable of (data, metadata) tuples
+    :param kwargs: keyword arguments passed to ExternalMzSorter
+    :yield: batches in ascending precursor m/z order
+    """
+    with ExternalMzSorter(**kwargs) as sorter:
+        for data, metadata in batches:
+            sorter.add(data, metadata)
+        yield from sorter.sorted_batches()
@@ -1,14 +1,30 @@
+import io
+import json
+import logging
+import os
+import queue
 import re
+import threading
 from abc import abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 from multiprocessing import Queue
 from multiprocessing.managers import ValueProxy
 from pathlib import Path
 from sqlite3 import Connection
-from typing import IO, Dict, Optional, Union
+from typing import IO, Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
+from spectrum_io.file.compression import infer_compression, open_file
+
+from .reading import LibraryEntry, TextIndex, entries_to_batch, reverse_mods
+from .sorting import sorted_by_mz
+
+logger = logging.getLogger(__name__)
+
 
 def parse_mods(mods: Dict[str, int]) -> Dict[str, str]:
     """
@@ -56,9 +72,67 @@ def parse_mods(mods: Dict[str, int]) -> Dict[str, str]:
     return unimod_regex_map
 
 
+def replace_mods(sequences: pd.Series, mods: Dict[str, str]) -> pd.Series:
+    """
+    Replace the modifications of modified sequences in internal format using the patterns returned by parse_mods.
+
+    :param sequences: the modified sequences in internal format
+    :param mods: dictionary mapping internal modification patterns (keys) to their replacement (values)
+    :return: the modified sequences with replaced modifications
+    """
+    return sequences.replace(mods, regex=True)
+
+
+FRAGMENT_ANNOTATION_PATTERN = re.compile(r"([by])(\d+)\+(\d)(?:-(\w+))?")
+
+
+def parse_fragment_annotation(f_annot: bytes) -> Tuple[int, str, int, str]:
+    """
+    Split a fragment annotation into its fragment number, ion type, charge and neutral loss.
+
+    :param f_annot: the fragment annotation, e.g. b'y1+1' or b'b5+2-H2O'
+    :raises ValueError: if the annotation is malformed
+    :return: a tuple of fragment number, ion type, charge and neutral loss ('noloss' if there is none)
+    """
+    m = FRAGMENT_ANNOTATION_PATTERN.match(f_annot.decode())
+    if m is None:
+        raise ValueError(f"Malformed annotation string encountered: {f_annot.decode()}")
+    return int(m.group(2)), m.group(1), int(m.group(3)), m.group(4) if m.group(4) else "noloss"
+
+
+class Fragments(NamedTuple):
+    """
+    Fragments of a batch that passed the fragment filter.
+
+    The fragments of all precursors are stored in flat arrays in the original fragment order. The fragments of the
+    i-th precursor are at offsets[i]:offsets[i + 1].
+    """
+
+    mz: np.ndarray
+    intensities: np.ndarray
+    annotation: Optional[np.ndarray]
+    offsets: np.ndarray
+
+    @property
+    def n_peaks(self) -> np.ndarray:
+        """The number of fragments of each precursor."""
+        return np.diff(self.offsets)
+
+
 class SpectralLibrary:
     """Main to initialze a SpectralLibrary obj."""
 
+    # whether batches can be formatted independently of the output handle, see parallel_write
+    _formats_text: bool = True
+    # whether the output can be restored to a checkpoint, see async_write
+    _resumable: bool = True
+    # whether the library stores fragment annotations, so read returns them
+    _stores_annotations: bool = True
+    # whether _write parses the fragment annotations, which then must not be empty
+    _requires_annotations: bool = True
+    # maximum number of converted modified sequences cached per writer, see _convert_mods
+    mod_cache_size: int = 1000000
+
     @property
     @abstractmethod
     def standard_mods(self) -> Dict[str, int]:
@@ -71,6 +145,12 @@ class SpectralLibrary:
         mode: str = "w",
         min_intensity_threshold: float = 5e-4,
         chunksize: Optional[int] = None,
+        compression: Optional[str] = None,
+        sort_by_mz: bool = False,
+        sort_run_size: int = 100000,
+        resume: bool = False,
+        top_n: Optional[int] = None,
+        normalize_intensities: bool = False,
     ):
         """
         Initialize a SpectralLibrary obj.
@@ -79,7 +159,19 @@ class SpectralLibrary:
         :param mode: Whether to append ('a') to or overwrite ('w') an extisting file
             at the provided output path (if it is present).
         :param min_intensity_threshold: optional filter for low intensity peaks
-        :param chunksize: optional chunksize for dlib
+        :param chunksize: optional number of rows per insert statement for dlib
+        :param compression: optional compression of text libraries, either 'gzip' or 'zstd'. If None, the
+            compression is derived from the suffix of the output path, e.g. 'library.msp.gz' is gzip compressed.
+        :param sort_by_mz: whether to write the entries sorted by precursor m/z instead of in the order of the
+            batches. When appending, only the appended entries are sorted.
+        :param sort_run_size: the number of precursors sorted in memory before they are spilled to a temporary file
+            if sort_by_mz is True, see ExternalMzSorter
+        :param resume: whether async_write records a checkpoint after each written batch. If a checkpoint of an
+            interrupted run exists, the output is restored to it and the batches written before are skipped.
+        :param top_n: optional maximum number of fragments per precursor. If given, only the top_n most intense
+            fragments passing min_intensity_threshold are written.
+        :param normalize_intensities: whether to divide the intensities of the written fragments of each precursor
+            by the highest of them, so the base peak has an intensity of 1
         """
         if isinstance(output_path, str):
             output_path = Path(output_path)
@@ -87,6 +179,15 @@ class SpectralLibrary:
         self.mode = mode
         self.min_intensity_threshold = min_intensity_threshold
         self.chunksize = chunksize
+        self.compression = compression
+        self.sort_by_mz = sort_by_mz
+        self.sort_run_size = sort_run_size
+        self._converted_mods: OrderedDict = OrderedDict()
+        self._converted_mods_key: Optional[Tuple[Tuple[str, str], ...]] = None
+        self.resume = resume
+        self.top_n = top_n
+        self.normalize_intensities = normalize_intensities
+        self.checkpoint_path = output_path.with_name(output_path.name + ".checkpoint")
 
     def load(self):
         """Load predictions from hdf5 file."""
@@ -102,31 +203,284 @@ class SpectralLibrary:
         parsed_mods = parse_mods(self.standard_mods | (custom_mods or {}))
         with self._get_handle() as out:
             self._initialize(out)
-            self._write(out, mods=parsed_mods, **kwargs)
+            if self.sort_by_mz:
+                for data, metadata in self._sorted([(kwargs["data"], kwargs["metadata"])]):
+                    self._write(out, data=data, metadata=metadata, mods=parsed_mods)
+            else:
+                self._write(out, mods=parsed_mods, **kwargs)
+            self._finalize(out)
+
+    def _sorted(
+        self, batches: Iterable[Tuple[Dict[str, np.ndarray], pd.DataFrame]]
+    ) -> Iterator[Tuple[Dict[str, np.ndarray], pd.DataFrame]]:
+        """Return the batches sorted by precursor m/z if sort_by_mz is set, otherwise unchanged."""
+        if not self.sort_by_mz:
+            return iter(batches)
+        return sorted_by_mz(batches, run_size=self.sort_run_size)
 
     def _get_handle(self):
-        return open(self.out_path, self.mode)
+        return open_file(self.out_path, self.mode, compression=self.compression)
 
-    def async_write(self, queue: Queue, progress: ValueProxy, custom_mods: Optional[Dict[str, int]] = None):
+    def async_write(
+        self,
+        queue: Queue,
+        progress: ValueProxy,
+        custom_mods: Optional[Dict[str, int]] = None,
+        n_workers: Optional[int] = None,
+        skip_committed: bool = True,
+    ):
         """
         Asynchronously write content to the output file from a queue.
 
         :param queue: A queue from which content will be retrieved for writing.
         :param progress: An integer value representing the progress of the writing process.
         :param custom_mods: dict with custom variable and static identifier and respecitve internal equivalent and mass
+        :param n_workers: optional number of processes formatting the batches in parallel, see parallel_write.
+            If None, the batches are formatted and written by this process.
+        :param skip_committed: whether the queue starts with the batches committed before the checkpoint, which are
+            then skipped. Set to False if the producer already left them out, see committed_batches.
+        :raises ValueError: if resume is set, but the output cannot be restored to a checkpoint
         """
+        if self.resume and (n_workers is not None or self.sort_by_mz or not self._resumable or self._compressed):
+            raise ValueError(
+                "Resuming is only supported for uncompressed text libraries and DLib, without sorting or n_workers."
+            )
+        if n_workers is not None:
+            self.parallel_write(
+                SpectralLibrary._consume(queue), custom_mods=custom_mods, n_workers=n_workers, progress=progress
+            )
+            return
+
         parsed_mods = parse_mods(self.standard_mods | (custom_mods or {}))
+        n_committed = self._load_checkpoint()
 
         with self._get_handle() as out:
             self._initialize(out)
-            while True:
-                content = queue.get()
-                if content is None:
-                    break
-                data, metadata = content
+            batches = self._sorted(SpectralLibrary._consume(queue, progress))
+            for i, (data, metadata) in enumerate(batches, start=0 if skip_committed else n_committed):
+                if i < n_committed:
+                    continue
                 self._write(out, data=data, metadata=metadata, mods=parsed_mods)
+                if self.resume:
+                    self._save_checkpoint(out, i + 1)
+            self._finalize(out)
+        self.checkpoint_path.unlink(missing_ok=True)
+
+    def committed_batches(self) -> int:
+        """
+        Get the number of batches written completely by an interrupted async_write with resume set.
+
+        A resumed async_write appends after these batches, so producers can skip computing them and call
+        async_write with skip_committed=False.
+
+        :return: the number of batches recorded in the checkpoint, or 0 if there is none
+        """
+        if not self.resume or not self.checkpoint_path.is_file():
+            return 0
+        return json.loads(self.checkpoint_path.read_text())["batches"]
+
+    @property
+    def _compressed(self) -> bool:
+        return (self.compression or infer_compression(self.out_path)) is not None
+
+    def _load_checkpoint(self) -> int:
+        """
+        Restore the output to the last checkpoint if resume is set and a checkpoint exists.
+
+        The output is then appended to, regardless of mode.
+
+        :return: the number of batches written before the checkpoint
+        """
+        if not self.resume or not self.checkpoint_path.is_file():
+            return 0
+        state = json.loads(self.checkpoint_path.read_text())
+        self._restore_checkpoint(state)
+        self.mode = "a"
+        logger.info(f"Resuming {self.out_path} after {state['batches']} batches")
+        return state["batches"]
+
+    def _save_checkpoint(self, out: Union[IO, Connection], n_batches: int):
+        """
+        Record that the first n_batches batches are completely written.
+
+        The checkpoint is replaced atomically, so it is consistent even if the process dies while saving it.
+
+        :param out: the output handle, flushed to disk before saving the checkpoint
+        :param n_batches: the number of completely written batches
+        """
+        state = {"batches": n_batches, **self._checkpoint_state(out)}
+        tmp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(state))
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _checkpoint_state(self, out: Union[IO, Connection]) -> Dict[str, Any]:
+        """
+        Internal function returning the state of the output needed to restore it to the current point.
+
+        :param out: the output handle
+        :return: the size of the flushed text file in bytes
+        """
+        out.flush()
+        os.fsync(out.fileno())
+        return {"offset": os.fstat(out.fileno()).st_size}
+
+    def _restore_checkpoint(self, state: Dict[str, Any]):
+        """
+        Internal function restoring the output to a checkpoint, removing everything written after it.
+
+        :param state: the state returned by _checkpoint_state when the checkpoint was saved
+        """
+        with open(self.out_path, "r+b") as f:
+            f.truncate(state["offset"])
+
+    @staticmethod
+    def _consume(
+        queue: Queue, progress: Optional[ValueProxy] = None
+    ) -> Iterator[Tuple[Dict[str, np.ndarray], pd.DataFrame]]:
+        """Yield the batches of a queue until None is received, counting each batch once it was processed."""
+        while True:
+            content = queue.get()
+            if content is None:
+                return
+            yield content
+            if progress is not None:
                 progress.value += 1
 
+    def parallel_write(
+        self,
+        batches: Iterable[Tuple[Dict[str, np.ndarray], pd.DataFrame]],
+        custom_mods: Optional[Dict[str, int]] = None,
+        n_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        progress: Optional[ValueProxy] = None,
+        use_threads: bool = False,
+    ):
+        """
+        Write content to the output file, formatting batches in a pool of workers.
+
+        Each batch is formatted into a chunk of text by a worker, while a single writer thread appends the
+        chunks to the output file in the order of the batches. Once max_pending batches are being formatted or
+        waiting to be written, consuming further batches blocks until the writer catches up, which bounds the
+        memory held by pending chunks. Only text formats support this, since their batches can be formatted
+        independently of the output file.
+
+        :param batches: iterable of (data, metadata) tuples as accepted by write
+        :param custom_mods: optional dictionary mapping libary format-specific modification patterns (keys)
+            to UNIMOD IDs (values)
+        :param n_workers: number of workers formatting batches. If None, the number of CPUs is used.
+        :param max_pending: maximum number of batches being formatted or waiting to be written.
+            If None, twice the number of workers is used.
+        :param progress: optional value that is incremented after each written batch
+        :param use_threads: whether to format batches in threads instead of processes
+        :raises TypeError: if the library format does not support formatting batches independently
+        :raises Exception: the first exception raised while formatting or writing a batch
+        """
+        if not self._formats_text:
+            raise TypeError(f"{type(self).__name__} does not support parallel writing. Use write or async_write.")
+        parsed_mods = parse_mods(self.standard_mods | (custom_mods or {}))
+        n_workers = n_workers or os.cpu_count() or 1
+        chunks: queue.Queue = queue.Queue(maxsize=max_pending or 2 * n_workers)
+        errors: List[Exception] = []
+        executor_cls = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+
+        with self._get_handle() as out:
+            self._initialize(out)
+            writer = threading.Thread(
+                target=SpectralLibrary._write_chunks, args=(out, chunks, progress, errors), name="library_writer"
+            )
+            with executor_cls(max_workers=n_workers) as executor:
+                writer.start()
+                try:
+                    for data, metadata in self._sorted(batches):
+                        if errors:
+                            break
+                        chunks.put(executor.submit(self._format, data, metadata, parsed_mods))
+                finally:
+                    chunks.put(None)
+                    writer.join()
+            if errors:
+                raise errors[0]
+            self._finalize(out)
+
+    def _format(self, data: Dict[str, np.ndarray], metadata: pd.DataFrame, mods: Dict[str, str]) -> str:
+        """
+        Internal function formatting a batch into a chunk of text that can be appended to the output file.
+
+        :param data: Dictionary containing the predictions of the batch
+        :param metadata: a dataframe containing the metadata of the batch
+        :param mods: dictionary mapping libary format-specific modification patterns to UNIMOD IDs
+        :return: the formatted batch
+        """
+        buffer = io.StringIO()
+        self._write(buffer, data=data, metadata=metadata, mods=mods)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _write_chunks(out: IO, chunks: queue.Queue, progress: Optional[ValueProxy], errors: List[Exception]):
+        """
+        Internal function appending formatted chunks to the output file until None is received.
+
+        After the first error, the remaining chunks are discarded, so the producer never blocks on a full queue.
+
+        :param out: file handle the chunks are written to
+        :param chunks: queue of futures holding the formatted chunks, in the order they are written
+        :param progress: optional value that is incremented after each written chunk
+        :param errors: list the first error is appended to
+        """
+        while True:
+            future: Optional[Future] = chunks.get()
+            if future is None:
+                return
+            if errors:
+                future.cancel()
+                continue
+            try:
+                out.write(future.result())
+            except Exception as e:
+                errors.append(e)
+                continue
+            if progress is not None:
+                progress.value += 1
+
+    def _convert_mods(
+        self,
+        modified_sequences: pd.Series,
+        mods: Dict[str, str],
+        convert: Callable[[pd.Series, Dict[str, str]], Iterable[Any]],
+    ) -> List[Any]:
+        """
+        Convert modified sequences to the format of the library, converting each unique sequence only once.
+
+        Modified sequences repeat heavily across precursor charges and collision energies, so conversions are cached
+        per writer in a least recently used cache of at most mod_cache_size sequences. The cache is cleared if the
+        modifications change.
+
+        :param modified_sequences: the modified sequences in internal format
+        :param mods: dictionary mapping internal modification patterns to the format of the library
+        :param convert: function converting a series of unique modified sequences using mods
+        :return: the converted modified sequences in the order of modified_sequences
+        """
+        key = tuple(mods.items())
+        if key != self._converted_mods_key:
+            self._converted_mods.clear()
+            self._converted_mods_key = key
+        cache = self._converted_mods
+
+        converted = {}
+        missing = []
+        for seq in pd.unique(modified_sequences):
+            if seq in cache:
+                cache.move_to_end(seq)
+                converted[seq] = cache[seq]
+            else:
+                missing.append(seq)
+        if missing:
+            converted.update(zip(missing, convert(pd.Series(missing, dtype=object), mods)))
+            cache.update((seq, converted[seq]) for seq in missing)
+            while len(cache) > self.mod_cache_size:
+                cache.popitem(last=False)
+        return [converted[seq] for seq in modified_sequences]
+
     def _fragment_filter_passed(
         self, f_mz: Union[np.ndarray, float], f_int: Union[np.ndarray, float]
     ) -> Union[np.ndarray, bool]:
@@ -144,6 +498,155 @@ class SpectralLibrary:
         """
         return (f_mz != -1) & (f_int >= self.min_intensity_threshold)
 
+    def read(
+        self, batch_size: int = 10000, custom_mods: Optional[Dict[str, int]] = None
+    ) -> Iterator[Tuple[Dict[str, np.ndarray], pd.DataFrame]]:
+        """
+        Read the library at the output path in batches.
+
+        The batches use the data / metadata layout accepted by write, so a library can be read and written to
+        another format batch by batch. Spectra are padded to the highest number of fragments of each batch.
+
+        :param batch_size: the number of precursors per batch
+        :param custom_mods: optional dictionary mapping libary format-specific modification patterns (keys)
+            to UNIMOD IDs (values), used to convert modified sequences back to the internal format
+        :raises NotImplementedError: if reading is not supported for the library format
+        :yield: tuples of data and metadata
+        """
+        if not self._formats_text:
+            raise NotImplementedError(f"Reading {type(self).__name__} libraries is not supported.")
+        with open_file(self.out_path, "rb", compression=self.compression) as f:
+            entries = (entry for _, entry in self._parse_entries(f, self._reading_mods(custom_mods)))
+            while chunk := list(islice(entries, batch_size)):
+                yield entries_to_batch(chunk)
+
+    @property
+    def index_path(self) -> Path:
+        """Path of the index of the library, see build_index."""
+        return self.out_path.with_name(self.out_path.name + ".index.npz")
+
+    def build_index(self, custom_mods: Optional[Dict[str, int]] = None):
+        """
+        Index the entries of the library by precursor m/z and modified sequence.
+
+        For text libraries, the byte offset of each entry is saved to index_path, so lookup_mz and lookup_sequence
+        only parse the requested entries.
+
+        :param custom_mods: optional dictionary mapping libary format-specific modification patterns (keys)
+            to UNIMOD IDs (values)
+        :raises NotImplementedError: if reading is not supported for the library format
+        :raises ValueError: if the library is compressed, since compressed files cannot be seeked
+        """
+        if not self._formats_text:
+            raise NotImplementedError(f"Reading {type(self).__name__} libraries is not supported.")
+        if self._compressed:
+            raise ValueError("Only uncompressed libraries can be indexed.")
+        with open(self.out_path, "rb") as f:
+            index = TextIndex.from_entries(self._parse_entries(f, self._reading_mods(custom_mods)))
+        index.save(self.index_path)
+
+    def lookup_mz(
+        self, lower: float, upper: float, custom_mods: Optional[Dict[str, int]] = None
+    ) -> Tuple[Dict[str, np.ndarray], pd.DataFrame]:
+        """
+        Read the entries with a precursor m/z between lower and upper (inclusive).
+
+        The index is built first if it is missing or older than the library.
+
+        :param lower: the lower precursor m/z bound
+        :param upper: the upper precursor m/z bound
+        :param custom_mods: optional dictionary mapping libary format-specific modification patterns (keys)
+            to UNIMOD IDs (values)
+        :return: data and metadata of the entries in ascending precursor m/z order
+        """
+        return self._read_at(self._load_index(custom_mods).find_mz(lower, upper), custom_mods)
+
+    def lookup_sequence(
+        self, modified_sequence: str, charge: Optional[int] = None, custom_mods: Optional[Dict[str, int]] = None
+    ) -> Tuple[Dict[str, np.ndarray], pd.DataFrame]:
+        """
+        Read the entries of a modified sequence.
+
+        The index is built first if it is missing or older than the library.
+
+        :param modified_sequence: the modified sequence in internal format, e.g. 'AAAC[UNIMOD:4]K'
+        :param charge: optional precursor charge of the entries
+        :param custom_mods: optional dictionary mapping libary format-specific modification patterns (keys)
+            to UNIMOD IDs (values)
+        :return: data and metadata of the entries
+        """
+        return self._read_at(self._load_index(custom_mods).find_sequence(modified_sequence, charge), custom_mods)
+
+    def _load_index(self, custom_mods: Optional[Dict[str, int]]) -> TextIndex:
+        if not self.index_path.is_file() or self.index_path.stat().st_mtime_ns < self.out_path.stat().st_mtime_ns:
+            self.build_index(custom_mods)
+        return TextIndex.load(self.index_path)
+
+    def _read_at(
+        self, offsets: np.ndarray, custom_mods: Optional[Dict[str, int]]
+    ) -> Tuple[Dict[str, np.ndarray], pd.DataFrame]:
+        mods = self._reading_mods(custom_mods)
+        entries = []
+        with open(self.out_path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                entries.append(next(self._parse_entries(f, mods))[1])
+        return entries_to_batch(entries)
+
+    def _reading_mods(self, custom_mods: Optional[Dict[str, int]]) -> Dict[str, str]:
+        """
+        Internal function returning the mapping used by _parse_entries to convert modifications to the internal format.
+
+        :param custom_mods: optional dictionary mapping libary format-specific modification patterns (keys)
+            to UNIMOD IDs (values)
+        :return: the mapping of library format-specific patterns to the internal format
+        """
+        return reverse_mods(self.standard_mods | (custom_mods or {}))
+
+    def _parse_entries(self, f: BinaryIO, mods: Dict[str, str]) -> Iterator[Tuple[int, LibraryEntry]]:
+        """
+        Internal function parsing the entries of a text library, starting at the current position of f.
+
+        :param f: the library opened in binary mode
+        :param mods: the mapping returned by _reading_mods
+        :raises NotImplementedError: if reading is not supported for the library format
+        """
+        raise NotImplementedError(f"Reading {type(self).__name__} libraries is not supported.")
+
+    def _select_fragments(self, data: Dict[str, np.ndarray]) -> Fragments:
+        """
+        Select the fragments to write for a whole batch at once.
+
+        Fragments are kept if they pass _fragment_filter_passed and, if top_n is set, are among the top_n most
+        intense of their precursor. Ties are resolved in favor of the earlier fragment. If normalize_intensities is
+        set, the kept intensities are then divided by the highest kept intensity of their precursor.
+
+        :param data: the data of the batch containing the (n_precursors, n_fragments) arrays 'mz', 'intensities'
+            and optionally 'annotation'
+        :return: the kept fragments of the batch
+        """
+        f_mzss = data["mz"]
+        f_intss = data["intensities"]
+        mask = np.asarray(self._fragment_filter_passed(f_mzss, f_intss))
+        if self.top_n is not None and self.top_n < mask.shape[1]:
+            ranks = np.argsort(np.where(mask, -f_intss, np.inf), axis=1, kind="stable")[:, : self.top_n]
+            top_mask = np.zeros_like(mask)
+            np.put_along_axis(top_mask, ranks, True, axis=1)
+            mask &= top_mask
+
+        n_peaks = mask.sum(axis=1)
+        intensities = f_intss[mask]
+        if self.normalize_intensities:
+            base_peaks = np.where(mask, f_intss, -np.inf).max(axis=1)
+            intensities = intensities / np.repeat(base_peaks, n_peaks)
+        annotation = data.get("annotation")
+        return Fragments(
+            mz=f_mzss[mask],
+            intensities=intensities,
+            annotation=None if annotation is None else annotation[mask],
+            offsets=np.concatenate([[0], np.cumsum(n_peaks)]),
+        )
+
     @abstractmethod
     def _write(
         self,
@@ -171,3 +674,11 @@ class SpectralLibrary:
     @abstractmethod
     def _initialize(self, out: Union[IO, Connection]):
         pass
+
+    def _finalize(self, out: Union[IO, Connection]):
+        """
+        Internal function called once after all batches are written.
+
+        :param out: file handle the library was written to
+        """
+        pass
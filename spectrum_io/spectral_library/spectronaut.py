@@ -1,13 +1,12 @@
-import re
-from itertools import chain, cycle
 from sqlite3 import Connection
-from typing import IO, Dict, Union
+from typing import IO, BinaryIO, Dict, Iterator, List, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from spectrum_fundamentals.constants import PARTICLE_MASSES
 
-from .spectral_library import SpectralLibrary
+from .reading import LibraryEntry, SequenceConverter
+from .spectral_library import SpectralLibrary, parse_fragment_annotation, replace_mods
 
 
 class Spectronaut(SpectralLibrary):
@@ -27,14 +26,31 @@ class Spectronaut(SpectralLibrary):
             "K[TMT_Pro]": 2016,
         }
 
-    @staticmethod
-    def _assemble_fragment_string(f_int: float, f_mz: float, f_annot: bytes):
-        m = re.match(r"([by])(\d+)\+(\d)(?:-(\w+))?", f_annot.decode())
-        if m is None:
-            raise ValueError(f"Malformed annotation string encountered: {f_annot.decode()}")
-        return (
-            f"{f_int:.4f},{f_mz:.8f},{m.group(2)},{m.group(1)},{m.group(3)},{m.group(4) if m.group(4) else 'noloss'}\n"
-        )
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize a Spectronaut obj.
+
+        :param args: positional arguments passed to SpectralLibrary
+        :param kwargs: keyword arguments passed to SpectralLibrary
+        """
+        super().__init__(*args, **kwargs)
+        self._annotation_fields: Dict[bytes, str] = {}
+
+    def _fragment_fields(self, f_annot: bytes) -> str:
+        """
+        Return the FragmentNumber, FragmentType, FragmentCharge and FragmentLossType columns of an annotation.
+
+        Annotations are parsed only once per writer, since the set of distinct annotations is small.
+
+        :param f_annot: the fragment annotation, e.g. b'y1+1' or b'b5+2-H2O'
+        :raises ValueError: if the annotation is malformed
+        :return: the comma separated columns including the line break
+        """
+        fields = self._annotation_fields.get(f_annot)
+        if fields is None:
+            fields = ",".join(map(str, parse_fragment_annotation(f_annot))) + "\n"
+            self._annotation_fields[f_annot] = fields
+        return fields
 
     def _write(
         self,
@@ -48,7 +64,9 @@ class Spectronaut(SpectralLibrary):
             raise TypeError("Not supported. Use DLib if you want to write a database file.")
         seqs = metadata["SEQUENCE"]
 
-        modseqs = metadata["MODIFIED_SEQUENCE"].replace(mods, regex=True).apply(lambda x: "_" + x + "_")
+        modseqs = self._convert_mods(
+            metadata["MODIFIED_SEQUENCE"], mods, lambda seqs, mods: "_" + replace_mods(seqs, mods) + "_"
+        )
         # modseqs = internal_to_spectronaut(metadata["MODIFIED_SEQUENCE"].apply(lambda x: "_" + x + "_"))
         p_charges = metadata["PRECURSOR_CHARGE"]
         p_mzs = (metadata["MASS"] + (p_charges * PARTICLE_MASSES["PROTON"])) / p_charges
@@ -57,19 +75,29 @@ class Spectronaut(SpectralLibrary):
 
         # prepare spectra
         irts = data["irt"][:, 0]  # should create a 1D view of the (n_peptides, 1) shaped array
-        f_mzss = data["mz"]
-        f_intss = data["intensities"]
-        f_annotss = data["annotation"].astype("S", copy=False)
+        fragments = self._select_fragments(data)
+        annot_vocab, annot_idx = np.unique(fragments.annotation.astype("S", copy=False), return_inverse=True)
+        fragment_fields = np.array([self._fragment_fields(annot) for annot in annot_vocab], dtype=object)
 
-        vec_assemble = np.vectorize(Spectronaut._assemble_fragment_string)
+        line_starts = [
+            # the start is part of the format string of the fragment rows, so '%' has to be escaped
+            f"{modseq},{seq},{seq},{p_charge},{p_mz:.8f},{irt:.2f},{ce},{pr_id},".replace("%", "%%")
+            for modseq, seq, p_charge, p_mz, irt, ce, pr_id in zip(modseqs, seqs, p_charges, p_mzs, irts, ces, pr_ids)
+        ]
 
-        for f_ints, f_mzs, modseq, seq, p_charge, p_mz, irt, ce, pr_id, f_annots in zip(
-            f_intss, f_mzss, modseqs, seqs, p_charges, p_mzs, irts, ces, pr_ids, f_annotss
-        ):
-            cond = self._fragment_filter_passed(f_mzs, f_ints)
-            line_start = [f"{modseq},{seq},{seq},{p_charge},{p_mz:.8f},{irt:.2f},{ce},{pr_id},"]
-            fragment_list = vec_assemble(f_ints[cond], f_mzs[cond], f_annots[cond])
-            out.writelines(chain.from_iterable(zip(cycle(line_start), fragment_list)))
+        fragment_values = np.empty((len(annot_idx), 3), dtype=object)
+        fragment_values[:, 0] = fragments.intensities
+        fragment_values[:, 1] = fragments.mz
+        fragment_values[:, 2] = fragment_fields[annot_idx]
+        fragment_values = fragment_values.ravel().tolist()
+        ends = fragments.offsets[1:] * 3
+
+        # format all fragment rows of a precursor with a single call instead of one f-string per fragment, and
+        # pass them on one precursor at a time, so the text of the whole batch is never held in memory
+        out.writelines(
+            ((line_start + "%.4f,%.8f,%s") * n) % tuple(fragment_values[end - 3 * n : end])
+            for line_start, n, end in zip(line_starts, fragments.n_peaks, ends)
+        )
 
     def _initialize(self, out: Union[IO, Connection]):
         if isinstance(out, Connection):
@@ -79,3 +107,48 @@ class Spectronaut(SpectralLibrary):
                 "ModifiedPeptide,LabeledPeptide,StrippedPeptide,PrecursorCharge,PrecursorMz,iRT,CollisionEnergy,ProteinIds,"
                 "RelativeFragmentIntensity,FragmentMz,FragmentNumber,FragmentType,FragmentCharge,FragmentLossType\n"
             )
+
+    def _parse_entries(self, f: BinaryIO, mods: Dict[str, str]) -> Iterator[Tuple[int, LibraryEntry]]:
+        to_internal = SequenceConverter(mods)
+        offset = f.tell()
+        start, key, rows = 0, None, []
+        for line in f:
+            line_start = offset
+            offset += len(line)
+            if line.startswith(b"ModifiedPeptide,"):
+                continue
+            # ProteinIds may contain commas, so the fragment columns are taken from the end of the row
+            row = line.decode().rstrip().split(",")
+            # consecutive rows with the same ModifiedPeptide, PrecursorCharge and CollisionEnergy form a precursor
+            if (row[0], row[3], row[6]) != key:
+                if rows:
+                    yield start, Spectronaut._to_entry(rows, to_internal)
+                start, key, rows = line_start, (row[0], row[3], row[6]), []
+            rows.append(row)
+        if rows:
+            yield start, Spectronaut._to_entry(rows, to_internal)
+
+    @staticmethod
+    def _to_entry(rows: List[List[str]], to_internal: SequenceConverter) -> LibraryEntry:
+        """
+        Internal function creating a library entry from the rows of a precursor.
+
+        :param rows: the split rows of the fragments of the precursor
+        :param to_internal: converter of modified sequences to the internal format
+        :return: the library entry
+        """
+        first = rows[0]
+        return LibraryEntry(
+            modified_sequence=to_internal(first[0].strip("_")),
+            sequence=first[2],
+            charge=int(first[3]),
+            precursor_mz=float(first[4]),
+            irt=float(first[5]),
+            collision_energy=float(first[6]),
+            proteins=",".join(first[7:-6]),
+            mz=[float(row[-5]) for row in rows],
+            intensities=[float(row[-6]) for row in rows],
+            annotations=[
+                f"{row[-3]}{row[-4]}+{row[-2]}{'' if row[-1] == 'noloss' else '-' + row[-1]}".encode() for row in rows
+            ],
+        )
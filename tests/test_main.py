@@ -16,3 +16,18 @@ def test_main_succeeds(runner: CliRunner) -> None:
     """It exits with a status code of zero."""
     result = runner.invoke(__main__.main)
     assert result.exit_code == 0
+
+
+def test_convert(runner: CliRunner, tmp_path) -> None:
+    """It converts a spectral library to another format."""
+    src = tmp_path / "library.csv"
+    src.write_text(
+        "ModifiedPeptide,LabeledPeptide,StrippedPeptide,PrecursorCharge,PrecursorMz,iRT,CollisionEnergy,ProteinIds,"
+        "RelativeFragmentIntensity,FragmentMz,FragmentNumber,FragmentType,FragmentCharge,FragmentLossType\n"
+        "_PEPTIDEK_,PEPTIDEK,PEPTIDEK,2,465.73,12.50,30,ProteinA,1.0000,147.11280000,1,y,1,noloss\n"
+        "_PEPTIDEK_,PEPTIDEK,PEPTIDEK,2,465.73,12.50,30,ProteinA,0.5000,98.06000000,1,b,1,noloss\n"
+    )
+    result = runner.invoke(__main__.main, ["convert", str(src), str(tmp_path / "library.msp"), "--workers", "1"])
+    assert result.exit_code == 0, result.output
+    assert "Converted 1 precursors." in result.output
+    assert "Name: PEPTIDEK/2" in (tmp_path / "library.msp").read_text()
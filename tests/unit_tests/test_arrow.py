@@ -0,0 +1,66 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from spectrum_io.file import arrow
+
+
+class TestArrow(unittest.TestCase):
+    """Test class to check Arrow IPC file I/O."""
+
+    def setUp(self):  # noqa: D102
+        self.raw_data = {
+            "SCAN_NUMBER": [1, 234, 5678],
+            "INTENSITIES": [[4e-5, 0.03, 0.4], [0.3, 1.0], [0.04, 2e-3, 0.0, 0.13]],
+            "MZ": [[100.5, 200.25, 300.125], [150.5, 250.5], [101.0, 202.0, 303.0, 404.0]],
+            "SEQUENCE": ["SVFLTFLR", "KTSQIFLAK", "SPVGRVTPKEWR"],
+        }
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):  # noqa: D102
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_read_file(self):
+        """Check whether data is unmodified after being written to and read from an Arrow IPC file."""
+        output_path = self.temp_dir / "spectra.arrow"
+        df = pd.DataFrame(self.raw_data)
+        arrow.write_file(df, output_path)
+        table = arrow.read_file(output_path)
+        self.assertTrue(pa.types.is_large_list(table.schema.field("INTENSITIES").type))
+        read_df = table.to_pandas()
+        for column in ["INTENSITIES", "MZ"]:
+            read_df[column] = read_df[column].apply(list)
+        pd.testing.assert_frame_equal(read_df, df)
+
+    def test_read_file_closes_file(self):
+        """Check that read_file does not leave the file open, while the returned table stays usable."""
+        output_path = self.temp_dir / "spectra.arrow"
+        arrow.write_file(pd.DataFrame(self.raw_data), output_path)
+        fd_dir = Path("/proc/self/fd")
+        if not fd_dir.is_dir():
+            self.skipTest("Open file descriptors can only be listed on Linux.")
+        n_open = len(list(fd_dir.iterdir()))
+        for memory_map in [True, False]:
+            table = arrow.read_file(output_path, memory_map=memory_map)
+            self.assertEqual(len(list(fd_dir.iterdir())), n_open)
+            self.assertEqual(table.column("SCAN_NUMBER").to_pylist(), self.raw_data["SCAN_NUMBER"])
+
+    def test_spectra_arrays(self):
+        """Check that flat values and offsets of list columns are returned as numpy views per record batch."""
+        output_path = self.temp_dir / "spectra.arrow"
+        arrow.write_file(pd.DataFrame(self.raw_data), output_path, value_type=pa.float32(), chunksize=2)
+        table = arrow.read_file(output_path, columns=["MZ"])
+        self.assertEqual(table.column_names, ["MZ"])
+        arrays = arrow.spectra_arrays(table, "MZ")
+        self.assertEqual(len(arrays), 2)
+        values, offsets = arrays[0]
+        self.assertEqual(values.dtype, np.float32)
+        np.testing.assert_array_equal(offsets, [0, 3, 5])
+        np.testing.assert_array_equal(values[offsets[1] : offsets[2]], [150.5, 250.5])
+        with self.assertRaises(TypeError):
+            arrow.spectra_arrays(arrow.read_file(output_path), "SEQUENCE")
@@ -0,0 +1,58 @@
+import gzip
+import importlib.util
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from spectrum_io.file import compression
+
+
+class TestCompression(unittest.TestCase):
+    """Test class to check compressed text file I/O."""
+
+    def setUp(self):  # noqa: D102
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.content = "".join(f"{i}\t{i / 7:.8f}\n" for i in range(10000))
+
+    def tearDown(self):  # noqa: D102
+        shutil.rmtree(self.temp_dir)
+
+    def test_infer_compression(self):
+        """Check that the compression is derived from the suffix."""
+        self.assertEqual(compression.infer_compression("library.msp.gz"), "gzip")
+        self.assertEqual(compression.infer_compression("library.csv.ZST"), "zstd")
+        self.assertIsNone(compression.infer_compression("library.msp"))
+
+    def test_gzip_blocks(self):
+        """Check that blocks compressed in parallel form a valid gzip file, also after appending."""
+        path = self.temp_dir / "test.txt.gz"
+        with open(path, "wb") as raw, compression.GzipBlockWriter(raw, threads=2, block_size=1000) as writer:
+            writer.write(self.content.encode())
+        with compression.open_file(path, "a") as f:
+            f.write(self.content)
+        with gzip.open(path, "rt") as f:
+            self.assertEqual(f.read(), self.content * 2)
+
+    @unittest.skipUnless(importlib.util.find_spec("zstandard"), "zstandard is not installed")
+    def test_zstd(self):
+        """Check that zstd compressed files can be written and read back."""
+        path = self.temp_dir / "test.txt.zst"
+        with compression.open_file(path, "w") as f:
+            f.write(self.content)
+        with compression.open_file(path, "a") as f:
+            f.write(self.content)
+        with compression.open_file(path) as f:
+            self.assertEqual(f.read(), self.content * 2)
+
+    def test_plain(self):
+        """Check that files without known suffix are not compressed."""
+        path = self.temp_dir / "test.txt"
+        with compression.open_file(path, "w") as f:
+            f.write(self.content)
+        self.assertEqual(path.read_text(), self.content)
+
+    def test_invalid_compression(self):
+        """Check that unknown compressions are rejected."""
+        with self.assertRaises(ValueError):
+            compression.open_file(self.temp_dir / "test.txt", "w", compression="bz2")
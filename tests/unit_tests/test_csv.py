@@ -0,0 +1,52 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from spectrum_io.file import csv
+from spectrum_io.search_result.search_results import COLUMN_TYPES, COLUMNS
+
+
+class TestCsv(unittest.TestCase):
+    """Test class to check csv file I/O."""
+
+    def setUp(self):  # noqa: D102
+        self.df = pd.DataFrame(
+            {
+                "RAW_FILE": ["run1", "run2"],
+                "SCAN_NUMBER": [12, 345],
+                "MODIFIED_SEQUENCE": ["AAAC[UNIMOD:4]K", "PEPTIDE"],
+                "PRECURSOR_CHARGE": [2, 3],
+                "MASS": [600.0, 799.36],
+                "SCORE": [100.0, 12.5],
+                "REVERSE": [False, True],
+                "SEQUENCE": ["AAACK", "PEPTIDE"],
+                "PEPTIDE_LENGTH": [5, 7],
+                "PROTEINS": ["ProteinA;ProteinB", "REV__ProteinC"],
+            }
+        )[COLUMNS]
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):  # noqa: D102
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_read_file(self):
+        """Check that the internal format is read back with the same dtypes by both engines."""
+        output_path = self.temp_dir / "internal.csv"
+        csv.write_file(self.df, output_path)
+        for engine in csv.ENGINES:
+            df = csv.read_file(output_path, column_types=COLUMN_TYPES, engine=engine)
+            pd.testing.assert_frame_equal(df, self.df)
+
+    def test_write_read_file_pandas(self):
+        """Check that files written by pandas are read by the pyarrow engine."""
+        output_path = self.temp_dir / "internal.csv"
+        csv.write_file(self.df, output_path, engine="pandas")
+        pd.testing.assert_frame_equal(csv.read_file(output_path), self.df)
+
+    def test_invalid_engine(self):
+        """Check that unknown engines are rejected."""
+        with self.assertRaises(ValueError):
+            csv.read_file(self.temp_dir / "internal.csv", engine="python")
@@ -6,6 +6,23 @@ import numpy as np
 import spectrum_io.spectral_library.digest as digest
 
 
+def _reference_full_digest(seq, min_len, max_len, pre, not_post, miscleavages, methionine_cleavage):
+    """Previous, loop based implementation of full_digest."""
+    len_s, starts = len(seq), [0]
+    methionine_cleavage = methionine_cleavage and seq[0] == "M"
+    cleavage_sites = [0] if methionine_cleavage else []
+    cleavage_sites.extend([i for i in range(len_s) if seq[i] in pre and seq[min([len_s - 1, i + 1])] not in not_post])
+    cleavage_sites.append(len_s)
+    for i in cleavage_sites:
+        for start in starts:
+            if min_len <= i - start + 1 <= max_len:
+                yield seq[start : i + 1]
+        starts.append(i + 1)
+        methionine_cleaved = int(starts[0] == 0 and methionine_cleavage)
+        if len(starts) > miscleavages + 1 + methionine_cleaved:
+            starts = starts[1 + methionine_cleaved :]
+
+
 class TestDigest(unittest.TestCase):
     """Class to test digest."""
 
@@ -38,3 +55,17 @@ class TestDigest(unittest.TestCase):
         pep_prot_map.unlink()
         pep_prot_params.unlink()
         prosit_input_with_proteins.unlink()
+
+    def test_full_digest(self):
+        """Test that full_digest yields the peptides of the loop based implementation for all enzymes."""
+        rng = np.random.default_rng(42)
+        sequences = ["MKRPEPTIDEKPR", "PEPTIDER", "K", "MK", "MPKR"]
+        sequences += ["".join(rng.choice(list("ACDEKMPRLVWY"), length)) for length in rng.integers(1, 120, 50)]
+        for enzyme, (pre, not_post) in digest.cleavage_sites.items():
+            for seq in sequences:
+                for miscleavages in range(4):
+                    for methionine_cleavage in [True, False]:
+                        for min_len, max_len in [(1, 60), (7, 30)]:
+                            args = (seq, min_len, max_len, pre, not_post, miscleavages, methionine_cleavage)
+                            with self.subTest(enzyme=enzyme, args=args):
+                                self.assertEqual(list(digest.full_digest(*args)), list(_reference_full_digest(*args)))
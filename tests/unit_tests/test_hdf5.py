@@ -0,0 +1,114 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import h5py
+import numpy as np
+import pandas as pd
+import scipy
+
+from spectrum_io.file import hdf5
+
+
+class TestHdf5(unittest.TestCase):
+    """Test class to check hdf5 file I/O."""
+
+    def setUp(self):  # noqa: D102
+        self.matrix = scipy.sparse.csr_matrix(
+            np.array(
+                [
+                    [0.0, 0.5, 0.0, 1.0],
+                    [0.0, 0.0, 0.0, 0.0],
+                    [0.25, 0.0, 0.125, 0.0],
+                ]
+            )
+        )
+        self.column_names = ["a", "b", "c", "d"]
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):  # noqa: D102
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_read_coo(self):
+        """Check that the default COO layout can be read back as DataFrame and csr_matrix."""
+        output_path = self.temp_dir / "coo.hdf5"
+        hdf5.write_dataset(self.matrix, output_path, "intensities", column_names=self.column_names)
+        df = hdf5.read_file(output_path, "sparse_intensities")
+        np.testing.assert_array_equal(df.sparse.to_dense().to_numpy(), self.matrix.toarray())
+        matrix = hdf5.read_sparse_matrix(output_path, "sparse_intensities")
+        np.testing.assert_array_equal(matrix.toarray(), self.matrix.toarray())
+
+    def test_write_read_csr(self):
+        """Check that the CSR layout uses narrow dtypes and is read back without conversion."""
+        output_path = self.temp_dir / "csr.hdf5"
+        hdf5.write_dataset(self.matrix, output_path, "intensities", column_names=self.column_names, sparse_format="csr")
+        with h5py.File(output_path, "r") as f:
+            group = f["sparse_intensities"]
+            self.assertEqual(group.attrs["format"], "csr")
+            self.assertEqual(group["indices"].dtype, np.int32)
+            self.assertEqual(group["data"].dtype, np.float32)
+            self.assertEqual(group["data"].compression, "gzip")
+            self.assertTrue(group["data"].shuffle)
+
+        matrix = hdf5.read_sparse_matrix(output_path, "sparse_intensities")
+        self.assertIsInstance(matrix, scipy.sparse.csr_matrix)
+        np.testing.assert_array_equal(matrix.toarray(), self.matrix.toarray())
+
+        df = hdf5.read_file(output_path, "sparse_intensities")
+        self.assertIsInstance(df, pd.DataFrame)
+        np.testing.assert_array_equal(df.sparse.to_dense().to_numpy(), self.matrix.toarray())
+
+    def test_write_read_csr_empty(self):
+        """Check that an all-zero matrix can be stored using the CSR layout."""
+        output_path = self.temp_dir / "empty.hdf5"
+        hdf5.write_dataset(scipy.sparse.csr_matrix((3, 4)), output_path, "intensities", sparse_format="csr")
+        matrix = hdf5.read_sparse_matrix(output_path, "sparse_intensities")
+        self.assertEqual(matrix.shape, (3, 4))
+        self.assertEqual(matrix.nnz, 0)
+
+    def test_write_dataset_invalid_format(self):
+        """Check that unknown sparse layouts are rejected."""
+        with self.assertRaises(ValueError):
+            hdf5.write_dataset(self.matrix, self.temp_dir / "x.hdf5", "intensities", sparse_format="csc")
+
+    def test_write_file(self):
+        """Check that write_file returns a future that resolves once all datasets are written."""
+        output_path = self.temp_dir / "file.hdf5"
+        with hdf5.WriterPool(max_workers=2, max_pending=2) as pool:
+            future = hdf5.write_file(
+                [self.matrix, self.matrix],
+                output_path,
+                ["raw", "pred"],
+                column_names=[self.column_names, self.column_names],
+                pool=pool,
+            )
+            self.assertIsNone(future.result())
+        for key in ["sparse_raw", "sparse_pred"]:
+            matrix = hdf5.read_sparse_matrix(output_path, key)
+            np.testing.assert_array_equal(matrix.toarray(), self.matrix.toarray())
+
+    def test_write_file_error(self):
+        """Check that errors raised while writing in the background are surfaced exactly once."""
+        pool = hdf5.WriterPool()
+        future = hdf5.write_file([self.matrix], self.temp_dir / "error.hdf5", ["raw"], pool=pool)
+        with self.assertRaises(TypeError):
+            future.result()
+        # the error was already retrieved from the future, so flush does not raise it again
+        pool.flush()
+
+        hdf5.write_file([self.matrix], self.temp_dir / "error.hdf5", ["raw"], pool=pool)
+        with self.assertRaises(TypeError):
+            pool.flush()
+        pool.flush()
+        pool.close()
+
+    def test_writer_pool_prunes_path_locks(self):
+        """Check that the lock of a file is removed once no write to it is pending."""
+        with hdf5.WriterPool() as pool:
+            futures = [pool.submit(self.temp_dir / f"{i}.hdf5", lambda: None) for i in range(3)]
+            for future in futures:
+                future.result()
+            pool.flush()
+            self.assertEqual(pool._path_locks, {})
+            self.assertEqual(pool._path_pending, {})
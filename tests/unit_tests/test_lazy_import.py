@@ -0,0 +1,63 @@
+import json
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = [
+    "alphatims",
+    "h5py",
+    "numpy",
+    "pandas",
+    "pyarrow",
+    "pymzml",
+    "pyopenms",
+    "pyteomics",
+    "scipy",
+    "spectrum_fundamentals",
+    "sqlite3",
+    "tqdm",
+]
+
+
+def _import(statement: str) -> list:
+    """Run an import statement in a fresh interpreter and return the heavy modules it imported."""
+    code = (
+        "import json, sys\n"
+        "preloaded = set(sys.modules)\n"
+        f"{statement}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in set(sys.modules) - preloaded]))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+class TestLazyImport(unittest.TestCase):
+    """Guard the import time of spectrum_io by checking which dependencies are imported."""
+
+    def test_import_package(self):
+        """Importing the package must not import any format dependencies."""
+        modules = _import(
+            "import spectrum_io, spectrum_io.d, spectrum_io.file, spectrum_io.raw, spectrum_io.search_result, "
+            "spectrum_io.spectral_library"
+        )
+        self.assertEqual(modules, [])
+
+    def test_import_single_format(self):
+        """Using one format only imports the dependencies of this format."""
+        modules = _import("from spectrum_io.file import parquet")
+        self.assertEqual(modules, ["numpy", "pandas", "pyarrow"])
+
+    def test_lazy_attributes(self):
+        """Lazily imported attributes are resolved on first access."""
+        import spectrum_io
+        from spectrum_io.registry import get_file_format, get_spectral_library
+
+        self.assertIs(spectrum_io.file.parquet, get_file_format("parquet"))
+        self.assertIs(spectrum_io.spectral_library.MSP, get_spectral_library("MSP"))
+        self.assertIn("hdf5", dir(spectrum_io.file))
+        self.assertIn("logger", dir(spectrum_io.file))
+        self.assertIn("__version__", dir(spectrum_io))
+        with self.assertRaises(AttributeError):
+            spectrum_io.file.xlsx
+        with self.assertRaises(ValueError):
+            get_file_format("xlsx")
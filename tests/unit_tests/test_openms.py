@@ -1,3 +1,4 @@
+import tempfile
 import unittest
 from pathlib import Path
 
@@ -41,9 +42,10 @@ class TestOpenMS(unittest.TestCase):
     def test_read_openms(self):
         """Test function for reading OpenMS results and transforming to Prosit format."""
         expected_openms_internal_path = Path(__file__).parent / "data" / "openms.csv"
-        OpenMS(Path(__file__).parent / "data" / "openms.idXML").generate_internal(
-            out_path=Path(__file__).parent / "data" / "openms.csv"
-        )
+        with tempfile.TemporaryDirectory() as temp_dir:
+            OpenMS(Path(__file__).parent / "data" / "openms.idXML").generate_internal(
+                out_path=Path(temp_dir) / "openms.csv"
+            )
 
         internal_search_results_df = (
             OpenMS(Path(__file__).parent / "data" / "openms.idXML").read_result().reset_index(drop=True)
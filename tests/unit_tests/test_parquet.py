@@ -63,6 +63,29 @@ class TestParquet(unittest.TestCase):
         read_df = parquet.read_partition(output_path, "dataset_1")
         pd.testing.assert_frame_equal(read_df, df)
 
+    def test_read_write_partition_index(self):
+        """Check that write_partition stores the index of the datasets, unless preserve_index is False."""
+        output_path = self.temp_dir / "partition"
+        df = pd.DataFrame(self.raw_data, index=["a", "b", "c"])
+        parquet.write_partition([df, df.iloc[1:]], output_path, ["dataset_1", "dataset_2"])
+        pd.testing.assert_frame_equal(parquet.read_partition(output_path, "dataset_1"), df)
+        pd.testing.assert_frame_equal(parquet.read_partition(output_path, "dataset_2"), df.iloc[1:])
+        parquet.write_partition([df], self.temp_dir / "no_index", ["dataset_1"], preserve_index=False)
+        read_df = parquet.read_partition(self.temp_dir / "no_index", "dataset_1")
+        pd.testing.assert_frame_equal(read_df, df.reset_index(drop=True))
+
+    def test_read_write_partition_different_schemas(self):
+        """Check that columns and indices of later partitions are read although the first partition lacks them."""
+        output_path = self.temp_dir / "partition"
+        df_a = pd.DataFrame({"x": [1, 2]})
+        df_b = pd.DataFrame({"x": [3, 4, 5], "y": ["a", "b", "c"]}, index=[5, 6, 7])
+        parquet.write_partition([df_a, df_b], output_path, ["a", "b"])
+        pd.testing.assert_frame_equal(parquet.read_partition(output_path, "a"), df_a)
+        pd.testing.assert_frame_equal(parquet.read_partition(output_path, "b"), df_b)
+        pd.testing.assert_frame_equal(
+            parquet.read_partition(output_path, "b", columns=["y"], filters=[("x", ">", 3)]), df_b.loc[[6, 7], ["y"]]
+        )
+
     def test_read_write_partition_integer_key(self):
         """Check whether Parquet's under-the-hood conversion of string to integer keys is handled seamlessly."""
         output_path = self.temp_dir / "partition"
@@ -79,3 +102,47 @@ class TestParquet(unittest.TestCase):
         parquet.write_partition([df, df, df], output_path, ["1", "2", "3"])
         read_df = parquet.read_partition(output_path, "2")
         pd.testing.assert_frame_equal(read_df, df)
+
+    def test_read_file_push_down(self):
+        """Check that only the requested columns and rows are read from a single file."""
+        output_path = self.temp_dir / "table.parquet"
+        pq.write_table(pa.Table.from_pydict(self.raw_data), output_path)
+        df = parquet.read_file(output_path, columns=["scan_number", "sequence"], filters=[("scan_number", ">", 100)])
+        expected = pd.DataFrame(self.raw_data)[["scan_number", "sequence"]].iloc[1:].reset_index(drop=True)
+        pd.testing.assert_frame_equal(df, expected)
+
+    def test_read_partition_push_down(self):
+        """Check that columns and filters are applied when reading a single partition."""
+        output_path = self.temp_dir / "partition"
+        df = pd.DataFrame(self.raw_data)
+        parquet.write_partition([df, df], output_path, ["1", "2"])
+        read_df = parquet.read_partition(
+            output_path, "2", columns=["sequence"], filters=[("collision_energy_normed", "<", 0.26)]
+        )
+        pd.testing.assert_frame_equal(read_df, pd.DataFrame({"sequence": ["SVFLTFLR"]}))
+
+    def test_iter_batches(self):
+        """Check that a partitioned dataset can be read in filtered batches."""
+        output_path = self.temp_dir / "partition"
+        df = pd.DataFrame(self.raw_data)
+        parquet.write_partition([df, df], output_path, ["dataset_1", "dataset_2"])
+        batches = list(
+            parquet.iter_batches(
+                output_path, batch_size=1, columns=["scan_number"], filters=[("dataset", "=", "dataset_1")]
+            )
+        )
+        self.assertEqual([len(batch) for batch in batches], [1, 1, 1])
+        self.assertEqual(pd.concat(batches)["scan_number"].tolist(), self.raw_data["scan_number"])
+
+    def test_partition_writer(self):
+        """Check that batches are streamed into row groups and new datasets are appended to existing partitions."""
+        output_path = self.temp_dir / "partition"
+        df = pd.DataFrame(self.raw_data)
+        parquet.write_partition([df], output_path, ["dataset_1"])
+        with parquet.ParquetPartitionWriter(output_path, row_group_size=2) as writer:
+            for i in range(len(df)):
+                writer.write(df.iloc[[i]], "dataset_2")
+        pd.testing.assert_frame_equal(parquet.read_partition(output_path, "dataset_1"), df)
+        pd.testing.assert_frame_equal(parquet.read_partition(output_path, "dataset_2"), df)
+        metadata = pq.ParquetFile(output_path / "dataset=dataset_2" / "part-0.parquet").metadata
+        self.assertEqual([metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)], [2, 1])
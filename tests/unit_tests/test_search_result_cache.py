@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd
+
+from spectrum_io.search_result import MaxQuant, Sage
+from spectrum_io.search_result.cache import CsvCache, ParquetCache, ResultCache, fingerprint, get_cache
+from spectrum_io.search_result.search_results import COLUMNS
+
+
+class TestResultCache(unittest.TestCase):
+    """Test class to check caching of search results in internal format."""
+
+    def setUp(self):  # noqa: D102
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.search_results = Sage(Path(__file__).parent / "data" / "sage_output.tsv")
+
+    def tearDown(self):  # noqa: D102
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_cache(self):
+        """Check that the cache format is derived from the suffix."""
+        self.assertIsInstance(get_cache(self.temp_dir / "msms.csv"), CsvCache)
+        self.assertIsInstance(get_cache(self.temp_dir / "msms.prosit"), CsvCache)
+        self.assertIsInstance(get_cache(self.temp_dir / "msms.parquet"), ParquetCache)
+        self.assertIsInstance(get_cache(self.temp_dir / "msms.pq"), ParquetCache)
+        self.assertIsInstance(get_cache(self.temp_dir / "msms.prosit", cache_format="parquet"), ParquetCache)
+        with self.assertRaises(ValueError):
+            get_cache(self.temp_dir / "msms.csv", cache_format="xlsx")
+
+    def test_generate_internal_cached(self):
+        """Check that cached results are reused with identical dtypes and regenerated if parameters change."""
+        for out_path in [self.temp_dir / "msms.parquet", self.temp_dir / "msms.csv"]:
+            df = self.search_results.generate_internal(tmt_label="tmt", out_path=out_path)
+            self.assertTrue(out_path.with_name(out_path.name + ".fingerprint").is_file())
+
+            with patch.object(Sage, "read_result") as read_result:
+                cached_df = self.search_results.generate_internal(tmt_label="tmt", out_path=out_path)
+                read_result.assert_not_called()
+            pd.testing.assert_frame_equal(cached_df, df.reset_index(drop=True))
+
+            with patch.object(Sage, "read_result", return_value=df) as read_result:
+                self.search_results.generate_internal(out_path=out_path)
+                read_result.assert_called_once()
+            self.assertEqual(list(df.columns), COLUMNS)
+
+    def test_result_cache_is_abstract(self):
+        """Check that caches need to implement reading and writing."""
+        with self.assertRaises(TypeError):
+            ResultCache(self.temp_dir / "msms.csv")
+
+    def test_fingerprint_folder(self):
+        """Check that modifying a file inside a search result folder changes the fingerprint."""
+        msms_path = self.temp_dir / "msms.txt"
+        msms_path.write_text("Raw file\tScan number\n")
+        search_results = MaxQuant(self.temp_dir)
+        self.assertEqual(search_results.source_files(), [msms_path])
+        key = fingerprint(search_results.source_files(), tmt_label="")
+
+        stat = self.temp_dir.stat()
+        msms_path.write_text("Raw file\tScan number\nraw\t1\n")
+        os.utime(self.temp_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertNotEqual(fingerprint(search_results.source_files(), tmt_label=""), key)
+
+    def test_generate_internal_missing_source(self):
+        """Check that cached results are used without validation if the search results file no longer exists."""
+        source = self.temp_dir / "sage_output.tsv"
+        shutil.copy(self.search_results.path, source)
+        out_path = self.temp_dir / "msms.csv"
+        df = Sage(source).generate_internal(out_path=out_path)
+        source.unlink()
+        with self.assertLogs("spectrum_io.search_result.search_results", level="WARNING"):
+            cached_df = Sage(source).generate_internal(out_path=out_path)
+        pd.testing.assert_frame_equal(cached_df, df.reset_index(drop=True))
+        with self.assertRaises(FileNotFoundError):
+            Sage(source).generate_internal(out_path=self.temp_dir / "other.csv")
+
+    def test_generate_internal_without_fingerprint(self):
+        """Check that results cached without a fingerprint are converted again, which is logged."""
+        out_path = self.temp_dir / "msms.csv"
+        self.search_results.generate_internal(out_path=out_path)
+        out_path.with_name(out_path.name + ".fingerprint").unlink()
+        with self.assertLogs("spectrum_io.search_result.cache", level="INFO") as logs:
+            self.search_results.generate_internal(out_path=out_path)
+        self.assertIn("no fingerprint", logs.output[0])
+        self.assertTrue(out_path.with_name(out_path.name + ".fingerprint").is_file())
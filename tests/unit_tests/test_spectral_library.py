@@ -1,11 +1,25 @@
+import gzip
+import json
+import os
+import pickle
 import sqlite3
+import subprocess
+import sys
+from contextlib import closing
 from pathlib import Path
+from queue import Queue
+from types import SimpleNamespace
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
 
-from spectrum_io.spectral_library import MSP, DLib, Spectronaut
+from spectrum_io.spectral_library import MSP, DLib, Parquet, ShardedLibrary, Spectronaut
+from spectrum_io.spectral_library.convert import convert_library, infer_library_format
+from spectrum_io.spectral_library.dlib import DLIB_INDICES, P2P_UNIQUE_INDEX
+from spectrum_io.spectral_library.sorting import ExternalMzSorter, precursor_mz
 
 
 class TestMSP:
@@ -42,6 +56,32 @@ class TestMSP:
 
         out_file.unlink()
 
+    @pytest.mark.parametrize("use_threads", [True, False])
+    def test_parallel_write(self, data, metadata, tmp_path, use_threads):
+        """Test that formatting batches in parallel writes the same library in batch order."""
+        batches = [
+            ({key: value[[i]] for key, value in data.items()}, metadata.iloc[[i]].reset_index(drop=True))
+            for i in range(len(metadata))
+        ] * 3
+        MSP(tmp_path / "serial.msp").write(
+            data={k: np.concatenate([v] * 3) for k, v in data.items()},
+            metadata=pd.concat([metadata] * 3, ignore_index=True),
+        )
+        MSP(tmp_path / "parallel.msp").parallel_write(batches, n_workers=2, max_pending=1, use_threads=use_threads)
+        assert (tmp_path / "parallel.msp").read_text() == (tmp_path / "serial.msp").read_text()
+
+    def test_write_gzip(self, data, metadata, tmp_path):
+        """Test that libraries with a .gz suffix are gzip compressed."""
+        MSP(tmp_path / "test.msp").write(data=data, metadata=metadata)
+        MSP(tmp_path / "test.msp.gz").write(data=data, metadata=metadata)
+        with gzip.open(tmp_path / "test.msp.gz", "rt") as f:
+            assert f.read() == (tmp_path / "test.msp").read_text()
+
+    def test_parallel_write_dlib(self, data, metadata, tmp_path):
+        """Test that parallel writing is rejected for DLib."""
+        with pytest.raises(TypeError):
+            DLib(tmp_path / "test.dlib").parallel_write([(data, metadata)])
+
 
 class TestSpectronaut:
     """Class to test msp."""
@@ -70,6 +110,20 @@ class TestSpectronaut:
 
         out_file.unlink()
 
+    def test_write_percent_sign(self, data, metadata, tmp_path):
+        """Test that percent signs in the precursor columns are written literally."""
+        metadata["PROTEINS"] = ["Protein%sA", "ProteinB"]
+        Spectronaut(tmp_path / "test.csv").write(data=data, metadata=metadata)
+        df = pd.read_csv(tmp_path / "test.csv")
+        assert df["ProteinIds"].tolist() == ["Protein%sA"] * 2 + ["ProteinB"] * 3
+
+    def test_write_malformed_annotation(self, data, metadata, tmp_path):
+        """Test that malformed annotations are rejected."""
+        data["annotation"] = np.where(data["annotation"] == b"y2+2", b"x2+2", data["annotation"])
+        spectronaut_lib = Spectronaut(tmp_path / "test.csv")
+        with pytest.raises(ValueError, match="x2\\+2"):
+            spectronaut_lib.write(data=data, metadata=metadata)
+
 
 class TestDLib:
     """Class to test DLib."""
@@ -127,6 +181,493 @@ class TestDLib:
 
         out_file.unlink()
 
+    def test_write_deduplicated_p2p(self, data, metadata):
+        """Test that each peptide to protein mapping is written once across batches."""
+        out_file = Path(__file__).parent / "test_p2p.dlib"
+        metadata["SEQUENCE"] = ["AAACCCCKR", "AAACCCCKR"]
+        metadata["PROTEINS"] = ["ProteinA;ProteinB", "ProteinB"]
+        dlib = DLib(out_file)
+        dlib.write(data=data, metadata=metadata)
+        dlib.mode = "a"
+        dlib.write(data=data, metadata=metadata)
+        con = sqlite3.connect(out_file)
+        df_entries = pd.read_sql_query("SELECT * from entries", con)
+        df_p2p = pd.read_sql_query("SELECT PeptideSeq, ProteinAccession from peptidetoprotein", con)
+        con.close()
+
+        assert len(df_entries) == 4
+        pd.testing.assert_frame_equal(
+            df_p2p,
+            pd.DataFrame({"PeptideSeq": ["AAACCCCKR", "AAACCCCKR"], "ProteinAccession": ["ProteinA", "ProteinB"]}),
+        )
+
+        out_file.unlink()
+
+    def test_write_missing_proteins(self, data, metadata, tmp_path):
+        """Test that precursors without protein ids are written without peptide to protein mappings."""
+        out_file = tmp_path / "test.dlib"
+        metadata["PROTEINS"] = [np.nan, "ProteinB"]
+        DLib(out_file).write(data=data, metadata=metadata)
+        with sqlite3.connect(out_file) as con:
+            assert con.execute("SELECT COUNT(*) FROM entries").fetchone() == (2,)
+            assert con.execute("SELECT PeptideSeq, ProteinAccession FROM peptidetoprotein").fetchall() == [
+                ("AAACILKKR", "ProteinB")
+            ]
+
+    def test_append_deduplicates_existing_p2p(self, data, metadata, tmp_path):
+        """Test that appending to a library with repeated mappings removes them before inserting new ones."""
+        out_file = tmp_path / "test.dlib"
+        DLib(out_file).write(data=data, metadata=metadata)
+        with sqlite3.connect(out_file) as con:
+            con.execute("DROP INDEX PeptideSeq_ProteinAccession_PeptideToProtein_index")
+            con.execute("INSERT INTO peptidetoprotein (PeptideSeq, ProteinAccession) VALUES ('AAACILKKR', 'ProteinB')")
+        DLib(out_file, mode="a").write(data=data, metadata=metadata)
+        with sqlite3.connect(out_file) as con:
+            assert con.execute("SELECT COUNT(*) FROM entries").fetchone() == (4,)
+            assert con.execute("SELECT COUNT(*) FROM peptidetoprotein").fetchone() == (2,)
+
+    def test_append_keeps_journal_and_indices(self, data, metadata, tmp_path):
+        """Test that bulk load pragmas are limited to new libraries and indices are only dropped by async_write."""
+        out_file = tmp_path / "test.dlib"
+        dlib = DLib(out_file)
+        with dlib._get_handle() as con:
+            assert con.execute("PRAGMA journal_mode").fetchone() == ("off",)
+        out_file.unlink()
+
+        def index_names():
+            with closing(sqlite3.connect(out_file)) as con:
+                return {name for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+        all_indices = set(DLIB_INDICES) | {P2P_UNIQUE_INDEX}
+        dlib.write(data=data, metadata=metadata)
+        assert index_names() == all_indices
+        dlib.mode = "a"
+        with dlib._get_handle() as con:
+            assert con.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+            assert con.execute("PRAGMA synchronous").fetchone() != (0,)
+            dlib._initialize(con)
+            assert index_names() == all_indices
+
+        n_indices_while_inserting = []
+
+        def _write(out, **kwargs):
+            n_indices_while_inserting.append(len(index_names()))
+            DLib._write(dlib, out, **kwargs)
+
+        dlib._write = _write
+        queue = Queue()
+        for _ in range(2):
+            queue.put((data, metadata))
+        queue.put(None)
+        dlib.async_write(queue, SimpleNamespace(value=0))
+        assert n_indices_while_inserting == [1, 1]
+        assert index_names() == all_indices
+        with closing(sqlite3.connect(out_file)) as con:
+            assert con.execute("SELECT COUNT(*) FROM entries").fetchone() == (6,)
+
+
+class TestParquet:
+    """Class to test Parquet."""
+
+    @pytest.mark.parametrize("file_name", ["test.parquet", "test.arrow"])
+    def test_write(self, data, metadata, tmp_path, file_name):
+        """Test write to parquet and arrow library files."""
+        out_file = tmp_path / file_name
+        Parquet(out_file).write(data=data, metadata=metadata)
+        if out_file.suffix == ".parquet":
+            table = pq.read_table(out_file)
+        else:
+            table = pa.ipc.open_file(out_file).read_all()
+
+        df = table.to_pandas()
+        assert (
+            df["ModifiedPeptide"].tolist()
+            == ["AAAC[Carbamidomethyl (C)]CC[Carbamidomethyl (C)]CKR"] * 2 + ["AAACILKKR"] * 3
+        )
+        assert df["PrecursorCharge"].tolist() == [1, 1, 2, 2, 2]
+        np.testing.assert_allclose(df["PrecursorMz"], [124.407276467] * 2 + [1617.057276467] * 3)
+        np.testing.assert_allclose(df["FragmentMz"], [0.8, 0.3, 0.5, 0.4, 0.3])
+        np.testing.assert_allclose(df["RelativeFragmentIntensity"], [0.2, 0.8, 0.5, 0.6, 0.001], rtol=1e-6)
+        assert df["FragmentNumber"].tolist() == [1, 2, 1, 2, 2]
+        assert df["FragmentType"].tolist() == ["b", "b", "b", "y", "b"]
+        assert df["FragmentCharge"].tolist() == [1, 2, 1, 2, 2]
+        assert df["FragmentLossType"].tolist() == ["noloss"] * 5
+
+    def test_async_write(self, data, metadata, tmp_path):
+        """Test that each batch written from a queue is stored as one row group."""
+        out_file = tmp_path / "test.parquet"
+        queue = Queue()
+        queue.put((data, metadata))
+        queue.put((data, metadata))
+        queue.put(None)
+        progress = SimpleNamespace(value=0)
+        Parquet(out_file).async_write(queue, progress)
+        assert progress.value == 2
+        assert pq.ParquetFile(out_file).num_row_groups == 2
+        assert pq.read_metadata(out_file).num_rows == 10
+
+
+class TestShardedLibrary:
+    """Class to test ShardedLibrary."""
+
+    def test_write_by_mz(self, data, metadata, tmp_path):
+        """Test that precursors are written to the shard of their m/z range and described in the manifest."""
+        sharded = ShardedLibrary(MSP, tmp_path / "library.msp", n_shards=2, boundaries=[1000.0])
+        sharded.write([(data, metadata)])
+
+        assert (tmp_path / "library.000.msp").read_text().startswith("Name: AAACCCCKR/1\n")
+        assert (tmp_path / "library.001.msp").read_text().startswith("Name: AAACILKKR/2\n")
+        manifest = json.loads((tmp_path / "library.manifest.json").read_text())
+        assert manifest["format"] == "MSP"
+        assert [shard["path"] for shard in manifest["shards"]] == ["library.000.msp", "library.001.msp"]
+        assert [shard["n_precursors"] for shard in manifest["shards"]] == [1, 1]
+        assert manifest["shards"][0]["mz_upper"] == manifest["shards"][1]["mz_lower"] == 1000.0
+        assert manifest["shards"][1]["min_precursor_mz"] == pytest.approx(1617.057276467)
+
+    def test_write_by_hash(self, data, metadata, tmp_path):
+        """Test that sharding by hash writes every precursor exactly once."""
+        sharded = ShardedLibrary(Spectronaut, tmp_path / "library.csv", n_shards=3, shard_by="hash")
+        sharded.write([(data, metadata), (data, metadata)])
+
+        manifest = json.loads((tmp_path / "library.manifest.json").read_text())
+        assert sum(shard["n_precursors"] for shard in manifest["shards"]) == 4
+        n_rows = sum(len(pd.read_csv(tmp_path / shard["path"])) for shard in manifest["shards"])
+        assert n_rows == 10
+
+    def test_invalid_boundaries(self, tmp_path):
+        """Test that boundaries not matching the number of shards are rejected."""
+        with pytest.raises(ValueError):
+            ShardedLibrary(MSP, tmp_path / "library.msp", n_shards=3, boundaries=[1000.0])
+
+
+class TestSelectFragments:
+    """Class to test the batch level fragment selection."""
+
+    def test_select_fragments(self, data, tmp_path):
+        """Test that filtered fragments are returned as flat arrays with offsets."""
+        fragments = MSP(tmp_path / "test.msp")._select_fragments(data)
+        np.testing.assert_array_equal(fragments.offsets, [0, 2, 5])
+        np.testing.assert_array_equal(fragments.n_peaks, [2, 3])
+        np.testing.assert_array_equal(fragments.mz, [0.8, 0.3, 0.5, 0.4, 0.3])
+        np.testing.assert_array_equal(fragments.annotation, [b"b1+1", b"b2+2", b"b1+1", b"y2+2", b"b2+2"])
+
+    def test_select_top_n_normalized(self, data, tmp_path):
+        """Test that only the top n fragments are kept in their original order and normalized to the base peak."""
+        fragments = MSP(tmp_path / "test.msp", top_n=2, normalize_intensities=True)._select_fragments(data)
+        np.testing.assert_array_equal(fragments.offsets, [0, 2, 4])
+        np.testing.assert_array_equal(fragments.mz, [0.8, 0.3, 0.5, 0.4])
+        np.testing.assert_allclose(fragments.intensities, [0.25, 1.0, 0.5 / 0.6, 1.0])
+
+    def test_write_top_n(self, data, metadata, tmp_path):
+        """Test that writers only write the top n fragments."""
+        Spectronaut(tmp_path / "test.csv", top_n=1).write(data=data, metadata=metadata)
+        df = pd.read_csv(tmp_path / "test.csv")
+        assert df["FragmentMz"].tolist() == [0.3, 0.4]
+
+
+class TestConvertMods:
+    """Class to test the cached conversion of modified sequences."""
+
+    def test_convert_mods(self, tmp_path):
+        """Test that each unique sequence is converted once and least recently used sequences are evicted."""
+        lib = Spectronaut(tmp_path / "test.csv")
+        lib.mod_cache_size = 2
+        calls = []
+
+        def convert(seqs, mods):
+            calls.append(seqs.tolist())
+            return seqs.str.lower()
+
+        assert lib._convert_mods(pd.Series(["A", "B", "A"]), {}, convert) == ["a", "b", "a"]
+        assert lib._convert_mods(pd.Series(["B", "C"]), {}, convert) == ["b", "c"]
+        assert lib._convert_mods(pd.Series(["A", "C"]), {}, convert) == ["a", "c"]
+        assert lib._convert_mods(pd.Series(["C"]), {"x": "y"}, convert) == ["c"]
+        assert calls == [["A", "B"], ["C"], ["A"], ["C"]]
+
+
+class TestResume:
+    """Class to test resuming an interrupted library generation."""
+
+    @staticmethod
+    def _async_write(library, batches):
+        queue = Queue()
+        for batch in batches:
+            queue.put(batch)
+        queue.put(None)
+        library.async_write(queue, SimpleNamespace(value=0))
+
+    @pytest.mark.parametrize("library_cls,file_name", [(Spectronaut, "test.csv"), (DLib, "test.dlib")])
+    def test_resume(self, data, metadata, tmp_path, library_cls, file_name):
+        """Test that a resumed run skips committed batches and discards the partially written batch."""
+        out_file = tmp_path / file_name
+        broken_batch = (data, metadata.drop(columns="MASS"))
+        with pytest.raises(KeyError):
+            self._async_write(library_cls(out_file, resume=True), [(data, metadata)] * 2 + [broken_batch])
+        assert json.loads((tmp_path / f"{file_name}.checkpoint").read_text())["batches"] == 2
+        if library_cls is Spectronaut:
+            with open(out_file, "a") as f:
+                f.write("partially written batch")
+
+        self._async_write(library_cls(out_file, resume=True), [(data, metadata)] * 3)
+        self._async_write(library_cls(tmp_path / f"expected_{file_name}"), [(data, metadata)] * 3)
+        assert not (tmp_path / f"{file_name}.checkpoint").exists()
+        if library_cls is Spectronaut:
+            assert out_file.read_text() == (tmp_path / f"expected_{file_name}").read_text()
+        else:
+            with sqlite3.connect(out_file) as con:
+                assert con.execute("SELECT COUNT(*) FROM entries").fetchone() == (6,)
+                assert con.execute("SELECT COUNT(*) FROM peptidetoprotein").fetchone() == (2,)
+
+    def test_resume_dlib_killed(self, data, metadata, tmp_path):
+        """Test resuming a DLib library after the writing process was killed while inserting a batch."""
+        out_file = tmp_path / "test.dlib"
+        with open(tmp_path / "batch.pkl", "wb") as f:
+            pickle.dump((data, metadata), f)
+        # chunksize=1 inserts every row separately; the process exits right after the first row of the third batch
+        code = (
+            "import os, pickle, sys\n"
+            "from queue import Queue\n"
+            "from types import SimpleNamespace\n"
+            "from spectrum_io.spectral_library import dlib\n"
+            "batch = pickle.load(open(sys.argv[2], 'rb'))\n"
+            "batched, chunks = dlib._batched, []\n"
+            "def killing_batched(rows, batch_size):\n"
+            "    for chunk in batched(rows, batch_size):\n"
+            "        chunks.append(chunk)\n"
+            "        if len(chunks) == 10:\n"
+            "            os._exit(1)\n"
+            "        yield chunk\n"
+            "dlib._batched = killing_batched\n"
+            "queue = Queue()\n"
+            "for _ in range(3):\n"
+            "    queue.put(batch)\n"
+            "queue.put(None)\n"
+            "dlib.DLib(sys.argv[1], chunksize=1, resume=True).async_write(queue, SimpleNamespace(value=0))\n"
+        )
+        result = subprocess.run([sys.executable, "-c", code, str(out_file), str(tmp_path / "batch.pkl")])
+        assert result.returncode == 1
+        # the rollback journal of the interrupted transaction is left behind and undone on the next connection
+        assert (tmp_path / "test.dlib-journal").is_file()
+
+        library = DLib(out_file, resume=True)
+        assert library.committed_batches() == 2
+        # the producer only puts the batch that was not committed before
+        queue = Queue()
+        queue.put((data, metadata))
+        queue.put(None)
+        library.async_write(queue, SimpleNamespace(value=0), skip_committed=False)
+        assert not (tmp_path / "test.dlib.checkpoint").exists()
+        with sqlite3.connect(out_file) as con:
+            assert con.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+            assert con.execute("SELECT COUNT(*) FROM entries").fetchone() == (6,)
+            assert con.execute("SELECT COUNT(*) FROM peptidetoprotein").fetchone() == (2,)
+
+    def test_resume_unsupported(self, data, metadata, tmp_path):
+        """Test that resuming is rejected for outputs that cannot be restored."""
+        with pytest.raises(ValueError):
+            self._async_write(MSP(tmp_path / "test.msp.gz", resume=True), [(data, metadata)])
+
+
+class TestSorting:
+    """Class to test sorting libraries by precursor m/z."""
+
+    def test_external_sort(self, tmp_path):
+        """Test that batches spilled to several runs are merged in precursor m/z order."""
+        rng = np.random.default_rng(0)
+        batches = []
+        for _ in range(7):
+            n = int(rng.integers(1, 30))
+            metadata = pd.DataFrame({"MASS": rng.uniform(500, 3000, n), "PRECURSOR_CHARGE": rng.integers(1, 4, n)})
+            batches.append(({"irt": rng.uniform(0, 100, (n, 1))}, metadata))
+
+        with ExternalMzSorter(run_size=20, chunk_size=8, tmp_dir=tmp_path) as sorter:
+            for data, metadata in batches:
+                sorter.add(data, metadata)
+            assert len(list(tmp_path.glob("*/run_*.pkl"))) > 1
+            sorted_batches = list(sorter.sorted_batches())
+
+        mzs = np.concatenate([precursor_mz(metadata) for _, metadata in sorted_batches])
+        irts = np.concatenate([data["irt"] for data, _ in sorted_batches])
+        expected_mzs = np.concatenate([precursor_mz(metadata) for _, metadata in batches])
+        expected_irts = np.concatenate([data["irt"] for data, _ in batches])
+        order = np.argsort(expected_mzs, kind="stable")
+        np.testing.assert_array_equal(mzs, expected_mzs[order])
+        np.testing.assert_array_equal(irts, expected_irts[order])
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.parametrize("run_size", [1, 100])
+    def test_sort_mixed_widths(self, tmp_path, run_size):
+        """Test that batches with different numbers of fragments are padded to the widest batch."""
+
+        def batch(mass, n_fragments):
+            data = {
+                "mz": np.arange(1, n_fragments + 1, dtype=float)[None],
+                "intensities": np.full((1, n_fragments), 0.5),
+                "annotation": np.array([[b"y1+1"] * n_fragments]),
+                "irt": np.array([[mass]]),
+            }
+            return data, pd.DataFrame({"MASS": [mass], "PRECURSOR_CHARGE": [1]})
+
+        with ExternalMzSorter(run_size=run_size, tmp_dir=tmp_path) as sorter:
+            sorter.add(*batch(900.0, 3))
+            sorter.add(*batch(500.0, 5))
+            sorted_batches = list(sorter.sorted_batches())
+
+        assert [mass for _, metadata in sorted_batches for mass in metadata["MASS"]] == [500.0, 900.0]
+        if run_size == 1:
+            # merging the runs yields a batch per merge step, each padded to the widest of its precursors
+            assert [data["mz"].shape[1] for data, _ in sorted_batches] == [5, 3]
+        else:
+            ((data, _),) = sorted_batches
+            np.testing.assert_array_equal(data["mz"], [[1, 2, 3, 4, 5], [1, 2, 3, -1, -1]])
+            np.testing.assert_array_equal(data["intensities"], [[0.5] * 5, [0.5, 0.5, 0.5, -1, -1]])
+            np.testing.assert_array_equal(data["annotation"], [[b"y1+1"] * 5, [b"y1+1"] * 3 + [b""] * 2])
+            np.testing.assert_array_equal(data["irt"], [[500.0], [900.0]])
+
+    @pytest.mark.parametrize("library_cls,file_name", [(MSP, "test.msp"), (Spectronaut, "test.csv")])
+    def test_async_write_sorted(self, data, metadata, tmp_path, library_cls, file_name):
+        """Test that batches from a queue are written in precursor m/z order."""
+        reversed_data = {key: value[::-1] for key, value in data.items()}
+        reversed_metadata = metadata.iloc[::-1].reset_index(drop=True)
+        queue = Queue()
+        queue.put((reversed_data, reversed_metadata))
+        queue.put(None)
+        progress = SimpleNamespace(value=0)
+        library_cls(tmp_path / file_name, sort_by_mz=True, sort_run_size=1).async_write(queue, progress)
+        library_cls(tmp_path / f"expected_{file_name}").write(data=data, metadata=metadata)
+        assert progress.value == 1
+        assert (tmp_path / file_name).read_text() == (tmp_path / f"expected_{file_name}").read_text()
+
+
+class TestReading:
+    """Class to test reading libraries and looking up entries."""
+
+    @pytest.mark.parametrize(
+        "library_cls,file_name", [(MSP, "test.msp"), (MSP, "test.msp.gz"), (Spectronaut, "test.csv")]
+    )
+    def test_read(self, data, metadata, tmp_path, library_cls, file_name):
+        """Test that written text libraries are read back in batches."""
+        library_cls(tmp_path / file_name).write(data=data, metadata=metadata)
+        batches = list(library_cls(tmp_path / file_name).read(batch_size=1))
+        assert len(batches) == 2
+
+        read_data = [batch_data for batch_data, _ in batches]
+        read_metadata = pd.concat([batch_metadata for _, batch_metadata in batches], ignore_index=True)
+        for column in ["SEQUENCE", "MODIFIED_SEQUENCE", "PRECURSOR_CHARGE", "COLLISION_ENERGY", "PROTEINS"]:
+            assert read_metadata[column].tolist() == metadata[column].tolist()
+        np.testing.assert_allclose(read_metadata["MASS"], metadata["MASS"], rtol=1e-8)
+        np.testing.assert_array_equal(read_data[0]["mz"], [[0.8, 0.3]])
+        np.testing.assert_array_equal(read_data[0]["intensities"], [[0.2, 0.8]])
+        np.testing.assert_array_equal(read_data[0]["annotation"], [[b"b1+1", b"b2+2"]])
+        np.testing.assert_array_equal(read_data[1]["mz"], [[0.5, 0.4, 0.3]])
+        np.testing.assert_array_equal(read_data[1]["intensities"], [[0.5, 0.6, 0.001]])
+        np.testing.assert_array_equal(read_data[1]["annotation"], [[b"b1+1", b"y2+2", b"b2+2"]])
+        np.testing.assert_array_equal(read_data[1]["irt"], [[382.12]])
+
+    def test_read_spectronaut_collision_energies(self, data, metadata, tmp_path):
+        """Test that consecutive precursors differing only in their collision energy are read as separate entries."""
+        data = {key: np.repeat(value[:1], 2, axis=0) for key, value in data.items()}
+        metadata = metadata.iloc[[0, 0]].reset_index(drop=True)
+        metadata["COLLISION_ENERGY"] = [25.0, 30.0]
+        Spectronaut(tmp_path / "test.csv").write(data=data, metadata=metadata)
+        ((read_data, read_metadata),) = list(Spectronaut(tmp_path / "test.csv").read())
+        assert read_metadata["COLLISION_ENERGY"].tolist() == [25.0, 30.0]
+        assert read_metadata["PRECURSOR_CHARGE"].tolist() == [1, 1]
+        np.testing.assert_array_equal(read_data["mz"], [[0.8, 0.3], [0.8, 0.3]])
+
+    def test_read_dlib(self, data, metadata, tmp_path):
+        """Test that fragments of written dlib libraries are read back sorted by m/z and without annotations."""
+        DLib(tmp_path / "test.dlib").write(data=data, metadata=metadata)
+        ((read_data, read_metadata),) = list(DLib(tmp_path / "test.dlib").read())
+        assert read_metadata["MODIFIED_SEQUENCE"].tolist() == metadata["MODIFIED_SEQUENCE"].tolist()
+        assert read_metadata["PROTEINS"].tolist() == metadata["PROTEINS"].tolist()
+        assert read_metadata["COLLISION_ENERGY"].isna().all()
+        np.testing.assert_array_equal(read_data["mz"], [[0.3, 0.8, -1], [0.3, 0.4, 0.5]])
+        np.testing.assert_allclose(read_data["intensities"], [[0.8, 0.2, 0], [0.001, 0.6, 0.5]], rtol=1e-6)
+        assert (read_data["annotation"] == b"").all()
+
+    @pytest.mark.parametrize(
+        "library_cls,file_name", [(MSP, "test.msp"), (Spectronaut, "test.csv"), (DLib, "test.dlib")]
+    )
+    def test_lookup(self, data, metadata, tmp_path, library_cls, file_name):
+        """Test looking up entries by precursor m/z and modified sequence."""
+        library = library_cls(tmp_path / file_name)
+        library.write(data=data, metadata=metadata)
+
+        _, by_mz = library.lookup_mz(1000, 2000)
+        assert by_mz["MODIFIED_SEQUENCE"].tolist() == ["AAACILKKR"]
+        _, by_mz = library.lookup_mz(0, 2000)
+        assert by_mz["MODIFIED_SEQUENCE"].tolist() == ["AAAC[UNIMOD:4]CC[UNIMOD:4]CKR", "AAACILKKR"]
+        assert len(library.lookup_mz(2000, 3000)[1]) == 0
+
+        by_seq_data, by_seq = library.lookup_sequence("AAAC[UNIMOD:4]CC[UNIMOD:4]CKR")
+        assert by_seq["PRECURSOR_CHARGE"].tolist() == [1]
+        np.testing.assert_array_equal(np.sort(by_seq_data["mz"], axis=1), [[0.3, 0.8]])
+        assert len(library.lookup_sequence("AAAC[UNIMOD:4]CC[UNIMOD:4]CKR", charge=2)[1]) == 0
+
+    def test_index_rebuilt_after_write(self, data, metadata, tmp_path):
+        """Test that the index is rebuilt once the library changed."""
+        library = MSP(tmp_path / "test.msp")
+        library.write(data={key: value[:1] for key, value in data.items()}, metadata=metadata.iloc[:1])
+        assert len(library.lookup_mz(0, 2000)[1]) == 1
+        assert library.index_path.is_file()
+        os.utime(library.index_path, ns=(0, 0))
+        MSP(tmp_path / "test.msp", mode="a").write(
+            data={key: value[1:] for key, value in data.items()}, metadata=metadata.iloc[1:].reset_index(drop=True)
+        )
+        assert len(library.lookup_mz(0, 2000)[1]) == 2
+
+    def test_index_compressed(self, data, metadata, tmp_path):
+        """Test that compressed libraries cannot be indexed."""
+        library = MSP(tmp_path / "test.msp.gz")
+        library.write(data=data, metadata=metadata)
+        with pytest.raises(ValueError):
+            library.build_index()
+
+
+class TestConvert:
+    """Class to test converting libraries between formats."""
+
+    @pytest.mark.parametrize(
+        "src_cls,src_name,dst_cls,dst_name",
+        [
+            (MSP, "test.msp", Spectronaut, "test.csv"),
+            (Spectronaut, "test.csv", MSP, "test.msp.gz"),
+            (MSP, "test.msp", DLib, "test.dlib"),
+        ],
+    )
+    def test_convert_library(self, data, metadata, tmp_path, src_cls, src_name, dst_cls, dst_name):
+        """Test that a converted library equals the library written directly in the destination format."""
+        src_cls(tmp_path / src_name).write(data=data, metadata=metadata)
+        n_precursors = convert_library(tmp_path / src_name, tmp_path / dst_name, batch_size=1, n_workers=2)
+        assert n_precursors == 2
+
+        dst_cls(tmp_path / f"expected_{dst_name}").write(data=data, metadata=metadata)
+        for (converted_data, converted), (expected_data, expected) in zip(
+            dst_cls(tmp_path / dst_name).read(), dst_cls(tmp_path / f"expected_{dst_name}").read()
+        ):
+            pd.testing.assert_frame_equal(converted, expected, check_exact=False, rtol=1e-8)
+            np.testing.assert_allclose(converted_data["mz"], expected_data["mz"])
+            np.testing.assert_allclose(converted_data["intensities"], expected_data["intensities"])
+            np.testing.assert_array_equal(converted_data["annotation"], expected_data["annotation"])
+
+    @pytest.mark.parametrize("dst_name", ["test.csv", "test.parquet"])
+    def test_convert_library_without_annotations(self, data, metadata, tmp_path, dst_name):
+        """Test that DLib libraries cannot be converted to formats that need fragment annotations."""
+        DLib(tmp_path / "test.dlib").write(data=data, metadata=metadata)
+        with pytest.raises(ValueError, match="fragment annotations"):
+            convert_library(tmp_path / "test.dlib", tmp_path / dst_name)
+        assert not (tmp_path / dst_name).exists()
+        assert convert_library(tmp_path / "test.dlib", tmp_path / "test.msp") == 2
+
+    def test_infer_library_format(self):
+        """Test deriving library formats from file suffixes."""
+        assert infer_library_format("lib.msp.gz") == "msp"
+        assert infer_library_format("lib.CSV") == "spectronaut"
+        assert infer_library_format("lib.arrow") == "parquet"
+        with pytest.raises(ValueError):
+            infer_library_format("lib.txt")
+
 
 @pytest.fixture
 def data():